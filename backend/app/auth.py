@@ -2,21 +2,44 @@
 Firebase Auth integration for FastAPI.
 
 We keep Firebase only for authentication (ID tokens), not for Firestore.
+
+Verified tokens are cached (keyed by SHA-256 of the token, until its `exp`),
+so the hot path of an authenticated request is a dict lookup. Misses are
+verified in the thread pool, never on the event loop, and Google's signing
+certificates are refreshed in the background.
+
+firebase_admin (and the google-auth/requests stack behind it) is imported on
+first use; the app lifespan initializes it during warmup.
 """
+import asyncio
+import hashlib
 import json
+import logging
 import os
-from typing import Optional, Dict, Any
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
 
-from fastapi import HTTPException, Header, status
-
-import firebase_admin
-from firebase_admin import credentials, auth
+from fastapi import HTTPException, Header, Request, status
+from starlette.concurrency import run_in_threadpool
 
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
+TOKEN_CACHE_MAX_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+# Refresh well before Google's max-age (several hours) so no request pays the fetch
+CERT_REFRESH_INTERVAL = int(os.getenv("AUTH_CERT_REFRESH_INTERVAL", "1800"))
+
+# sha256(token) -> (claims, exp)
+_token_cache: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+
 
 def _initialize_firebase_app() -> None:
     """Initialize firebase_admin App if not already initialized."""
+    import firebase_admin
+    from firebase_admin import credentials
+
     if firebase_admin._apps:
         return
 
@@ -42,7 +65,77 @@ def _initialize_firebase_app() -> None:
     firebase_admin.initialize_app(cred_obj)
 
 
+def verify_token(token: str) -> Dict[str, Any]:
+    """Verify a Firebase ID token and return its decoded claims (raises on failure)."""
+    from firebase_admin import auth
+
+    _initialize_firebase_app()
+    return auth.verify_id_token(token)
+
+
+def cached_claims(token: str) -> Optional[Dict[str, Any]]:
+    """Claims of an already verified, unexpired token; None = verifying it would cost a verification."""
+    key = hashlib.sha256(token.encode()).hexdigest()
+    entry = _token_cache.get(key)
+    if entry is None:
+        return None
+    claims, exp = entry
+    if exp <= time.time():
+        _token_cache.pop(key, None)
+        return None
+    _token_cache.move_to_end(key)
+    return claims
+
+
+async def verify_token_cached(token: str) -> Dict[str, Any]:
+    """
+    Verify a token through the verified-token cache.
+    Only successful verifications are cached, and only until the token expires.
+    """
+    claims = cached_claims(token)
+    if claims is not None:
+        return claims
+
+    key = hashlib.sha256(token.encode()).hexdigest()
+    # RSA verification (and a possible certificate fetch) is blocking
+    claims = await run_in_threadpool(verify_token, token)
+
+    exp = float(claims.get("exp") or 0)
+    if exp > time.time():
+        _token_cache[key] = (claims, exp)
+        while len(_token_cache) > TOKEN_CACHE_MAX_SIZE:
+            _token_cache.popitem(last=False)
+    return claims
+
+
+def prefetch_certificates() -> bool:
+    """
+    Fetch Google's ID-token signing certificates through firebase_admin's own
+    (HTTP-cached) certificate session, so verification never waits on it.
+    Relies on firebase_admin internals; returns False if they are unavailable.
+    """
+    try:
+        import firebase_admin
+        from firebase_admin import _token_gen, auth
+
+        _initialize_firebase_app()
+        verifier = auth._get_client(firebase_admin.get_app())._token_verifier
+        verifier.request(url=_token_gen.ID_TOKEN_CERT_URI, method="GET")
+        return True
+    except Exception as e:
+        logger.warning(f"Could not prefetch Firebase certificates: {e}")
+        return False
+
+
+async def refresh_certificates_forever() -> None:
+    """Background task: keep the signing certificates warm (first fetch happens in warmup)."""
+    while True:
+        await asyncio.sleep(CERT_REFRESH_INTERVAL)
+        await run_in_threadpool(prefetch_certificates)
+
+
 async def get_current_user(
+    request: Request,
     authorization: Optional[str] = Header(None),
 ) -> Dict[str, Any]:
     """
@@ -59,10 +152,18 @@ async def get_current_user(
 
     token = authorization.split(" ", 1)[1].strip()
 
+    # RateLimitMiddleware already verified this token (claims None = verification failed)
+    if getattr(request.state, "firebase_token", None) == token:
+        claims = getattr(request.state, "firebase_claims", None)
+        if claims is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired authentication token",
+            )
+        return claims
+
     try:
-        _initialize_firebase_app()
-        decoded = auth.verify_id_token(token)
-        return decoded
+        return await verify_token_cached(token)
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,147 @@
+"""
+Shared async HTTP client for Gemini (and other outbound) calls.
+
+One connection-pooled httpx.AsyncClient per worker process, opened in the app
+lifespan and closed on shutdown, so calls reuse keep-alive TLS connections
+and never block the event loop. Every call passes its own timeout.
+
+Keys are leased from the key pool (app/utils/gemini_key_pool.py); a 429/5xx
+cools that key down and the call is retried once per other healthy key (up to
+GEMINI_MAX_KEY_ATTEMPTS). The key goes in the `x-goog-api-key` header, not in
+the URL, so it cannot leak through exception messages or logs.
+"""
+import os
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from app.config import settings
+from app.utils.gemini_key_pool import NoGeminiKeyAvailable, gemini_key_pool
+from app.utils.request_context import track_gemini
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+DEFAULT_MODEL = "gemini-2.5-flash-lite"
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+GEMINI_MAX_KEY_ATTEMPTS = int(os.getenv("GEMINI_MAX_KEY_ATTEMPTS", "3"))
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        # Default only; call sites pass their own timeout
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        follow_redirects=True,
+    )
+
+
+async def start_http_client() -> httpx.AsyncClient:
+    """Open the shared client (app lifespan startup)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def close_http_client() -> None:
+    """Close the shared client and its pooled connections (app lifespan shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The shared client; created on demand when running outside the app lifespan."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+def get_model_name() -> str:
+    return settings.GEMINI_MODEL or DEFAULT_MODEL
+
+
+def gemini_available() -> bool:
+    """True if at least one Gemini API key is configured."""
+    return gemini_key_pool.has_keys()
+
+
+def _retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+async def generate_content(
+    payload: Dict[str, Any],
+    *,
+    endpoint: str,
+    timeout: float,
+    model: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    POST models/{model}:generateContent with a pooled key and return the decoded JSON.
+    Raises httpx.HTTPStatusError on non-2xx, httpx.TimeoutException /
+    httpx.TransportError on network problems (all subclasses of httpx.HTTPError),
+    NoGeminiKeyAvailable when every key is cooling down or out of budget.
+    """
+    url = f"{GEMINI_BASE_URL}/models/{model or get_model_name()}:generateContent"
+    tried: Tuple[str, ...] = ()
+    last_error: Optional[httpx.HTTPStatusError] = None
+
+    for _ in range(max(1, GEMINI_MAX_KEY_ATTEMPTS)):
+        try:
+            api_key = gemini_key_pool.acquire(exclude=tried)
+        except NoGeminiKeyAvailable:
+            if last_error is not None:
+                raise last_error
+            raise
+        tried += (api_key,)
+
+        status_code: Optional[int] = None
+        tokens = 0
+        retry_after: Optional[float] = None
+        try:
+            with track_gemini(endpoint):
+                response = await get_http_client().post(
+                    url,
+                    json=payload,
+                    headers={"x-goog-api-key": api_key},
+                    timeout=timeout,
+                )
+                status_code = response.status_code
+                if status_code == 429 or status_code >= 500:
+                    retry_after = _retry_after_seconds(response)
+                response.raise_for_status()
+            data = response.json()
+            tokens = int((data.get("usageMetadata") or {}).get("totalTokenCount") or 0)
+            return data
+        except httpx.HTTPStatusError as e:
+            # Quota/overload on this key → thử key khác; lỗi 4xx khác thì trả luôn
+            if status_code == 429 or status_code >= 500:
+                last_error = e
+                continue
+            raise
+        finally:
+            gemini_key_pool.release(api_key, status_code=status_code, tokens=tokens, retry_after=retry_after)
+
+    raise last_error
@@ -0,0 +1,441 @@
+"""
+Durable background job queue (SQLite).
+
+Jobs survive restarts and are shared by every process on the host:
+- priority: higher runs first, then FIFO by run_at
+- claiming sets a visibility timeout (lease); a job whose worker died becomes
+  claimable again when the lease expires
+- failures are retried with exponential backoff (+ jitter) up to max_attempts,
+  then the job is dead-lettered (status "dead") for an admin to inspect/retry
+- dedupe_key: at most one queued/running job per key
+
+Handlers are async functions registered with @job_handler("kind"); they get the
+job payload and raise to signal failure. Queue methods are blocking SQLite
+calls: from async code, run them in a thread. Workers run in-process (app lifespan,
+JOB_WORKERS_IN_PROCESS=true) and/or as a separate `python -m app.worker`.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.metrics import (
+    JOB_QUEUE_DEPTH,
+    JOB_QUEUE_WAIT,
+    JOB_RUN_DURATION,
+    JOBS_PROCESSED_TOTAL,
+)
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "job_queue.db")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "120"))
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "10"))
+JOB_RETRY_MAX_DELAY = float(os.getenv("JOB_RETRY_MAX_DELAY", "600"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "8"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+_handlers: Dict[str, JobHandler] = {}
+# name -> (interval, blocking function) chạy định kỳ trong JobWorkerPool._maintain
+_maintenance_tasks: Dict[str, Tuple[float, Callable[[], Any]]] = {}
+
+
+def job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    """Register an async handler for jobs of `kind`."""
+    def decorator(func: JobHandler) -> JobHandler:
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def maintenance_task(name: str, interval: float, func: Callable[[], Any]) -> None:
+    """Register a blocking housekeeping function that worker pools run (in a thread) every `interval` seconds."""
+    _maintenance_tasks[name] = (interval, func)
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    payload: Dict[str, Any]
+    priority: int
+    attempts: int
+    max_attempts: int
+    created_at: float
+    lease_token: str
+
+
+class JobQueue:
+    """SQLite-backed queue; every state change runs in a BEGIN IMMEDIATE transaction."""
+
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        # Không đụng tới đĩa ở đây: file/schema được tạo ở lần kết nối đầu tiên
+        self.path = path
+        self._local = threading.local()
+        self._listeners: List[Callable[[], None]] = []
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _ensure_schema(self, conn: sqlite3.Connection) -> None:
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,            -- queued | running | done | dead
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    run_at REAL NOT NULL,            -- eligible from (backoff)
+                    locked_until REAL,               -- lease expiry while running
+                    lease_token TEXT,
+                    dedupe_key TEXT,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, priority DESC, run_at);
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key)
+                    WHERE dedupe_key IS NOT NULL AND status IN ('queued', 'running');
+                """
+            )
+            self._schema_ready = True
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._ensure_schema(conn)
+            self._local.conn = conn
+        return conn
+
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        """Called after every enqueue in this process (wakes local workers)."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[], None]) -> None:
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def enqueue(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        priority: int = 0,
+        delay: float = 0,
+        max_attempts: Optional[int] = None,
+        dedupe_key: Optional[str] = None,
+    ) -> int:
+        """Add a job; with dedupe_key, returns the id of the already active job instead."""
+        now = time.time()
+        conn = self._connect()
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO jobs (kind, payload, priority, status, max_attempts, run_at, dedupe_key, created_at) "
+            "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+            (kind, json.dumps(payload), priority, max_attempts or JOB_MAX_ATTEMPTS, now + delay, dedupe_key, now),
+        )
+        if cursor.rowcount:
+            job_id = cursor.lastrowid
+        else:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running')", (dedupe_key,)
+            ).fetchone()
+            job_id = row[0] if row else 0
+        for callback in list(self._listeners):
+            callback()
+        return job_id
+
+    def claim(self, kinds: Optional[List[str]] = None, visibility_timeout: float = JOB_VISIBILITY_TIMEOUT) -> Optional[Job]:
+        """Lease the next due job (queued, or running with an expired lease)."""
+        now = time.time()
+        conn = self._connect()
+        kind_filter = ""
+        params: Tuple[Any, ...] = (now, now)
+        if kinds:
+            kind_filter = f" AND kind IN ({','.join('?' * len(kinds))})"
+            params += tuple(kinds)
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                row = conn.execute(
+                    "SELECT id, kind, payload, priority, attempts, max_attempts, created_at FROM jobs "
+                    "WHERE ((status = 'queued' AND run_at <= ?) OR (status = 'running' AND locked_until <= ?))"
+                    f"{kind_filter} ORDER BY priority DESC, run_at, id LIMIT 1",
+                    params,
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                job_id, kind, payload, priority, attempts, max_attempts, created_at = row
+                if attempts >= max_attempts:
+                    # Lease expired on the last attempt (worker crashed / hung) → dead letter
+                    conn.execute(
+                        "UPDATE jobs SET status = 'dead', finished_at = ?, locked_until = NULL, "
+                        "last_error = COALESCE(last_error, 'visibility timeout expired') WHERE id = ?",
+                        (now, job_id),
+                    )
+                    JOBS_PROCESSED_TOTAL.labels(kind=kind, outcome="dead").inc()
+                    continue
+                lease_token = uuid.uuid4().hex
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_until = ?, "
+                    "lease_token = ?, started_at = ? WHERE id = ?",
+                    (now + visibility_timeout, lease_token, now, job_id),
+                )
+                conn.execute("COMMIT")
+                return Job(
+                    id=job_id,
+                    kind=kind,
+                    payload=json.loads(payload),
+                    priority=priority,
+                    attempts=attempts + 1,
+                    max_attempts=max_attempts,
+                    created_at=created_at,
+                    lease_token=lease_token,
+                )
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def complete(self, job: Job) -> bool:
+        """Mark done; False if the lease was lost (another worker re-claimed the job)."""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'done', finished_at = ?, locked_until = NULL, last_error = NULL "
+            "WHERE id = ? AND lease_token = ? AND status = 'running'",
+            (time.time(), job.id, job.lease_token),
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job: Job, error: str, retry_after: Optional[float] = None) -> str:
+        """
+        Schedule a retry with backoff (at least `retry_after` seconds), or
+        dead-letter; returns the new status.
+        """
+        now = time.time()
+        if job.attempts >= job.max_attempts:
+            status, run_at = "dead", now
+        else:
+            delay = min(JOB_RETRY_BASE_DELAY * 2 ** (job.attempts - 1), JOB_RETRY_MAX_DELAY)
+            delay = max(delay * random.uniform(0.8, 1.2), retry_after or 0)
+            status, run_at = "queued", now + delay
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = ?, run_at = ?, locked_until = NULL, last_error = ?, "
+            "finished_at = CASE WHEN ? = 'dead' THEN ? ELSE NULL END "
+            "WHERE id = ? AND lease_token = ? AND status = 'running'",
+            (status, run_at, error[:2000], status, now, job.id, job.lease_token),
+        )
+        return status if cursor.rowcount == 1 else "lost"
+
+    def retry_dead(self, job_id: int) -> bool:
+        """Put a dead-lettered job back in the queue with a fresh attempt budget."""
+        try:
+            cursor = self._connect().execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, run_at = ?, finished_at = NULL "
+                "WHERE id = ? AND status = 'dead'",
+                (time.time(), job_id),
+            )
+        except sqlite3.IntegrityError:
+            # Đã có job khác cùng dedupe_key đang chờ/chạy
+            return False
+        if cursor.rowcount:
+            for callback in list(self._listeners):
+                callback()
+        return cursor.rowcount == 1
+
+    def prune(self, older_than: float = JOB_RETENTION) -> int:
+        """Delete finished jobs older than `older_than` seconds (dead letters are kept)."""
+        cursor = self._connect().execute(
+            "DELETE FROM jobs WHERE status = 'done' AND finished_at < ?", (time.time() - older_than,)
+        )
+        return cursor.rowcount
+
+    def depth(self) -> Dict[Tuple[str, str], int]:
+        """(kind, status) -> count for unfinished and dead jobs."""
+        rows = self._connect().execute(
+            "SELECT kind, status, COUNT(*) FROM jobs WHERE status != 'done' GROUP BY kind, status"
+        ).fetchall()
+        return {(kind, status): count for kind, status, count in rows}
+
+    def stats(self, window: float = 3600, dead_limit: int = 20) -> Dict[str, Any]:
+        """Depth, queue latency and recent dead letters for the admin view."""
+        now = time.time()
+        conn = self._connect()
+        kinds: Dict[str, Dict[str, Any]] = {}
+        for (kind, status), count in self.depth().items():
+            kinds.setdefault(kind, {"queued": 0, "running": 0, "dead": 0})[status] = count
+
+        for kind, oldest in conn.execute(
+            "SELECT kind, MIN(run_at) FROM jobs WHERE status = 'queued' AND run_at <= ? GROUP BY kind", (now,)
+        ):
+            kinds.setdefault(kind, {"queued": 0, "running": 0, "dead": 0})["oldest_due_age"] = round(now - oldest, 1)
+
+        for kind, done, avg_wait, max_wait, avg_run in conn.execute(
+            "SELECT kind, COUNT(*), AVG(started_at - created_at), MAX(started_at - created_at), "
+            "AVG(finished_at - started_at) FROM jobs WHERE status = 'done' AND finished_at >= ? GROUP BY kind",
+            (now - window,),
+        ):
+            entry = kinds.setdefault(kind, {"queued": 0, "running": 0, "dead": 0})
+            entry["done_last_window"] = done
+            entry["avg_latency"] = round(avg_wait or 0, 3)
+            entry["max_latency"] = round(max_wait or 0, 3)
+            entry["avg_run_time"] = round(avg_run or 0, 3)
+
+        dead = [
+            {
+                "id": job_id,
+                "kind": kind,
+                "payload": json.loads(payload),
+                "attempts": attempts,
+                "last_error": last_error,
+                "created_at": created_at,
+                "finished_at": finished_at,
+            }
+            for job_id, kind, payload, attempts, last_error, created_at, finished_at in conn.execute(
+                "SELECT id, kind, payload, attempts, last_error, created_at, finished_at FROM jobs "
+                "WHERE status = 'dead' ORDER BY finished_at DESC LIMIT ?",
+                (dead_limit,),
+            )
+        ]
+        return {"window_seconds": window, "kinds": kinds, "dead_letters": dead}
+
+
+class JobWorkerPool:
+    """`concurrency` worker coroutines claiming and running jobs for the registered kinds."""
+
+    DEPTH_REFRESH_INTERVAL = 15.0
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        concurrency: int = JOB_WORKER_CONCURRENCY,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        visibility_timeout: float = JOB_VISIBILITY_TIMEOUT,
+    ):
+        self.queue = queue
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._maintenance_due: Dict[str, float] = {}
+
+    def _notify(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self.queue.add_listener(self._notify)
+        self._tasks = [asyncio.create_task(self._run(i)) for i in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._maintain()))
+        logger.info(f"Job workers started: concurrency={self.concurrency} kinds={sorted(_handlers)}")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Stop claiming; give running jobs `timeout` seconds, then cancel (their lease will expire)."""
+        self._stopping.set()
+        self._wakeup.set()
+        self.queue.remove_listener(self._notify)
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, worker_index: int) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = await run_in_threadpool(self.queue.claim, list(_handlers), self.visibility_timeout)
+            except Exception as e:
+                logger.warning(f"Job claim failed: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(job)
+
+    async def _execute(self, job: Job) -> None:
+        handler = _handlers[job.kind]
+        JOB_QUEUE_WAIT.labels(kind=job.kind).observe(max(0.0, time.time() - job.created_at))
+        started = time.perf_counter()
+        try:
+            # Finish well inside the lease so no other worker picks the job up meanwhile
+            await asyncio.wait_for(handler(job.payload), timeout=self.visibility_timeout * 0.9)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            # e.g. NoGeminiKeyAvailable.retry_after: no point retrying before a key frees up
+            retry_after = getattr(e, "retry_after", None)
+            status = await run_in_threadpool(self.queue.fail, job, error, retry_after)
+            outcome = "dead" if status == "dead" else "retry"
+            log = logger.error if outcome == "dead" else logger.warning
+            log(
+                f"Job {job.id} ({job.kind}) failed on attempt {job.attempts}/{job.max_attempts}: {type(e).__name__}",
+                extra={"fields": {"event": "job_failed", "job_id": job.id, "kind": job.kind, "outcome": outcome}},
+            )
+        else:
+            await run_in_threadpool(self.queue.complete, job)
+            outcome = "done"
+        finally:
+            JOB_RUN_DURATION.labels(kind=job.kind).observe(time.perf_counter() - started)
+        JOBS_PROCESSED_TOTAL.labels(kind=job.kind, outcome=outcome).inc()
+
+    async def _run_maintenance_tasks(self) -> None:
+        now = time.monotonic()
+        for name, (interval, func) in list(_maintenance_tasks.items()):
+            if now < self._maintenance_due.get(name, 0):
+                continue
+            self._maintenance_due[name] = now + interval
+            try:
+                await run_in_threadpool(func)
+            except Exception as e:
+                logger.warning(f"Maintenance task {name} failed: {e}")
+
+    async def _maintain(self) -> None:
+        """Refresh the depth gauges, prune old finished jobs, run due maintenance tasks."""
+        while not self._stopping.is_set():
+            try:
+                depth = await run_in_threadpool(self.queue.depth)
+                for kind in set(_handlers) | {k for k, _ in depth}:
+                    for status in ("queued", "running", "dead"):
+                        JOB_QUEUE_DEPTH.labels(kind=kind, status=status).set(depth.get((kind, status), 0))
+                await run_in_threadpool(self.queue.prune)
+            except Exception as e:
+                logger.warning(f"Job queue maintenance failed: {e}")
+            await self._run_maintenance_tasks()
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.DEPTH_REFRESH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+# Global queue (one SQLite file shared by all processes on this host);
+# the file is only opened on first use, never at import time
+job_queue = JobQueue()
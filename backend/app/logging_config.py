@@ -0,0 +1,100 @@
+"""
+Logging setup: non-blocking, structured.
+
+Every record is put on an in-memory queue by a QueueHandler; a QueueListener
+thread does the formatting I/O to stdout (journald on the VM), so request
+handlers never block on log writes.
+
+LOG_FORMAT=json emits one JSON object per line; extra fields passed as
+`extra={"fields": {...}}` are merged into it. Access logs of fast 2xx/3xx
+responses are sampled with LOG_SAMPLE_RATE_2XX (errors and slow requests are
+always kept).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_SAMPLE_RATE_2XX = float(os.getenv("LOG_SAMPLE_RATE_2XX", "1.0"))
+LOG_SLOW_REQUEST_MS = float(os.getenv("LOG_SLOW_REQUEST_MS", "1000"))
+
+# Logger used by LoggingMiddleware for the one-line-per-request access log
+ACCESS_LOGGER = "api.access"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            payload.update(fields)
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class AccessLogSampler(logging.Filter):
+    """Keep a fraction of fast successful access-log lines; always keep the rest."""
+
+    def __init__(self, sample_rate: float = LOG_SAMPLE_RATE_2XX, slow_ms: float = LOG_SLOW_REQUEST_MS):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.sample_rate >= 1.0:
+            return True
+        fields = getattr(record, "fields", None) or {}
+        status = fields.get("status", 500)
+        if status >= 400 or fields.get("duration_ms", 0) >= self.slow_ms:
+            return True
+        return random.random() < self.sample_rate
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Route all logging through a queue; idempotent."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    if LOG_FORMAT == "json":
+        formatter: logging.Formatter = JSONFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    logging.getLogger(ACCESS_LOGGER).addFilter(AccessLogSampler())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    # Flush whatever is still queued on shutdown
+    atexit.register(_listener.stop)
+    return _listener
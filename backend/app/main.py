@@ -3,18 +3,28 @@ FastAPI main application - Enhanced for future development
 """
 from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.concurrency import run_in_threadpool
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 from datetime import datetime
-import uvicorn
+from contextlib import asynccontextmanager, suppress
+import asyncio
 import logging
+import os
+import time
 
+from app.auth import prefetch_certificates, refresh_certificates_forever
 from app.config import settings
+from app.gemini import close_http_client, start_http_client
+from app.job_queue import JobWorkerPool, job_queue
+from app.logging_config import setup_logging
 from app.sql_database import db
-from app.routers import exams, posts, ai_chat, documents, ai_feed, ai_analysis, me, uploads, users, admin
+from app.utils.image_processing import shutdown_image_pool
+from app.utils.metrics import render_metrics
+from app.routers import exams, posts, ai_chat, documents, ai_feed, ai_analysis, me, uploads, users, admin, media
 
 # Try to import enhanced router
 try:
@@ -36,13 +46,59 @@ try:
 except ImportError:
     HAS_MIDDLEWARE = False
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+# Configure logging (queue-based, structured; see app/logging_config.py)
+setup_logging()
 logger = logging.getLogger("api")
 
+# Set STARTUP_WARMUP=false to skip warmup (e.g. short-lived tooling); the first requests then pay for it
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+# Chạy job worker ngay trong process API; đặt false khi chạy riêng `python -m app.worker`
+JOB_WORKERS_IN_PROCESS = os.getenv("JOB_WORKERS_IN_PROCESS", "true").lower() == "true"
+
+
+def _warmup() -> None:
+    """Blocking warmup: DB schema/connection, Firebase init + certificates, hot query cache."""
+    started = time.perf_counter()
+
+    db.init_schema()
+    if not db.health_check():
+        logger.warning("Warmup: database health check failed")
+
+    # Initializes the Firebase app and fetches the signing certificates
+    prefetch_certificates()
+
+    # Trang đầu của feed: cùng query (cùng cache key) với GET /api/posts/ mặc định
+    try:
+        db.query("posts", filters=[("status", "!=", "rejected")], order_by="createdAt", limit=50)
+    except Exception as e:
+        logger.warning(f"Warmup: could not warm the posts cache: {e}")
+
+    logger.info(f"Warmup finished in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up before accepting traffic; run background refreshers until shutdown."""
+    if STARTUP_WARMUP:
+        await run_in_threadpool(_warmup)
+    # Pooled keep-alive client shared by every Gemini call in this worker
+    await start_http_client()
+    cert_refresh_task = asyncio.create_task(refresh_certificates_forever())
+    job_workers = JobWorkerPool(job_queue) if JOB_WORKERS_IN_PROCESS else None
+    if job_workers:
+        await job_workers.start()
+    try:
+        yield
+    finally:
+        if job_workers:
+            await job_workers.stop()
+        cert_refresh_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await cert_refresh_task
+        await close_http_client()
+        shutdown_image_pool()
+
+
 app = FastAPI(
     title="DuThi THPT Backend API",
     description="Backend API for DuThi THPT Platform with SQL database and Firebase Auth. Enhanced for large-scale data management.",
@@ -58,11 +114,11 @@ app = FastAPI(
     license_info={
         "name": "MIT",
     },
+    lifespan=lifespan,
 )
 
 # CORS Middleware
 # Cho phép tất cả origins trong development
-import os
 is_dev = os.getenv("ENV", "development") == "development"
 
 # Nếu dev mode, cho phép tất cả origins (không dùng credentials)
@@ -117,6 +173,7 @@ app.include_router(me.router)
 app.include_router(uploads.router)
 app.include_router(users.router)
 app.include_router(admin.router)
+app.include_router(media.router)
 
 # Pydantic Models
 class DocumentCreate(BaseModel):
@@ -195,6 +252,16 @@ async def health_check():
         raise HTTPException(status_code=503, detail=f"Health check failed: {str(e)}")
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Prometheus scrape endpoint (set METRICS_TOKEN to require a bearer token)"""
+    metrics_token = os.getenv("METRICS_TOKEN")
+    if metrics_token and request.headers.get("Authorization") != f"Bearer {metrics_token}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 # Collection Operations
 @app.get("/api/collections/{collection_name}")
 async def get_collection(
@@ -333,6 +400,8 @@ async def global_exception_handler(request, exc):
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(
         "app.main:app",
         host=settings.FASTAPI_HOST,
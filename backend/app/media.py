@@ -0,0 +1,440 @@
+"""
+Media files stored on this VM (served under /media/...)
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from fastapi import UploadFile
+
+from app.sql_database import db
+from app.utils.image_processing import InvalidImage, make_variants, preprocess_image
+
+logger = logging.getLogger(__name__)
+
+MEDIA_DIR = Path(os.getenv("MEDIA_DIR", "media"))
+MEDIA_URL_PREFIX = "/media/"
+# Host (vd: api.example.com) mà URL tuyệt đối trỏ về chính server này → đọc thẳng từ đĩa
+MEDIA_PUBLIC_HOSTS = {h.strip().lower() for h in os.getenv("MEDIA_PUBLIC_HOSTS", "").split(",") if h.strip()}
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_IMAGE_UPLOAD_BYTES = int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+MAX_DOC_UPLOAD_BYTES = int(os.getenv("MAX_DOC_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
+ALLOWED_DOC_TYPES = {
+    "application/pdf",
+    "application/msword",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+# File đang ghi dở; cùng filesystem với MEDIA_DIR để os.replace là atomic
+MEDIA_TMP_DIR = MEDIA_DIR / ".tmp"
+# Content-addressed store: MEDIA_DIR/cas/ab/cd/<sha256><ext>, refcount trong collection media_objects
+MEDIA_STORE_DIR = MEDIA_DIR / "cas"
+MEDIA_OBJECTS_COLLECTION = "media_objects"
+# URL content-addressed ở bất kỳ đâu trong document (kể cả URL tuyệt đối, ảnh trong nội dung)
+_CAS_URL_RE = re.compile(re.escape(MEDIA_URL_PREFIX) + r"cas/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(?:\.\w+)?")
+
+
+def local_media_path(url: str) -> Optional[Path]:
+    """File on disk for one of our own /media URLs, else None (never escapes MEDIA_DIR)."""
+    parts = urlsplit(url)
+    if parts.netloc and parts.netloc.lower() not in MEDIA_PUBLIC_HOSTS:
+        return None
+    if not parts.path.startswith(MEDIA_URL_PREFIX):
+        return None
+
+    return media_file_path(unquote(parts.path[len(MEDIA_URL_PREFIX):]))
+
+
+def media_file_path(relative: str) -> Optional[Path]:
+    """
+    MEDIA_DIR-relative path (already URL-decoded) -> file on disk, else None.
+    Checked on the resolved path: must stay inside MEDIA_DIR and must not go
+    through a hidden entry (.tmp/ holds uploads still being written).
+    """
+    root = MEDIA_DIR.resolve()
+    path = (root / relative).resolve()
+    if root not in path.parents:
+        return None
+    if any(part.startswith(".") for part in path.relative_to(root).parts):
+        return None
+    return path
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File vượt quá giới hạn {round(max_bytes / (1024 * 1024), 1):g} MB")
+        self.max_bytes = max_bytes
+
+
+@dataclass
+class StagedFile:
+    """An upload fully written to a temp file, not yet visible under /media."""
+    path: Path
+    size: int
+    sha256: str
+
+    def discard(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+def _open_temp() -> Path:
+    MEDIA_TMP_DIR.mkdir(parents=True, exist_ok=True)
+    return MEDIA_TMP_DIR / f"{uuid.uuid4().hex}.part"
+
+
+async def stage_upload(file: UploadFile, max_bytes: int) -> StagedFile:
+    """
+    Copy an upload to a temp file in UPLOAD_CHUNK_SIZE chunks (disk I/O in a
+    thread), hashing as it goes. Raises UploadTooLarge as soon as max_bytes is
+    exceeded; the temp file is removed on any error.
+    """
+    path = _open_temp()
+    digest = hashlib.sha256()
+    size = 0
+    out = await asyncio.to_thread(open, path, "wb")
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(max_bytes)
+            digest.update(chunk)
+            await asyncio.to_thread(out.write, chunk)
+        await asyncio.to_thread(out.close)
+    except BaseException:
+        out.close()
+        path.unlink(missing_ok=True)
+        raise
+    return StagedFile(path=path, size=size, sha256=digest.hexdigest())
+
+
+async def publish_staged(staged: StagedFile, dest: Path) -> None:
+    """Atomically move a staged file into place."""
+    await asyncio.to_thread(dest.parent.mkdir, parents=True, exist_ok=True)
+    await asyncio.to_thread(os.replace, staged.path, dest)
+
+
+def _write_atomic(dest: Path, data: bytes) -> None:
+    tmp = _open_temp()
+    try:
+        tmp.write_bytes(data)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp, dest)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+async def write_atomic(dest: Path, data: bytes) -> None:
+    """Write bytes to a temp file and rename into place (readers never see a partial file)."""
+    await asyncio.to_thread(_write_atomic, dest, data)
+
+
+@dataclass
+class StoredMedia:
+    sha256: str
+    url: str
+    mime_type: str
+    size: int
+    deduplicated: bool  # True = nội dung đã có sẵn, không ghi file mới
+
+
+def referenced_media(value: Any) -> List[str]:
+    """Content-addressed media URLs found anywhere in a JSON-like value, each once (host dropped)."""
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    return list(dict.fromkeys(_CAS_URL_RE.findall(text)))
+
+
+# Field của bài viết có thể chứa URL media (ảnh trong nội dung, ảnh, tài liệu, variants)
+POST_MEDIA_FIELDS = ("content", "image_url", "image_urls", "attachments", "image_variants")
+
+
+def post_media_urls(post: Dict[str, Any]) -> List[str]:
+    """
+    Media store URLs a post holds a reference to (each once). Acquired when the
+    post starts using them, released when it stops or is deleted.
+    """
+    return referenced_media({field: post.get(field) for field in POST_MEDIA_FIELDS})
+
+
+class MediaStore:
+    """
+    Files are named by the sha256 of their content, so identical uploads share
+    one file and one URL. Each object has a document (doc_id = sha256) with a
+    reference count held by the documents that use it: a post acquires each
+    URL it starts referencing and releases it when the reference goes away.
+    Uploading holds no reference, so an object nobody attaches stays at 0 and
+    scripts/gc_media.py removes it after the grace period (re-checking every
+    collection first).
+    """
+
+    def __init__(self, root: Path = MEDIA_STORE_DIR, collection: str = MEDIA_OBJECTS_COLLECTION):
+        self.root = root
+        self.collection = collection
+        # Đếm tham chiếu là read-modify-write; lock chống lệch số trong cùng process
+        # (giữa các process, gc_media.py kiểm tra lại trước khi xóa)
+        self._lock = threading.Lock()
+
+    def path_for(self, sha256: str, ext: str) -> Path:
+        return self.root / sha256[:2] / sha256[2:4] / f"{sha256}{ext}"
+
+    def url_for(self, path: Path) -> str:
+        return MEDIA_URL_PREFIX + path.relative_to(MEDIA_DIR).as_posix()
+
+    def sha_from_url(self, url: Optional[str]) -> Optional[str]:
+        """sha256 of a content-addressed URL, None for anything else (legacy uuid files, external URLs)."""
+        path = local_media_path(url) if url else None
+        return self.sha_from_path(path) if path is not None else None
+
+    def sha_from_path(self, path: Path) -> Optional[str]:
+        """sha256 of a resolved file inside the content-addressed store, else None."""
+        if self.root.resolve() not in path.parents:
+            return None
+        sha256 = path.name.split(".", 1)[0]
+        return sha256 if len(sha256) == 64 else None
+
+    def _existing(self, sha256: str) -> Optional[StoredMedia]:
+        doc = db.read(self.collection, sha256, use_cache=False)
+        if not doc or not (MEDIA_DIR / doc["path"]).is_file():
+            return None
+        return StoredMedia(sha256, doc["url"], doc["mimeType"], doc["size"], deduplicated=True)
+
+    def _record_new(self, sha256: str, path: Path, mime_type: str, size: int) -> StoredMedia:
+        now = datetime.now().isoformat()
+        data = {
+            "path": path.relative_to(MEDIA_DIR).as_posix(),
+            "url": self.url_for(path),
+            "mimeType": mime_type,
+            "size": size,
+            "refCount": 0,
+            "orphanedAt": now,
+            "createdAt": now,
+            "updatedAt": now,
+        }
+        with self._lock:
+            doc = db.read(self.collection, sha256, use_cache=False)
+            if doc:
+                # File bị mất nhưng record còn (hoặc process khác vừa ghi): giữ refcount cũ
+                data["refCount"] = max(int(doc.get("refCount") or 0), 0)
+                data["orphanedAt"] = None if data["refCount"] else now
+                data["createdAt"] = doc.get("createdAt") or now
+                db.update(self.collection, sha256, data)
+            else:
+                db.create(self.collection, data, doc_id=sha256)
+        return StoredMedia(sha256, data["url"], mime_type, size, deduplicated=False)
+
+    def _adjust(self, sha256: str, delta: int) -> Optional[int]:
+        with self._lock:
+            doc = db.read(self.collection, sha256, use_cache=False)
+            if not doc:
+                return None
+            ref_count = max(int(doc.get("refCount") or 0) + delta, 0)
+            now = datetime.now().isoformat()
+            db.update(self.collection, sha256, {
+                "refCount": ref_count,
+                "orphanedAt": (doc.get("orphanedAt") or now) if ref_count == 0 else None,
+                "updatedAt": now,
+            })
+            return ref_count
+
+    def _touch(self, sha256: str) -> None:
+        """Re-upload of an unreferenced object: restart its GC grace period."""
+        with self._lock:
+            doc = db.read(self.collection, sha256, use_cache=False)
+            if doc and int(doc.get("refCount") or 0) <= 0:
+                db.update(self.collection, sha256, {"orphanedAt": datetime.now().isoformat()})
+
+    def _ext(self, mime_type: str, fallback: str) -> str:
+        return mimetypes.guess_extension(mime_type) or fallback
+
+    async def put_staged(self, staged: StagedFile, mime_type: str, fallback_ext: str = "") -> StoredMedia:
+        """Store a staged upload (consumes the temp file); duplicates reuse the existing object."""
+        existing = self._existing(staged.sha256)
+        if existing is not None:
+            staged.discard()
+            self._touch(staged.sha256)
+            return existing
+        path = self.path_for(staged.sha256, self._ext(mime_type, fallback_ext))
+        await publish_staged(staged, path)
+        return self._record_new(staged.sha256, path, mime_type, staged.size)
+
+    async def put_bytes(self, data: bytes, mime_type: str, fallback_ext: str = "") -> StoredMedia:
+        sha256 = hashlib.sha256(data).hexdigest()
+        existing = self._existing(sha256)
+        if existing is not None:
+            self._touch(sha256)
+            return existing
+        path = self.path_for(sha256, self._ext(mime_type, fallback_ext))
+        await write_atomic(path, data)
+        return self._record_new(sha256, path, mime_type, len(data))
+
+    async def image_variants(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Responsive variants of one of our images, generated once per content
+        (cached on its media_objects document); the caller acquires them:
+        {"src", "width", "height", "variants": [{"url", "width", "height"}], "srcset"}.
+        None for external URLs or when the image cannot be processed.
+        """
+        path = local_media_path(url)
+        if path is None or not path.is_file():
+            return None
+        sha256 = self.sha_from_url(url)
+        doc = db.read(self.collection, sha256, use_cache=False) if sha256 else None
+
+        if doc and doc.get("variants") is not None and all(
+            (MEDIA_DIR / v["path"]).is_file() for v in doc["variants"]
+        ):
+            variants = doc["variants"]
+            width, height = doc.get("width"), doc.get("height")
+        else:
+            data = await asyncio.to_thread(path.read_bytes)
+            try:
+                made = await make_variants(data, mimetypes.guess_type(path.name)[0] or "")
+            except InvalidImage as e:
+                logger.warning(f"Cannot build variants for {url}: {e}")
+                return None
+            if made is None:
+                return None
+            width, height, images = made
+            variants = []
+            for variant_width, variant_height, variant_bytes in images:
+                stored = await self.put_bytes(variant_bytes, "image/webp", fallback_ext=".webp")
+                variants.append({
+                    "url": stored.url,
+                    "path": local_media_path(stored.url).relative_to(MEDIA_DIR.resolve()).as_posix(),
+                    "sha256": stored.sha256,
+                    "width": variant_width,
+                    "height": variant_height,
+                })
+            if doc:
+                db.update(self.collection, sha256, {"variants": variants, "width": width, "height": height})
+
+        candidates = [f"{v['url']} {v['width']}w" for v in variants] + [f"{url} {width}w"]
+        return {
+            "src": url,
+            "width": width,
+            "height": height,
+            "variants": [{"url": v["url"], "width": v["width"], "height": v["height"]} for v in variants],
+            "srcset": ", ".join(candidates),
+        }
+
+    def _adjust_all(self, urls: Iterable[Optional[str]], delta: int) -> None:
+        for url in urls:
+            sha256 = self.sha_from_url(url)
+            if sha256 is None:
+                continue
+            try:
+                self._adjust(sha256, delta)
+            except Exception as e:
+                logger.warning(f"Media refcount update ({delta:+d}) failed for {sha256}: {e}")
+
+    def acquire(self, urls: Iterable[Optional[str]]) -> None:
+        """Add one reference per content-addressed URL (others are ignored)."""
+        self._adjust_all(urls, +1)
+
+    def release(self, urls: Iterable[Optional[str]]) -> None:
+        """Drop one reference per content-addressed URL (others are ignored)."""
+        self._adjust_all(urls, -1)
+
+    def sync_references(self, old_urls: Iterable[str], new_urls: Iterable[str]) -> None:
+        """A document's media went from `old_urls` to `new_urls`: acquire the added, release the removed."""
+        old, new = set(old_urls), set(new_urls)
+        self.acquire(sorted(new - old))
+        self.release(sorted(old - new))
+
+
+media_store = MediaStore()
+
+
+async def store_image(data: bytes, mime_type: str, fallback_ext: str = "") -> StoredMedia:
+    """Preprocess (EXIF/downscale/re-encode) and store an image; raises InvalidImage."""
+    file_type, content = await preprocess_image(data, mime_type)
+    return await media_store.put_bytes(content, file_type, fallback_ext=fallback_ext)
+
+
+class InlineMediaError(ValueError):
+    pass
+
+
+# Cả chuỗi là 1 data URI (image_url, attachments[].url...)
+_DATA_URI_RE = re.compile(r"^data:([\w.+-]+/[\w.+-]+)((?:;[\w.+-]+=[\w.+-]+)*);base64,([A-Za-z0-9+/=\s]*)$", re.DOTALL)
+_DATA_URI_PREFIX_RE = re.compile(r"^data:[\w.+-]+/[\w.+-]+[;,]")
+# Ảnh nhúng trong nội dung (markdown/HTML)
+_INLINE_IMAGE_RE = re.compile(r"data:(image/(?:png|jpeg|webp|gif));base64,([A-Za-z0-9+/=]+)")
+
+
+async def _store_data_uri(mime_type: str, payload: str) -> str:
+    if mime_type not in ALLOWED_IMAGE_TYPES | ALLOWED_DOC_TYPES:
+        raise InlineMediaError(f"Loại file nhúng không được hỗ trợ: {mime_type}")
+    max_bytes = MAX_IMAGE_UPLOAD_BYTES if mime_type in ALLOWED_IMAGE_TYPES else MAX_DOC_UPLOAD_BYTES
+    # base64: 4 ký tự → 3 byte; chặn trước khi decode
+    if len(payload) * 3 // 4 > max_bytes + 3:
+        raise InlineMediaError(str(UploadTooLarge(max_bytes)))
+    try:
+        data = base64.b64decode("".join(payload.split()), validate=True)
+    except (binascii.Error, ValueError):
+        raise InlineMediaError("Dữ liệu base64 không hợp lệ")
+
+    if mime_type in ALLOWED_IMAGE_TYPES:
+        try:
+            stored = await store_image(data, mime_type)
+        except InvalidImage:
+            raise InlineMediaError("Ảnh nhúng bị lỗi hoặc không đọc được")
+    else:
+        stored = await media_store.put_bytes(data, mime_type)
+    return stored.url
+
+
+async def extract_inline_media(value: Any) -> Tuple[Any, int]:
+    """
+    Replace base64 data: URIs anywhere in a JSON-like value (whole-string URIs,
+    and images embedded in text) with media store URLs.
+    Returns (new value, number of URIs extracted); raises InlineMediaError.
+    """
+    if isinstance(value, dict):
+        out, total = {}, 0
+        for key, item in value.items():
+            out[key], count = await extract_inline_media(item)
+            total += count
+        return out, total
+    if isinstance(value, list):
+        out_list, total = [], 0
+        for item in value:
+            new_item, count = await extract_inline_media(item)
+            out_list.append(new_item)
+            total += count
+        return out_list, total
+    if not isinstance(value, str) or "data:" not in value:
+        return value, 0
+
+    match = _DATA_URI_RE.match(value.strip())
+    if match:
+        return await _store_data_uri(match.group(1).lower(), match.group(3)), 1
+    if _DATA_URI_PREFIX_RE.match(value.strip()):
+        raise InlineMediaError("data: URI không hợp lệ (chỉ hỗ trợ base64)")
+
+    parts, last, count = [], 0, 0
+    for match in _INLINE_IMAGE_RE.finditer(value):
+        parts.append(value[last:match.start()])
+        parts.append(await _store_data_uri(match.group(1), match.group(2)))
+        last = match.end()
+        count += 1
+    parts.append(value[last:])
+    return "".join(parts), count
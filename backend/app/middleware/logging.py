@@ -1,42 +1,88 @@
 """
 Logging Middleware for API requests
+
+Pure ASGI middleware: headers are injected into the http.response.start
+message, and the body is passed through untouched, so StreamingResponse
+and SSE stream without buffering.
+
+Emits one structured access-log line per request (see app.logging_config
+for the queue-based pipeline and 2xx sampling).
 """
 import time
 import logging
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.logging_config import ACCESS_LOGGER
+from app.utils.metrics import (
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS_IN_PROGRESS,
+    HTTP_REQUESTS_TOTAL,
+)
+from app.utils.request_context import start_request, end_request
+
+logger = logging.getLogger(ACCESS_LOGGER)
+
+
+class LoggingMiddleware:
+    """Log all API requests with timing, status and per-request DB/cache/Gemini counters"""
 
-logger = logging.getLogger("api")
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    """Log all API requests with timing and status"""
-    
-    async def dispatch(self, request: Request, call_next):
         start_time = time.time()
-        
-        # Log request
-        logger.info(
-            f"Request: {request.method} {request.url.path} "
-            f"from {request.client.host if request.client else 'unknown'}"
-        )
-        
-        # Process request
-        response = await call_next(request)
-        
-        # Calculate duration
-        duration = time.time() - start_time
-        
-        # Log response
-        logger.info(
-            f"Response: {request.method} {request.url.path} "
-            f"Status: {response.status_code} "
-            f"Duration: {duration:.3f}s"
-        )
-        
-        # Add timing header
-        response.headers["X-Response-Time"] = f"{duration:.3f}"
-        
-        return response
+        method = scope["method"]
+        path = scope["path"]
+
+        # Process request with a fresh request context (DB/cache/Gemini counters)
+        metrics, context_token = start_request(f"{method} {path}")
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method=method)
+        in_progress.inc()
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # Time to response start; streamed bodies keep flowing after this
+                duration = time.time() - start_time
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Response-Time", f"{duration:.3f}")
+                headers.append("Server-Timing", metrics.server_timing(duration))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            end_request(context_token)
+            in_progress.dec()
+
+            # Calculate duration (includes the whole streamed body)
+            duration = time.time() - start_time
+
+            # Label by route template (/api/posts/{post_id}) to keep cardinality bounded
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.labels(method=method, route=route_label).observe(duration)
+            HTTP_REQUESTS_TOTAL.labels(method=method, route=route_label, status=str(status_code)).inc()
 
+            client = scope.get("client")
+            logger.info(
+                f"{method} {path} {status_code} {duration * 1000:.1f}ms",
+                extra={
+                    "fields": {
+                        "method": method,
+                        "path": path,
+                        "route": route_label,
+                        "status": status_code,
+                        "duration_ms": round(duration * 1000, 1),
+                        "client": client[0] if client else None,
+                        **metrics.as_log_fields(),
+                    }
+                },
+            )
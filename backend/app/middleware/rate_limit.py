@@ -1,112 +1,447 @@
 """
 Rate Limiting Middleware
+
+Sliding-window counters: each client keeps, per window, only the start of the
+current window plus the counts of the current and previous windows. The
+request rate is estimated as
+
+    previous * (time left of the previous window overlapping now) / window + current
+
+which gives constant time and memory per client. Client state lives in an
+LRU-bounded in-memory table, or in a shared SQLite file so that all uvicorn
+workers enforce the same limits (RATE_LIMIT_STORE=sqlite).
+
+Clients are keyed on the verified Firebase UID when a valid bearer token is
+sent (so a whole school behind one NAT does not share a bucket), else on IP.
+A token that is not in the verified-token cache costs an RSA verification,
+so it is first charged to the IP's "auth" budget: random bearer tokens are
+throttled before they are verified.
+Routes are split into groups with independent budgets, and each request
+spends a per-route cost from its group's budget (a Gemini call costs more
+than a read), so cheap reads are never starved by expensive AI calls.
+
+Implemented as pure ASGI middleware so streamed responses are not buffered.
+Stores that block (SQLite waits on a file lock) are called from a worker
+thread so a contended lock never stalls the event loop.
 """
-from fastapi import Request, HTTPException, status
-from starlette.middleware.base import BaseHTTPMiddleware
-from collections import defaultdict
-from datetime import datetime, timedelta
-from typing import Dict, Tuple
+import asyncio
+import math
+import os
+import sqlite3
+import threading
 import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.auth import cached_claims, verify_token_cached
+from app.middleware.error_handler import StandardErrorResponse
+from app.utils.metrics import RATE_LIMIT_REJECTIONS_TOTAL
+
+# (window length in seconds, max requests in that window)
+WindowLimit = Tuple[int, int]
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    # Remaining budget per window length, after this request if it was allowed
+    remaining: Dict[int, int]
+    # Window that rejected the request and seconds until it has room again
+    exceeded_window: Optional[int] = None
+    retry_after: float = 0.0
+
+
+def _estimate(window: int, window_start: float, current: float, previous: float, now: float) -> Tuple[float, float, float, float]:
+    """Roll the window forward to `now` and return (window_start, current, previous, estimate)."""
+    aligned = now - (now % window)
+    if aligned != window_start:
+        # One window later: current becomes previous; more than one: both expire
+        previous = current if aligned - window_start == window else 0.0
+        current = 0.0
+        window_start = aligned
+    weight = 1.0 - (now - window_start) / window
+    return window_start, current, previous, previous * weight + current
+
+
+def _retry_after(window: int, window_start: float, current: float, previous: float,
+                 now: float, limit: int, cost: float) -> float:
+    """Seconds until the estimate drops enough for `cost` more requests."""
+    if previous <= 0:
+        # Only the current window counts; wait for it to roll over
+        return max(window_start + window - now, 0.0)
+    # estimate(t) = previous * (1 - (t - window_start) / window) + current
+    needed = previous + current + cost - limit
+    wait = window_start + window * needed / previous - now
+    return min(max(wait, 0.0), window_start + window - now)
+
+
+class MemoryRateLimitStore:
+    """Per-process store; least recently seen clients are evicted beyond max_clients."""
+
+    # hit() only takes an uncontended in-process lock: cheap enough to call on the event loop
+    blocking = False
+
+    def __init__(self, max_clients: int = 10000):
+        self.max_clients = max_clients
+        # client key -> {window: [window_start, current, previous]}
+        self._clients: "OrderedDict[str, Dict[int, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limits: List[WindowLimit], now: float, cost: float = 1) -> RateLimitResult:
+        with self._lock:
+            state = self._clients.get(key)
+            if state is None:
+                state = {}
+                self._clients[key] = state
+                while len(self._clients) > self.max_clients:
+                    self._clients.popitem(last=False)
+            else:
+                self._clients.move_to_end(key)
+
+            rolled = {}
+            for window, limit in limits:
+                window_start, current, previous = state.get(window, (0.0, 0.0, 0.0))
+                window_start, current, previous, estimate = _estimate(
+                    window, window_start, current, previous, now
+                )
+                rolled[window] = [window_start, current, previous]
+                if estimate + cost > limit:
+                    state.update(rolled)
+                    return RateLimitResult(
+                        allowed=False,
+                        remaining={w: 0 for w, _ in limits},
+                        exceeded_window=window,
+                        retry_after=_retry_after(window, window_start, current, previous, now, limit, cost),
+                    )
+
+            remaining = {}
+            for window, limit in limits:
+                entry = rolled[window]
+                entry[1] += cost
+                _, _, _, estimate = _estimate(window, entry[0], entry[1], entry[2], now)
+                remaining[window] = max(0, math.floor(limit - estimate))
+            state.update(rolled)
+            return RateLimitResult(allowed=True, remaining=remaining)
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+class SQLiteRateLimitStore:
+    """
+    Store shared by all workers on one host through a small SQLite file.
+    Each check-and-consume runs in a BEGIN IMMEDIATE transaction, so
+    concurrent workers cannot both spend the last slot.
+    """
+
+    PRUNE_INTERVAL = 300  # seconds
+    # hit() may wait up to the busy timeout for another worker's write lock
+    blocking = True
+
+    def __init__(self, path: str = "rate_limit.db"):
+        self.path = path
+        self._local = threading.local()
+        self._last_prune = 0.0
+        conn = self._connect()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                client_key TEXT NOT NULL,
+                window INTEGER NOT NULL,
+                window_start REAL NOT NULL,
+                current REAL NOT NULL,
+                previous REAL NOT NULL,
+                PRIMARY KEY (client_key, window)
+            ) WITHOUT ROWID
+            """
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key: str, limits: List[WindowLimit], now: float, cost: float = 1) -> RateLimitResult:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rolled = {}
+            result: Optional[RateLimitResult] = None
+            for window, limit in limits:
+                row = conn.execute(
+                    "SELECT window_start, current, previous FROM rate_limits WHERE client_key = ? AND window = ?",
+                    (key, window),
+                ).fetchone()
+                window_start, current, previous = row if row else (0.0, 0.0, 0.0)
+                window_start, current, previous, estimate = _estimate(
+                    window, window_start, current, previous, now
+                )
+                rolled[window] = [window_start, current, previous]
+                if estimate + cost > limit:
+                    result = RateLimitResult(
+                        allowed=False,
+                        remaining={w: 0 for w, _ in limits},
+                        exceeded_window=window,
+                        retry_after=_retry_after(window, window_start, current, previous, now, limit, cost),
+                    )
+                    break
+
+            if result is None:
+                remaining = {}
+                for window, limit in limits:
+                    entry = rolled[window]
+                    entry[1] += cost
+                    _, _, _, estimate = _estimate(window, entry[0], entry[1], entry[2], now)
+                    remaining[window] = max(0, math.floor(limit - estimate))
+                result = RateLimitResult(allowed=True, remaining=remaining)
+
+            conn.executemany(
+                "INSERT OR REPLACE INTO rate_limits (client_key, window, window_start, current, previous) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(key, window, *entry) for window, entry in rolled.items()],
+            )
+            if now - self._last_prune > self.PRUNE_INTERVAL:
+                # Rows whose windows both expired carry no information
+                conn.execute("DELETE FROM rate_limits WHERE window_start + 2 * window < ?", (now,))
+                self._last_prune = now
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
 
+def create_rate_limit_store():
+    """Build the store selected by RATE_LIMIT_STORE (memory | sqlite)."""
+    backend = os.getenv("RATE_LIMIT_STORE", "memory").lower()
+    if backend == "sqlite":
+        return SQLiteRateLimitStore(os.getenv("RATE_LIMIT_SQLITE_PATH", "rate_limit.db"))
+    return MemoryRateLimitStore(max_clients=int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000")))
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+
+WINDOW_NAMES = {60: "minute", 3600: "hour"}
+
+
+@dataclass(frozen=True)
+class RouteGroup:
+    """A set of routes sharing one budget per client."""
+    name: str
+    per_minute: int
+    per_hour: int
+    # Path prefixes belonging to the group; empty = match by methods only
+    prefixes: Tuple[str, ...] = ()
+    # HTTP methods belonging to the group; empty = any method
+    methods: Tuple[str, ...] = ()
+    # (method, exact path) -> cost; everything else costs 1
+    costs: Dict[Tuple[str, str], int] = field(default_factory=dict)
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods and method not in self.methods:
+            return False
+        if self.prefixes and not path.startswith(self.prefixes):
+            return False
+        return True
+
+    def cost_of(self, method: str, path: str) -> int:
+        return self.costs.get((method, path.rstrip("/") or "/"), 1)
+
+    @property
+    def limits(self) -> List[WindowLimit]:
+        return [(60, self.per_minute), (3600, self.per_hour)]
+
+
+def default_route_groups(requests_per_minute: int = 60, requests_per_hour: int = 1000) -> List[RouteGroup]:
     """
-    Simple in-memory rate limiting.
-    For production, consider using Redis-based rate limiting.
+    Route groups, most specific first. The read group keeps the historical
+    RATE_LIMIT_PER_MINUTE / RATE_LIMIT_PER_HOUR budget.
     """
-    
-    def __init__(self, app, requests_per_minute: int = 60, requests_per_hour: int = 1000):
-        super().__init__(app)
+    return [
+        RouteGroup(
+            name="ai",
+            prefixes=("/api/ai-chat", "/api/ai-analysis", "/api/ai-feed"),
+            per_minute=int(os.getenv("RATE_LIMIT_AI_PER_MINUTE", "30")),
+            per_hour=int(os.getenv("RATE_LIMIT_AI_PER_HOUR", "300")),
+            costs={
+                # Each of these is a Gemini call (analyze-batch: up to 20)
+                ("POST", "/api/ai-chat/chat"): 5,
+                ("POST", "/api/ai-analysis/analyze"): 5,
+                ("POST", "/api/ai-analysis/comments-summary"): 3,
+                ("POST", "/api/ai-feed/analyze-post"): 2,
+                ("POST", "/api/ai-feed/analyze-batch"): 10,
+            },
+        ),
+        RouteGroup(
+            # Ảnh/tài liệu trong feed: mỗi trang feed kéo nhiều file
+            name="media",
+            prefixes=("/media/",),
+            methods=("GET", "HEAD"),
+            per_minute=int(os.getenv("RATE_LIMIT_MEDIA_PER_MINUTE", "600")),
+            per_hour=int(os.getenv("RATE_LIMIT_MEDIA_PER_HOUR", "10000")),
+        ),
+        RouteGroup(
+            name="write",
+            methods=("POST", "PUT", "PATCH", "DELETE"),
+            per_minute=int(os.getenv("RATE_LIMIT_WRITE_PER_MINUTE", "30")),
+            per_hour=int(os.getenv("RATE_LIMIT_WRITE_PER_HOUR", "500")),
+            costs={
+                ("POST", "/api/uploads/image"): 3,
+                ("POST", "/api/uploads/doc"): 5,
+            },
+        ),
+        RouteGroup(
+            name="read",
+            per_minute=requests_per_minute,
+            per_hour=requests_per_hour,
+        ),
+    ]
+
+
+def default_auth_group() -> RouteGroup:
+    """Per-IP budget for token verifications (cache misses only)."""
+    return RouteGroup(
+        name="auth",
+        per_minute=int(os.getenv("RATE_LIMIT_AUTH_PER_MINUTE", "60")),
+        per_hour=int(os.getenv("RATE_LIMIT_AUTH_PER_HOUR", "1000")),
+    )
+
+
+class RateLimitMiddleware:
+    """
+    Cost-weighted sliding-window rate limiting per client and route group.
+    Constant memory per client; see module docstring for keys and groups.
+    """
+
+    SKIP_PATHS = frozenset(["/health", "/", "/docs", "/openapi.json", "/redoc", "/metrics"])
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        requests_per_minute: int = 60,
+        requests_per_hour: int = 1000,
+        store=None,
+        route_groups: Optional[List[RouteGroup]] = None,
+        auth_group: Optional[RouteGroup] = None,
+    ):
+        self.app = app
         self.requests_per_minute = requests_per_minute
         self.requests_per_hour = requests_per_hour
-        self.minute_requests: Dict[str, list] = defaultdict(list)
-        self.hour_requests: Dict[str, list] = defaultdict(list)
-        self.cleanup_interval = 300  # Clean up every 5 minutes
-        self.last_cleanup = time.time()
-    
-    def _get_client_id(self, request: Request) -> str:
-        """Get client identifier (IP address or user ID)"""
-        # Try to get user ID from token if available
-        auth_header = request.headers.get("Authorization", "")
-        if auth_header.startswith("Bearer "):
-            # In production, decode token to get user ID
-            # For now, use IP address
-            pass
-        
+        self.route_groups = route_groups or default_route_groups(requests_per_minute, requests_per_hour)
+        self.auth_group = auth_group or default_auth_group()
+        self.store = store if store is not None else create_rate_limit_store()
+
+    async def _get_client_id(self, scope: Scope) -> Tuple[str, Optional[RateLimitResult]]:
+        """
+        Get client identifier: verified Firebase UID, or IP address. The second
+        value is the failed "auth" budget check when an uncached token could
+        not be verified because the IP ran out of verifications.
+        """
         # Use IP address as fallback
-        client_ip = request.client.host if request.client else "unknown"
-        return client_ip
-    
-    def _cleanup_old_requests(self):
-        """Remove old request timestamps"""
-        now = time.time()
-        if now - self.last_cleanup < self.cleanup_interval:
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+        ip_key = f"ip:{client_ip}"
+
+        auth_header = Headers(scope=scope).get("authorization", "")
+        if not auth_header.startswith("Bearer "):
+            return ip_key, None
+
+        token = auth_header.split(" ", 1)[1].strip()
+        claims = cached_claims(token)
+        if claims is None:
+            # Cache miss = một lần verify chữ ký: trừ vào budget "auth" của IP trước
+            verdict = await self._hit(f"{ip_key}:{self.auth_group.name}", self.auth_group.limits, 1)
+            if not verdict.allowed:
+                return ip_key, verdict
+            try:
+                claims = await verify_token_cached(token)
+            except Exception:
+                claims = None
+
+        # Exposed as request.state; reused by auth.get_current_user so the
+        # token is verified at most once per request (invalid tokens included)
+        state = scope.setdefault("state", {})
+        state["firebase_token"] = token
+        state["firebase_claims"] = claims
+        uid = claims.get("uid") if claims else None
+        return (f"uid:{uid}" if uid else ip_key), None
+
+    async def _hit(self, key: str, limits: List[WindowLimit], cost: float) -> RateLimitResult:
+        if getattr(self.store, "blocking", True):
+            return await asyncio.to_thread(self.store.hit, key, limits, time.time(), cost)
+        return self.store.hit(key, limits, time.time(), cost=cost)
+
+    def _get_route_group(self, method: str, path: str) -> RouteGroup:
+        for group in self.route_groups:
+            if group.matches(method, path):
+                return group
+        return self.route_groups[-1]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Skip rate limiting for health checks (and non-HTTP traffic)
+        if scope["type"] != "http" or scope["path"] in self.SKIP_PATHS:
+            await self.app(scope, receive, send)
             return
-        
-        cutoff_minute = now - 60
-        cutoff_hour = now - 3600
-        
-        # Clean minute requests
-        for client_id in list(self.minute_requests.keys()):
-            self.minute_requests[client_id] = [
-                ts for ts in self.minute_requests[client_id] if ts > cutoff_minute
-            ]
-            if not self.minute_requests[client_id]:
-                del self.minute_requests[client_id]
-        
-        # Clean hour requests
-        for client_id in list(self.hour_requests.keys()):
-            self.hour_requests[client_id] = [
-                ts for ts in self.hour_requests[client_id] if ts > cutoff_hour
-            ]
-            if not self.hour_requests[client_id]:
-                del self.hour_requests[client_id]
-        
-        self.last_cleanup = now
-    
-    async def dispatch(self, request: Request, call_next):
-        # Skip rate limiting for health checks
-        if request.url.path in ["/health", "/", "/docs", "/openapi.json", "/redoc"]:
-            return await call_next(request)
-        
-        client_id = self._get_client_id(request)
-        now = time.time()
-        
-        # Cleanup old requests periodically
-        self._cleanup_old_requests()
-        
-        # Check minute limit
-        minute_requests = self.minute_requests[client_id]
-        minute_requests = [ts for ts in minute_requests if ts > now - 60]
-        
-        if len(minute_requests) >= self.requests_per_minute:
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail=f"Rate limit exceeded: {self.requests_per_minute} requests per minute"
-            )
-        
-        # Check hour limit
-        hour_requests = self.hour_requests[client_id]
-        hour_requests = [ts for ts in hour_requests if ts > now - 3600]
-        
-        if len(hour_requests) >= self.requests_per_hour:
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail=f"Rate limit exceeded: {self.requests_per_hour} requests per hour"
-            )
-        
-        # Record request
-        minute_requests.append(now)
-        hour_requests.append(now)
-        self.minute_requests[client_id] = minute_requests
-        self.hour_requests[client_id] = hour_requests
-        
-        # Add rate limit headers
-        response = await call_next(request)
-        response.headers["X-RateLimit-Limit-Minute"] = str(self.requests_per_minute)
-        response.headers["X-RateLimit-Remaining-Minute"] = str(self.requests_per_minute - len(minute_requests))
-        response.headers["X-RateLimit-Limit-Hour"] = str(self.requests_per_hour)
-        response.headers["X-RateLimit-Remaining-Hour"] = str(self.requests_per_hour - len(hour_requests))
-        
-        return response
 
+        method = scope["method"]
+        path = scope["path"]
+        group = self._get_route_group(method, path)
+        cost = group.cost_of(method, path)
+        client_id, auth_result = await self._get_client_id(scope)
+        if auth_result is not None:
+            await self._reject(scope, receive, send, self.auth_group, auth_result, 1)
+            return
+        result = await self._hit(f"{client_id}:{group.name}", group.limits, cost)
+
+        if not result.allowed:
+            await self._reject(scope, receive, send, group, result, cost)
+            return
+
+        # Add rate limit headers (budgets are in cost units of the route group)
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("X-RateLimit-Group", group.name)
+                headers.append("X-RateLimit-Cost", str(cost))
+                headers.append("X-RateLimit-Limit-Minute", str(group.per_minute))
+                headers.append("X-RateLimit-Remaining-Minute", str(result.remaining[60]))
+                headers.append("X-RateLimit-Limit-Hour", str(group.per_hour))
+                headers.append("X-RateLimit-Remaining-Hour", str(result.remaining[3600]))
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+    async def _reject(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+        group: RouteGroup,
+        result: RateLimitResult,
+        cost: int,
+    ) -> None:
+        window_name = WINDOW_NAMES.get(result.exceeded_window, str(result.exceeded_window))
+        limit = dict(group.limits)[result.exceeded_window]
+        RATE_LIMIT_REJECTIONS_TOTAL.labels(group=group.name, window=window_name).inc()
+        response = JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content=StandardErrorResponse.create(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                message=f"Rate limit exceeded: {limit} {group.name} requests per {window_name}",
+                error_code="RATE_LIMITED",
+                details={"group": group.name, "cost": cost},
+            ),
+            headers={
+                "Retry-After": str(max(1, math.ceil(result.retry_after))),
+                "X-RateLimit-Group": group.name,
+            },
+        )
+        await response(scope, receive, send)
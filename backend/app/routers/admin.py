@@ -1,18 +1,23 @@
 """
 Admin API endpoints - Quản lý toàn bộ hệ thống
 """
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Body
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel
 from datetime import datetime
+import asyncio
 
+from app.job_queue import job_queue
+from app.media import media_store, post_media_urls
 from app.sql_database import db
-from app.auth import get_current_user
+from app.user_context import get_current_user_context
+from app.utils.gemini_key_pool import gemini_key_pool
+from app.utils.slow_query_log import slow_query_log
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
 
-def require_admin(current_user: Dict[str, Any] = Depends(get_current_user)):
+def require_admin(current_user: Dict[str, Any] = Depends(get_current_user_context)):
     """Dependency để kiểm tra admin role."""
     role = current_user.get("role") or "student"
     if role != "admin":
@@ -107,13 +112,14 @@ async def admin_delete_post(
 ):
     """Xóa post bất kỳ (admin only)."""
     try:
-        post = db.read("posts", post_id)
+        post = db.read("posts", post_id, use_cache=False)
         if not post:
             raise HTTPException(status_code=404, detail="Post not found")
         
         deleted = db.delete("posts", post_id)
         if not deleted:
             raise HTTPException(status_code=500, detail="Failed to delete post")
+        media_store.release(post_media_urls(post))
         
         return {"message": "Post deleted successfully"}
     except HTTPException:
@@ -150,3 +156,52 @@ async def update_post_status(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    limit: int = 50,
+    current_user: Dict[str, Any] = Depends(require_admin),
+):
+    """Các câu SQL chậm gần nhất (kèm EXPLAIN QUERY PLAN) để quyết định index field nào."""
+    return {
+        **slow_query_log.stats(),
+        "queries": slow_query_log.snapshot(limit=limit),
+    }
+
+
+@router.delete("/slow-queries")
+async def clear_slow_queries(
+    current_user: Dict[str, Any] = Depends(require_admin),
+):
+    """Xóa ring buffer slow-query (admin only)."""
+    slow_query_log.clear()
+    return {"message": "Slow query log cleared"}
+
+
+@router.get("/gemini-keys")
+async def get_gemini_key_usage(
+    current_user: Dict[str, Any] = Depends(require_admin),
+):
+    """Usage/budget/cooldown của từng Gemini API key trong pool (key chỉ hiện fingerprint)."""
+    return {"keys": gemini_key_pool.stats()}
+
+
+@router.get("/jobs")
+async def get_job_queue_stats(
+    window: int = 3600,
+    current_user: Dict[str, Any] = Depends(require_admin),
+):
+    """Độ sâu hàng đợi, độ trễ (enqueue → bắt đầu chạy) theo loại job và các job dead-letter gần nhất."""
+    return await asyncio.to_thread(job_queue.stats, window=window)
+
+
+@router.post("/jobs/{job_id}/retry")
+async def retry_dead_job(
+    job_id: int,
+    current_user: Dict[str, Any] = Depends(require_admin),
+):
+    """Đưa một job dead-letter trở lại hàng đợi (admin only)."""
+    if not await asyncio.to_thread(job_queue.retry_dead, job_id):
+        raise HTTPException(status_code=404, detail="Dead job not found")
+    return {"message": "Job re-queued", "id": job_id}
@@ -4,13 +4,17 @@ AI Chat API endpoints using Gemini
 from fastapi import APIRouter, HTTPException
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
-import os
-import requests
+import logging
+
+import httpx
 
 from app.config import settings
+from app.gemini import gemini_available, generate_content, get_model_name
+from app.utils.gemini_key_pool import NoGeminiKeyAvailable
 from app.sql_database import db
 
 router = APIRouter(prefix="/api/ai-chat", tags=["ai-chat"])
+logger = logging.getLogger(__name__)
 
 
 # ===================== ANH THƠ PERSONA =====================
@@ -68,25 +72,10 @@ class ChatResponse(BaseModel):
     conversation_id: str
 
 
-def get_gemini_api_key():
-    """Get Gemini API key from settings"""
-    if settings.GEMINI_API_KEY:
-        return settings.GEMINI_API_KEY
-    
-    # Try to get from environment variable
-    api_key = os.getenv("GEMINI_API_KEY")
-    if api_key:
-        return api_key
-    
-    return None
-
-
 @router.post("/chat", response_model=Dict[str, Any])
 async def chat_with_ai(request: ChatRequest):
     """Chat with AI using Gemini API"""
-    api_key = get_gemini_api_key()
-    
-    if not api_key:
+    if not gemini_available():
         raise HTTPException(
             status_code=503,
             detail="Gemini API key not configured. Please set GEMINI_API_KEY in environment variables."
@@ -95,9 +84,6 @@ async def chat_with_ai(request: ChatRequest):
     try:
         # Prepare messages for Gemini API
         # Gemini API format: https://ai.google.dev/api/generate-content
-        model_name = settings.GEMINI_MODEL or "gemini-2.5-flash-lite"
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={api_key}"
-        
         # Chuẩn hoá message cuối cùng gửi cho Gemini, có kèm ngữ cảnh nếu có.
         if request.context:
             full_message = (
@@ -133,13 +119,16 @@ async def chat_with_ai(request: ChatRequest):
             }
         }
         
-        response = requests.post(url, json=payload, timeout=30)
         try:
-            response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            # Không bao giờ trả raw message (có thể lộ API key) ra frontend.
+            data = await generate_content(payload, endpoint="ai_chat", timeout=30)
+        except httpx.HTTPStatusError as e:
+            # Không bao giờ trả raw message của Gemini ra frontend.
             # Ghi log đơn giản ở server, trả lời thân thiện cho người dùng.
-            print(f"[AI_CHAT_HTTP_ERROR] {e}")
+            status_code = e.response.status_code
+            logger.warning(
+                f"[AI_CHAT_HTTP_ERROR] Gemini returned {status_code}",
+                extra={"fields": {"event": "ai_chat_http_error", "upstream_status": status_code}},
+            )
 
             conversation_id = request.conversation_id or f"conv_{hash(full_message) % 1000000}"
             model_name = settings.GEMINI_MODEL or "gemini-2.0-flash-exp"
@@ -154,8 +143,6 @@ async def chat_with_ai(request: ChatRequest):
                 "model": model_name,
             }
 
-        data = response.json()
-        
         # Extract response text
         if "candidates" in data and len(data["candidates"]) > 0:
             ai_response = data["candidates"][0]["content"]["parts"][0]["text"]
@@ -180,7 +167,10 @@ async def chat_with_ai(request: ChatRequest):
             db.create("ai_chat_logs", log_data)
         except Exception as log_err:
             # Không làm hỏng flow chính nếu ghi log thất bại
-            print(f"[AI_CHAT_LOG_ERROR] {log_err}")
+            logger.exception(
+                f"[AI_CHAT_LOG_ERROR] {log_err}",
+                extra={"fields": {"event": "ai_chat_log_error"}},
+            )
 
         return {
             "response": ai_response,
@@ -188,9 +178,12 @@ async def chat_with_ai(request: ChatRequest):
             "model": model_name
         }
         
-    except requests.exceptions.RequestException as e:
+    except (httpx.HTTPError, NoGeminiKeyAvailable) as e:
         # Lỗi mạng / timeout khi gọi Gemini → không trả 503 nữa, trả câu trả lời an toàn.
-        print(f"[AI_CHAT_REQUEST_ERROR] {e}")
+        logger.warning(
+            f"[AI_CHAT_REQUEST_ERROR] {type(e).__name__}",
+            extra={"fields": {"event": "ai_chat_request_error", "error_type": type(e).__name__}},
+        )
         conversation_id = request.conversation_id or f"conv_{hash(request.message) % 1000000}"
         model_name = settings.GEMINI_MODEL or "gemini-2.0-flash-exp"
         safe_msg = (
@@ -212,11 +205,11 @@ async def chat_with_ai(request: ChatRequest):
 @router.get("/health")
 async def ai_chat_health():
     """Check if AI chat is available"""
-    api_key = get_gemini_api_key()
+    available = gemini_available()
     
-    model_name = settings.GEMINI_MODEL or "gemini-2.5-flash-lite"
+    model_name = get_model_name()
     return {
-        "available": api_key is not None,
-        "model": model_name if api_key else None
+        "available": available,
+        "model": model_name if available else None
     }
 
@@ -5,14 +5,20 @@ Phân tích nội dung bài viết để tối ưu hóa feed distribution
 from fastapi import APIRouter, HTTPException
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
-import os
-import requests
+import asyncio
 import json
+import os
+
+import httpx
 
-from app.config import settings
+from app.gemini import gemini_available, generate_content, get_model_name
 
 router = APIRouter(prefix="/api/ai-feed", tags=["ai-feed"])
 
+# analyze-batch: số bài phân tích song song và thời hạn cho cả batch (giây)
+AI_FEED_BATCH_CONCURRENCY = int(os.getenv("AI_FEED_BATCH_CONCURRENCY", "5"))
+AI_FEED_BATCH_DEADLINE = float(os.getenv("AI_FEED_BATCH_DEADLINE", "15"))
+
 
 class PostAnalysisRequest(BaseModel):
     content: str
@@ -31,16 +37,18 @@ class UserProfileRequest(BaseModel):
     interaction_history: Optional[Dict[str, Any]] = {}
 
 
-def get_gemini_api_key():
-    """Get Gemini API key from settings"""
-    if settings.GEMINI_API_KEY:
-        return settings.GEMINI_API_KEY
-    
-    api_key = os.getenv("GEMINI_API_KEY")
-    if api_key:
-        return api_key
-    
-    return None
+def _fallback_analysis(request: PostAnalysisRequest, error: str) -> Dict[str, Any]:
+    """Điểm mặc định khi không có kết quả AI"""
+    return {
+        "content_type": "discussion" if not request.has_question else "question",
+        "relevance_score": 0.5,
+        "sentiment": "neutral",
+        "priority_score": 0.5,
+        "topics": [request.subject] if request.subject else [],
+        "keywords": [],
+        "ai_available": False,
+        "error": error
+    }
 
 
 @router.post("/analyze-post", response_model=Dict[str, Any])
@@ -52,9 +60,7 @@ async def analyze_post(request: PostAnalysisRequest):
     - Sentiment (tích cực, trung tính, tiêu cực)
     - Độ ưu tiên hiển thị
     """
-    api_key = get_gemini_api_key()
-    
-    if not api_key:
+    if not gemini_available():
         # Fallback: return basic analysis without AI
         return {
             "content_type": "discussion" if not request.has_question else "question",
@@ -66,9 +72,6 @@ async def analyze_post(request: PostAnalysisRequest):
         }
     
     try:
-        model_name = settings.GEMINI_MODEL or "gemini-2.5-flash-lite"
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={api_key}"
-        
         prompt = f"""Phân tích bài viết sau và trả về JSON với các thông tin:
 1. content_type: "question" (câu hỏi), "share" (chia sẻ), "discussion" (thảo luận), "announcement" (thông báo)
 2. relevance_score: số từ 0-1, độ liên quan đến học tập
@@ -107,10 +110,7 @@ Trả về CHỈ JSON, không có text khác. Format:
             }
         }
         
-        response = requests.post(url, json=payload, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
+        data = await generate_content(payload, endpoint="ai_feed", timeout=10)
         
         if "candidates" in data and len(data["candidates"]) > 0:
             ai_response = data["candidates"][0]["content"]["parts"][0]["text"]
@@ -146,30 +146,12 @@ Trả về CHỈ JSON, không có text khác. Format:
         else:
             raise HTTPException(status_code=500, detail="No response from Gemini API")
             
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         # Timeout fallback
-        return {
-            "content_type": "discussion" if not request.has_question else "question",
-            "relevance_score": 0.5,
-            "sentiment": "neutral",
-            "priority_score": 0.5,
-            "topics": [request.subject] if request.subject else [],
-            "keywords": [],
-            "ai_available": False,
-            "error": "AI service timeout"
-        }
+        return _fallback_analysis(request, "AI service timeout")
     except Exception as e:
         # Error fallback
-        return {
-            "content_type": "discussion" if not request.has_question else "question",
-            "relevance_score": 0.5,
-            "sentiment": "neutral",
-            "priority_score": 0.5,
-            "topics": [request.subject] if request.subject else [],
-            "keywords": [],
-            "ai_available": False,
-            "error": str(e)
-        }
+        return _fallback_analysis(request, str(e))
 
 
 @router.post("/analyze-batch", response_model=Dict[str, Any])
@@ -178,9 +160,7 @@ async def analyze_batch_posts(request: BatchPostAnalysisRequest):
     Phân tích hàng loạt bài viết để tối ưu hóa feed
     Trả về điểm số và đề xuất thứ tự hiển thị
     """
-    api_key = get_gemini_api_key()
-    
-    if not api_key or len(request.posts) == 0:
+    if not gemini_available() or len(request.posts) == 0:
         return {
             "rankings": [],
             "ai_available": False
@@ -189,17 +169,37 @@ async def analyze_batch_posts(request: BatchPostAnalysisRequest):
     try:
         # Analyze each post (limit to 20 posts per batch for performance)
         posts_to_analyze = request.posts[:20]
-        rankings = []
-        
-        for post in posts_to_analyze:
-            analysis_request = PostAnalysisRequest(
+        analysis_requests = [
+            PostAnalysisRequest(
                 content=post.get("content", ""),
                 author_role=post.get("author_role"),
                 subject=post.get("subject"),
                 has_question=post.get("has_question", False)
             )
-            
-            analysis = await analyze_post(analysis_request)
+            for post in posts_to_analyze
+        ]
+
+        # Phân tích song song, tối đa AI_FEED_BATCH_CONCURRENCY bài cùng lúc
+        semaphore = asyncio.Semaphore(max(1, AI_FEED_BATCH_CONCURRENCY))
+
+        async def analyze_bounded(analysis_request: PostAnalysisRequest) -> Dict[str, Any]:
+            async with semaphore:
+                return await analyze_post(analysis_request)
+
+        tasks = [asyncio.create_task(analyze_bounded(r)) for r in analysis_requests]
+        # Hết hạn thì trả kết quả từng phần; bài chưa xong dùng điểm mặc định
+        done, pending = await asyncio.wait(tasks, timeout=AI_FEED_BATCH_DEADLINE)
+        for task in pending:
+            task.cancel()
+
+        rankings = []
+        for post, analysis_request, task in zip(posts_to_analyze, analysis_requests, tasks):
+            if task in done and task.exception() is None:
+                analysis = task.result()
+            elif task in done:
+                analysis = _fallback_analysis(analysis_request, str(task.exception()))
+            else:
+                analysis = _fallback_analysis(analysis_request, "Batch deadline exceeded")
             
             # Calculate final score combining AI analysis with engagement
             engagement = post.get("likes", 0) + post.get("comments", 0) * 2
@@ -226,7 +226,11 @@ async def analyze_batch_posts(request: BatchPostAnalysisRequest):
         
         return {
             "rankings": rankings,
-            "ai_available": True
+            "ai_available": True,
+            # partial = có bài chưa phân tích xong trước deadline
+            "partial": bool(pending),
+            "analyzed": len(done),
+            "timed_out": len(pending),
         }
         
     except Exception as e:
@@ -253,7 +257,7 @@ async def recommend_posts(request: UserProfileRequest):
             "trending": 0.2,
             "recent": 0.1
         },
-        "ai_available": get_gemini_api_key() is not None
+        "ai_available": gemini_available()
     }
     
     return recommendations
@@ -262,11 +266,11 @@ async def recommend_posts(request: UserProfileRequest):
 @router.get("/health")
 async def ai_feed_health():
     """Check if AI feed analysis is available"""
-    api_key = get_gemini_api_key()
-    model_name = settings.GEMINI_MODEL or "gemini-2.5-flash-lite"
+    available = gemini_available()
+    model_name = get_model_name()
     
     return {
-        "available": api_key is not None,
-        "model": model_name if api_key else None
+        "available": available,
+        "model": model_name if available else None
     }
 
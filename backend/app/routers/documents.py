@@ -7,7 +7,7 @@ from pydantic import BaseModel
 from datetime import datetime
 
 from app.sql_database import db
-from app.auth import get_current_user
+from app.user_context import get_current_user_context
 
 router = APIRouter(prefix="/api/documents", tags=["documents"])
 
@@ -76,7 +76,7 @@ async def get_document(document_id: str):
 @router.post("/", response_model=Dict[str, Any])
 async def create_document(
     document: DocumentCreate,
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Create a new document"""
     try:
@@ -95,7 +95,7 @@ async def create_document(
 @router.post("/{document_id}/download")
 async def download_document(
     document_id: str,
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Increment download count"""
     try:
@@ -118,7 +118,7 @@ async def download_document(
 @router.delete("/{document_id}")
 async def delete_document(
     document_id: str,
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Delete a document"""
     try:
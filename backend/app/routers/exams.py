@@ -7,7 +7,7 @@ from pydantic import BaseModel
 from datetime import datetime
 
 from app.sql_database import db
-from app.auth import get_current_user
+from app.user_context import get_current_user_context
 
 router = APIRouter(prefix="/api/exams", tags=["exams"])
 
@@ -73,7 +73,7 @@ async def get_exam(exam_id: str):
 @router.post("/", response_model=Dict[str, Any])
 async def create_exam(
     exam: ExamCreate,
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Create a new exam"""
     try:
@@ -93,7 +93,7 @@ async def create_exam(
 async def update_exam(
     exam_id: str,
     exam: ExamCreate,
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Update an exam"""
     try:
@@ -114,7 +114,7 @@ async def update_exam(
 @router.delete("/{exam_id}")
 async def delete_exam(
     exam_id: str,
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Delete an exam"""
     try:
@@ -7,14 +7,14 @@ from typing import Dict, Any
 from fastapi import APIRouter, Depends, HTTPException
 
 from app.sql_database import db
-from app.auth import get_current_user
+from app.user_context import get_current_user_context
 
 
 router = APIRouter(prefix="/api/me", tags=["me"])
 
 
 @router.get("/overview")
-async def get_my_overview(current_user: Dict[str, Any] = Depends(get_current_user)):
+async def get_my_overview(current_user: Dict[str, Any] = Depends(get_current_user_context)):
   """
   Trả về tổng quan hoạt động học tập của user hiện tại dựa trên posts + comments.
   """
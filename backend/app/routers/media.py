@@ -0,0 +1,62 @@
+"""
+Serving uploaded media (/media/...) straight from MEDIA_DIR.
+
+Content-addressed files (/media/cas/...) never change, so they get their
+sha256 as a strong ETag and a one-year immutable Cache-Control. Older
+uuid-named uploads get an ETag from size + mtime and a shorter max-age.
+"""
+import asyncio
+import mimetypes
+import os
+import stat
+
+from fastapi import APIRouter, HTTPException
+
+from app.media import media_file_path, media_store
+from app.utils.file_response import RangeFileResponse
+
+router = APIRouter(prefix="/media", tags=["media"])
+
+MEDIA_CACHE_MAX_AGE = int(os.getenv("MEDIA_CACHE_MAX_AGE", "86400"))
+
+# Python < 3.13 không biết .webp trên một số distro
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("application/vnd.openxmlformats-officedocument.wordprocessingml.document", ".docx")
+
+# Chỉ ảnh và PDF hiển thị inline; loại khác luôn tải xuống (tránh HTML/SVG chạy trên domain API)
+INLINE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif", "application/pdf"}
+
+
+@router.api_route("/{file_path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_media(file_path: str):
+    # file_path đã được decode một lần bởi router: không dùng local_media_path (sẽ unquote lần nữa)
+    path = media_file_path(file_path)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    try:
+        st = await asyncio.to_thread(os.stat, path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not stat.S_ISREG(st.st_mode):
+        raise HTTPException(status_code=404, detail="Not found")
+
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    sha256 = media_store.sha_from_path(path)
+    if sha256:
+        etag = f'"{sha256}"'
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+        cache_control = f"public, max-age={MEDIA_CACHE_MAX_AGE}"
+
+    headers = {"x-content-type-options": "nosniff"}
+    if media_type not in INLINE_TYPES:
+        headers["content-disposition"] = "attachment"
+    return RangeFileResponse(
+        str(path),
+        size=st.st_size,
+        media_type=media_type,
+        etag=etag,
+        cache_control=cache_control,
+        headers=headers,
+    )
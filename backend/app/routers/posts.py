@@ -1,16 +1,21 @@
 """
 Post-related API endpoints
 """
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Body
+from fastapi import APIRouter, HTTPException, Depends, Body
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 from datetime import datetime
+import asyncio
+import logging
 
+from app.job_queue import job_handler, job_queue
+from app.media import InlineMediaError, extract_inline_media, media_store, post_media_urls
 from app.sql_database import db
-from app.auth import get_current_user
+from app.user_context import get_current_user_context
 from app.routers.ai_analysis import run_post_analysis
 
 router = APIRouter(prefix="/api/posts", tags=["posts"])
+logger = logging.getLogger(__name__)
 
 
 class PostCreate(BaseModel):
@@ -199,58 +204,131 @@ async def get_comments(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def _process_post_ai_moderation(post_id: str, post_data: Dict[str, Any]):
-    """Background task: gọi Gemini để phân tích bài và cập nhật metadata AI."""
-    try:
-        content = post_data.get("content")
-        image_url = post_data.get("image_url")
-        image_urls = [image_url] if image_url else []
+POST_MODERATION_JOB = "post_moderation"
+
+
+def enqueue_post_moderation(post_id: str, priority: int = 0) -> int:
+    """Đưa bài vào hàng đợi kiểm duyệt AI (mỗi bài chỉ có một job đang chờ/chạy)."""
+    return job_queue.enqueue(
+        POST_MODERATION_JOB,
+        {"post_id": post_id},
+        priority=priority,
+        dedupe_key=f"{POST_MODERATION_JOB}:{post_id}",
+    )
 
-        result = run_post_analysis(content, image_urls)
 
-        # Chuẩn hóa một số field
-        is_educational = bool(result.get("is_educational", True))
-        moderation_status = result.get("moderation_status") or ("clean" if is_educational else "rejected")
+@job_handler(POST_MODERATION_JOB)
+async def _run_post_moderation_job(payload: Dict[str, Any]) -> None:
+    """Job handler: đọc bài mới nhất từ DB rồi kiểm duyệt (lỗi → job queue retry/dead-letter)."""
+    post_id = payload["post_id"]
+    post = db.read("posts", post_id, use_cache=False)
+    if not post:
+        # Bài đã bị xoá trước khi tới lượt
+        return
+    await _process_post_ai_moderation(post_id, post)
 
-        metadata = result.get("metadata") or {}
-        subject = metadata.get("subject")
-        grade = metadata.get("grade")
-        topic = metadata.get("topic")
-        tags = metadata.get("tags") or []
 
-        # Chuẩn hóa subject đơn giản: bỏ dấu / viết thường (backend hiện tại lưu text thô)
-        if isinstance(subject, str):
-            subject_normalized = subject.strip()
-        else:
-            subject_normalized = None
-
-        updates: Dict[str, Any] = {
-            "isEducational": is_educational,
-            "status": moderation_status,
-            "subject": subject_normalized or post_data.get("subject"),
-            "grade": grade,
-            "topic": topic,
-            "aiTags": tags,
-            "aiModeration": result,
-            "updatedAt": datetime.now().isoformat(),
-        }
+IMAGE_VARIANTS_JOB = "image_variants"
 
-        # Nếu có comment của Anh Thơ thì lưu kèm vào post (sau này UI hiển thị như comment đầu tiên)
-        anh_tho_comment = result.get("anh_tho_comment")
-        if anh_tho_comment:
-            updates["aiComment"] = anh_tho_comment
 
-        db.update("posts", post_id, updates)
-    except Exception as e:
-        # Không làm hỏng request chính; chỉ log
-        print(f"[AI_MODERATION_ERROR] post_id={post_id}: {e}")
+def enqueue_image_variants(post_id: str) -> int:
+    """Sinh ảnh thu nhỏ (srcset) cho các ảnh của bài ở background."""
+    return job_queue.enqueue(
+        IMAGE_VARIANTS_JOB,
+        {"post_id": post_id},
+        dedupe_key=f"{IMAGE_VARIANTS_JOB}:{post_id}",
+    )
+
+
+def _post_image_urls(post: Dict[str, Any]) -> List[str]:
+    return list(post.get("image_urls") or ([post["image_url"]] if post.get("image_url") else []))
+
+
+@job_handler(IMAGE_VARIANTS_JOB)
+async def _run_image_variants_job(payload: Dict[str, Any]) -> None:
+    """Job handler: ghi post["image_variants"] (song song với image_urls) cho feed dùng srcset."""
+    post_id = payload["post_id"]
+    post = db.read("posts", post_id, use_cache=False)
+    if not post:
+        return
+
+    # Ảnh đã có variants (lần chạy trước / retry / ảnh lặp lại) thì dùng lại
+    done = {entry["src"]: entry for entry in post.get("image_variants") or [] if entry}
+    image_variants = []
+    for url in _post_image_urls(post):
+        if url not in done:
+            done[url] = await media_store.image_variants(url)
+        image_variants.append(done[url])
+
+    updates = {"image_variants": image_variants}
+    if not db.update("posts", post_id, updates):
+        # Bài bị xoá trong lúc đang sinh ảnh: variants mới chưa có tham chiếu, gc_media sẽ dọn
+        return
+    # Giữ tham chiếu tới variants mới, trả lại variants của ảnh đã bị thay (image_url cũ)
+    media_store.sync_references(post_media_urls(post), post_media_urls({**post, **updates}))
+
+
+async def _process_post_ai_moderation(post_id: str, post_data: Dict[str, Any]):
+    """Gọi Gemini để phân tích bài và cập nhật metadata AI."""
+    content = post_data.get("content")
+    image_url = post_data.get("image_url")
+    image_urls = [image_url] if image_url else []
+
+    # batch=True: bài chỉ có chữ được gom chung request Gemini với các bài đang chờ khác
+    result = await run_post_analysis(content, image_urls, batch=True)
+
+    # Chuẩn hóa một số field
+    is_educational = bool(result.get("is_educational", True))
+    moderation_status = result.get("moderation_status") or ("clean" if is_educational else "rejected")
+
+    metadata = result.get("metadata") or {}
+    subject = metadata.get("subject")
+    grade = metadata.get("grade")
+    topic = metadata.get("topic")
+    tags = metadata.get("tags") or []
+
+    # Chuẩn hóa subject đơn giản: bỏ dấu / viết thường (backend hiện tại lưu text thô)
+    if isinstance(subject, str):
+        subject_normalized = subject.strip()
+    else:
+        subject_normalized = None
+
+    updates: Dict[str, Any] = {
+        "isEducational": is_educational,
+        "status": moderation_status,
+        "subject": subject_normalized or post_data.get("subject"),
+        "grade": grade,
+        "topic": topic,
+        "aiTags": tags,
+        "aiModeration": result,
+        "updatedAt": datetime.now().isoformat(),
+    }
+
+    # Nếu có comment của Anh Thơ thì lưu kèm vào post (sau này UI hiển thị như comment đầu tiên)
+    anh_tho_comment = result.get("anh_tho_comment")
+    if anh_tho_comment:
+        updates["aiComment"] = anh_tho_comment
+
+    db.update("posts", post_id, updates)
+
+
+async def _extract_inline_media(fields: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        extracted, count = await extract_inline_media(fields)
+    except InlineMediaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if count:
+        logger.info(
+            f"Extracted {count} inline data URI(s) from post payload",
+            extra={"fields": {"event": "inline_media_extracted", "count": count}},
+        )
+    return extracted
 
 
 @router.post("/", response_model=Dict[str, Any])
 async def create_post(
     post: PostCreate,
-    background_tasks: BackgroundTasks,
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Create a new post (AI phân tích chạy bất đồng bộ ở background)."""
     try:
@@ -277,6 +355,14 @@ async def create_post(
         elif post.image_url:
             # Backward compatibility: chuyển image_url cũ thành mảng 1 phần tử
             image_urls_final = [post.image_url]
+
+        # Ảnh/tài liệu base64 (data: URI) → file trong media store, trong post chỉ giữ URL
+        inline = await _extract_inline_media({
+            "content": post.content,
+            "image_urls": image_urls_final,
+            "attachments": post.attachments or [],
+        })
+        image_urls_final = inline["image_urls"]
         
         # Xác định post_type dựa trên media
         post_type_final = post.post_type
@@ -286,7 +372,7 @@ async def create_post(
             post_type_final = "document"
         
         post_data = {
-            "content": post.content,
+            "content": inline["content"],
             "author_id": author_id,
             "author_name": author_name,
             "author_email": author_email,
@@ -297,8 +383,10 @@ async def create_post(
             "image_url": image_urls_final[0] if image_urls_final else None,
             # Mới: mảng ảnh
             "image_urls": image_urls_final,
+            # Ảnh thu nhỏ + srcset, điền bởi job image_variants (None = chưa có)
+            "image_variants": None,
             # Mới: mảng tài liệu
-            "attachments": post.attachments or [],
+            "attachments": inline["attachments"],
             "likes": 0,
             "comments": 0,
             "shares": 0,
@@ -313,11 +401,16 @@ async def create_post(
             "updatedAt": now_iso,
         }
         post_id = db.create("posts", post_data)
+        media_store.acquire(post_media_urls(post_data))
 
-        # Trigger AI moderation ở background, không chặn request
-        background_tasks.add_task(_process_post_ai_moderation, post_id, post_data)
+        # AI moderation chạy qua job queue bền vững (không chặn request, không mất khi restart)
+        await asyncio.to_thread(enqueue_post_moderation, post_id)
+        if image_urls_final:
+            await asyncio.to_thread(enqueue_image_variants, post_id)
 
         return {"id": post_id, **post_data}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -326,11 +419,11 @@ async def create_post(
 async def update_post(
     post_id: str,
     payload: PostUpdate,
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Cập nhật nội dung bài viết (chỉ tác giả hoặc admin/teacher)."""
     try:
-        post = db.read("posts", post_id)
+        post = db.read("posts", post_id, use_cache=False)
         if not post:
             raise HTTPException(status_code=404, detail="Post not found")
 
@@ -358,8 +451,13 @@ async def update_post(
         if not updates:
             return post
 
+        updates = await _extract_inline_media(updates)
         updates["updatedAt"] = datetime.now().isoformat()
         db.update("posts", post_id, updates)
+        media_store.sync_references(post_media_urls(post), post_media_urls({**post, **updates}))
+        if "image_url" in updates and not post.get("image_urls"):
+            # Bài cũ chỉ có image_url: sinh lại variants cho ảnh mới
+            await asyncio.to_thread(enqueue_image_variants, post_id)
 
         updated = db.read("posts", post_id)
         if not updated:
@@ -374,11 +472,11 @@ async def update_post(
 @router.delete("/{post_id}")
 async def delete_post(
     post_id: str,
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Xoá bài viết (chỉ tác giả hoặc admin/teacher)."""
     try:
-        post = db.read("posts", post_id)
+        post = db.read("posts", post_id, use_cache=False)
         if not post:
             raise HTTPException(status_code=404, detail="Post not found")
 
@@ -393,6 +491,7 @@ async def delete_post(
         deleted = db.delete("posts", post_id)
         if not deleted:
             raise HTTPException(status_code=500, detail="Failed to delete post")
+        media_store.release(post_media_urls(post))
 
         return {"message": "Post deleted"}
     except HTTPException:
@@ -405,7 +504,7 @@ async def delete_post(
 async def create_comment(
     post_id: str,
     payload: CommentCreate,
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Tạo comment mới cho một bài viết."""
     try:
@@ -461,7 +560,7 @@ async def create_comment(
 @router.post("/{post_id}/like")
 async def like_post(
     post_id: str,
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Like a post"""
     try:
@@ -485,7 +584,7 @@ async def like_post(
 async def react_to_post(
     post_id: str,
     payload: Dict[str, Any] = Body(...),
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """React to a post với bộ reaction học tập (idea, thinking, resource, motivation)."""
     # Lấy user_id từ body (nếu có) hoặc từ current_user
@@ -570,7 +669,7 @@ async def update_comment(
     post_id: str,
     comment_id: str,
     payload: CommentUpdate,
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Sửa nội dung comment (chỉ tác giả)."""
     try:
@@ -617,7 +716,7 @@ async def update_comment(
 async def delete_comment(
     post_id: str,
     comment_id: str,
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Xoá comment (tác giả hoặc admin/teacher)."""
     try:
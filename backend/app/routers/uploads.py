@@ -4,36 +4,30 @@ Lưu tạm trên Cloud VM cho dự thi
 """
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
 from typing import Dict, Any
-import os
-import uuid
+import asyncio
 from pathlib import Path
 from datetime import datetime
 
-from app.auth import get_current_user
+from app.media import (
+    ALLOWED_DOC_TYPES,
+    ALLOWED_IMAGE_TYPES,
+    MAX_DOC_UPLOAD_BYTES,
+    MAX_IMAGE_UPLOAD_BYTES,
+    UploadTooLarge,
+    media_store,
+    stage_upload,
+    store_image,
+)
+from app.utils.image_processing import PILLOW_AVAILABLE, InvalidImage
+from app.user_context import get_current_user_context
 
 router = APIRouter(prefix="/api/uploads", tags=["uploads"])
 
-# Thư mục lưu file trên VM (tạo nếu chưa có)
-MEDIA_DIR = Path("media")
-MEDIA_DIR.mkdir(exist_ok=True)
-IMAGES_DIR = MEDIA_DIR / "images"
-IMAGES_DIR.mkdir(exist_ok=True)
-DOCS_DIR = MEDIA_DIR / "docs"
-DOCS_DIR.mkdir(exist_ok=True)
-
-# Allowed file types
-ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
-ALLOWED_DOC_TYPES = {
-    "application/pdf",
-    "application/msword",
-    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-}
-
 
 @router.post("/doc")
 async def upload_document(
     file: UploadFile = File(...),
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """
     Upload tài liệu (PDF/Word) lên VM.
@@ -46,27 +40,25 @@ async def upload_document(
         )
 
     try:
-        # Tạo tên file unique
-        file_ext = Path(file.filename or "file").suffix or ".pdf"
-        file_id = str(uuid.uuid4())
-        file_name = f"{file_id}{file_ext}"
-        file_path = DOCS_DIR / file_name
-
-        # Lưu file
-        content = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
-
-        file_size = len(content)
+        # Ghi từng chunk ra file tạm (không giữ cả file trong RAM), hash trong lúc ghi;
+        # file trùng nội dung (cùng sha256) dùng lại file/URL đã có
+        staged = await stage_upload(file, MAX_DOC_UPLOAD_BYTES)
+        stored = await media_store.put_staged(
+            staged, file.content_type, fallback_ext=Path(file.filename or "file").suffix or ".pdf"
+        )
 
         # Trả về metadata
         return {
-            "url": f"/media/docs/{file_name}",  # URL tương đối, frontend sẽ ghép với API_BASE_URL
-            "file_name": file.filename or file_name,
-            "file_type": file.content_type,
-            "file_size": file_size,
+            "url": stored.url,  # URL tương đối, frontend sẽ ghép với API_BASE_URL
+            "file_name": file.filename or Path(stored.url).name,
+            "file_type": stored.mime_type,
+            "file_size": stored.size,
+            "sha256": stored.sha256,
+            "deduplicated": stored.deduplicated,
             "uploaded_at": datetime.now().isoformat(),
         }
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi upload tài liệu: {str(e)}")
 
@@ -74,11 +66,11 @@ async def upload_document(
 @router.post("/image")
 async def upload_image(
     file: UploadFile = File(...),
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """
     Upload ảnh lên VM (backup nếu frontend không nén được).
-    Khuyến khích frontend nén WebP trước khi gửi base64 vào post.
+    (Ảnh base64 gửi kèm post cũng được tách ra media store, xem posts.create_post.)
     """
     if not file.content_type or file.content_type not in ALLOWED_IMAGE_TYPES:
         raise HTTPException(
@@ -87,24 +79,34 @@ async def upload_image(
         )
 
     try:
-        file_ext = Path(file.filename or "image").suffix or ".jpg"
-        file_id = str(uuid.uuid4())
-        file_name = f"{file_id}{file_ext}"
-        file_path = IMAGES_DIR / file_name
-
-        content = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
-
-        file_size = len(content)
+        staged = await stage_upload(file, MAX_IMAGE_UPLOAD_BYTES)
+        fallback_ext = Path(file.filename or "image").suffix or ".jpg"
+        if PILLOW_AVAILABLE:
+            try:
+                content = await asyncio.to_thread(staged.path.read_bytes)
+            finally:
+                staged.discard()
+            # Xoay theo EXIF, bỏ EXIF (GPS...), thu nhỏ về IMAGE_MAX_EDGE và nén WebP/JPEG.
+            # Ảnh trùng → kết quả lấy từ cache xử lý (theo hash ảnh gốc) và trùng luôn sha256 lưu trữ
+            try:
+                stored = await store_image(content, file.content_type, fallback_ext=fallback_ext)
+            except InvalidImage:
+                raise HTTPException(status_code=400, detail="File ảnh bị lỗi hoặc không đọc được")
+        else:
+            stored = await media_store.put_staged(staged, file.content_type, fallback_ext=fallback_ext)
 
         return {
-            "url": f"/media/images/{file_name}",
-            "file_name": file.filename or file_name,
-            "file_type": file.content_type,
-            "file_size": file_size,
+            "url": stored.url,
+            "file_name": file.filename or Path(stored.url).name,
+            "file_type": stored.mime_type,
+            "file_size": stored.size,
+            "sha256": stored.sha256,
+            "deduplicated": stored.deduplicated,
             "uploaded_at": datetime.now().isoformat(),
         }
+    except HTTPException:
+        raise
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi upload ảnh: {str(e)}")
-
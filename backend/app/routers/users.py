@@ -8,16 +8,20 @@ from pydantic import BaseModel
 from datetime import datetime
 
 from app.sql_database import db
-from app.auth import get_current_user
+from app.user_context import get_current_user_context, invalidate_user_profile
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
+# Role trong DB quyết định phân quyền: tự tạo/tự sửa profile chỉ được là student,
+# mọi thay đổi role khác phải qua PUT /{user_id}/role (admin)
+DEFAULT_ROLE = "student"
+
 
 class UserCreate(BaseModel):
     uid: str
     email: str
     name: Optional[str] = None
-    role: str = "student"
+    role: str = DEFAULT_ROLE  # Bỏ qua: user mới luôn là student
     photo_url: Optional[str] = None
 
 
@@ -40,7 +44,7 @@ class UserResponse(BaseModel):
 
 @router.get("/me", response_model=Dict[str, Any])
 async def get_current_user_info(
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Lấy thông tin user hiện tại từ Firebase token và database."""
     try:
@@ -48,13 +52,13 @@ async def get_current_user_info(
         if not uid:
             raise HTTPException(status_code=401, detail="Unauthenticated: Missing UID")
 
-        # Tìm user trong database
-        users = db.query("users", filters=[("uid", "==", uid)], limit=1)
-        if users:
-            user_data = dict(users[0])
+        # Profile đã được nạp theo primary key (doc_id = uid) bởi get_current_user_context
+        profile = current_user.get("profile")
+        if profile:
+            user_data = dict(profile)
             user_data.pop("id", None)
             return {
-                "id": users[0].get("id"),
+                "id": profile.get("id"),
                 "uid": uid,
                 "email": current_user.get("email", ""),
                 "name": user_data.get("name") or current_user.get("name") or current_user.get("email", ""),
@@ -76,6 +80,7 @@ async def get_current_user_info(
             "updatedAt": now_iso,
         }
         user_id = db.create("users", user_data, doc_id=uid)
+        invalidate_user_profile(uid)
 
         return {
             "id": user_id,
@@ -93,7 +98,7 @@ async def get_current_user_info(
 @router.post("/", response_model=UserResponse)
 async def create_user(
     user: UserCreate,
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Tạo user mới trong database (tự động khi đăng nhập lần đầu)."""
     try:
@@ -111,19 +116,20 @@ async def create_user(
             "uid": user.uid,
             "email": user.email,
             "name": user.name or user.email,
-            "role": user.role,
+            "role": DEFAULT_ROLE,
             "photo_url": user.photo_url,
             "createdAt": now_iso,
             "updatedAt": now_iso,
         }
         user_id = db.create("users", user_data, doc_id=user.uid)
+        invalidate_user_profile(user.uid)
 
         return UserResponse(
             id=user_id,
             uid=user.uid,
             email=user.email,
             name=user.name,
-            role=user.role,
+            role=DEFAULT_ROLE,
             photo_url=user.photo_url,
             created_at=now_iso,
             updated_at=now_iso,
@@ -137,7 +143,7 @@ async def create_user(
 @router.put("/me", response_model=Dict[str, Any])
 async def update_current_user(
     payload: UserUpdate,
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Cập nhật thông tin user hiện tại."""
     try:
@@ -145,7 +151,11 @@ async def update_current_user(
         if not uid:
             raise HTTPException(status_code=401, detail="Unauthenticated")
 
-        user = db.read("users", uid)
+        # Role trong DB là role dùng cho phân quyền → chỉ được giữ nguyên role hiện tại hoặc về student
+        if payload.role is not None and payload.role not in (DEFAULT_ROLE, current_user.get("role")):
+            raise HTTPException(status_code=403, detail="Role can only be changed by an admin")
+
+        user = current_user.get("profile")
         if not user:
             # Tạo user nếu chưa có
             now_iso = datetime.now().isoformat()
@@ -153,12 +163,13 @@ async def update_current_user(
                 "uid": uid,
                 "email": current_user.get("email", ""),
                 "name": payload.name or current_user.get("name") or current_user.get("email", ""),
-                "role": payload.role or "student",
+                "role": DEFAULT_ROLE,
                 "photo_url": payload.photo_url or current_user.get("picture"),
                 "createdAt": now_iso,
                 "updatedAt": now_iso,
             }
             user_id = db.create("users", user_data, doc_id=uid)
+            invalidate_user_profile(uid)
             return {"id": user_id, **user_data}
 
         updates: Dict[str, Any] = {}
@@ -174,6 +185,7 @@ async def update_current_user(
 
         updates["updatedAt"] = datetime.now().isoformat()
         db.update("users", uid, updates)
+        invalidate_user_profile(uid)
 
         updated = db.read("users", uid)
         if not updated:
@@ -205,7 +217,7 @@ async def list_users(
     offset: int = 0,
     search: Optional[str] = None,
     role: Optional[str] = None,
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Lấy danh sách users (chỉ admin)."""
     try:
@@ -240,7 +252,7 @@ async def list_users(
 async def update_user_role(
     user_id: str,
     payload: Dict[str, str] = Body(...),
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Cập nhật role của user (chỉ admin)."""
     try:
@@ -260,6 +272,7 @@ async def update_user_role(
             "role": new_role,
             "updatedAt": datetime.now().isoformat()
         })
+        invalidate_user_profile(user_id)
         
         updated = db.read("users", user_id)
         return updated
@@ -272,7 +285,7 @@ async def update_user_role(
 @router.delete("/{user_id}")
 async def delete_user(
     user_id: str,
-    current_user: Dict[str, Any] = Depends(get_current_user),
+    current_user: Dict[str, Any] = Depends(get_current_user_context),
 ):
     """Xóa user (chỉ admin)."""
     try:
@@ -291,6 +304,7 @@ async def delete_user(
         deleted = db.delete("users", user_id)
         if not deleted:
             raise HTTPException(status_code=500, detail="Failed to delete user")
+        invalidate_user_profile(user_id)
         
         return {"message": "User deleted successfully"}
     except HTTPException:
@@ -20,14 +20,15 @@ from sqlalchemy import (
 )
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
 
+from app.utils.doc_compression import DICT_COLLECTION, document_codec
+
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Engine/schema are only created when this fallback is actually used
+# (normally app.sql_database_enhanced provides `db`)
+engine = None
+SessionLocal = None
 
 Base = declarative_base()
 
@@ -47,28 +48,52 @@ class CollectionDocument(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
-Base.metadata.create_all(bind=engine)
+def _get_engine():
+    """Create the engine and schema on first use."""
+    global engine, SessionLocal
+    if engine is None:
+        engine = create_engine(
+            DATABASE_URL,
+            connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
+        )
+        Base.metadata.create_all(bind=engine)
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return engine
 
 
 class SQLDatabase:
     """Firestore-like wrapper on top of SQLAlchemy."""
 
     def __init__(self):
-        self.engine = engine
+        self.engine = None
+        document_codec.dictionary_loader = self._load_compression_dicts
+
+    def init_schema(self) -> None:
+        """Connect and create tables (idempotent)."""
+        self.engine = _get_engine()
 
     def _get_session(self) -> Session:
+        if self.engine is None:
+            self.init_schema()
         return SessionLocal()
 
     # Basic helpers
     def _load_data(self, row: CollectionDocument) -> Dict[str, Any]:
         try:
-            payload = json.loads(row.data) if row.data else {}
-        except Exception:
+            payload = document_codec.decode(row.data)
+        except json.JSONDecodeError:
             payload = {}
         return {"id": row.id, **payload}
 
-    def _dump_data(self, data: Dict[str, Any]) -> str:
-        return json.dumps(data or {})
+    def _dump_data(self, data: Dict[str, Any], collection_name: Optional[str] = None) -> str:
+        return document_codec.encode(collection_name, data)
+
+    def _load_compression_dicts(self) -> List[Dict[str, Any]]:
+        with self._get_session() as session:
+            rows = session.scalars(
+                select(CollectionDocument).where(CollectionDocument.collection == DICT_COLLECTION)
+            ).all()
+            return [{"id": row.id, **json.loads(row.data)} for row in rows]
 
     # Public API – compatible with previous FirestoreDB where possible
 
@@ -100,7 +125,7 @@ class SQLDatabase:
         row = CollectionDocument(
             id=doc_id,
             collection=collection_name,
-            data=self._dump_data(data),
+            data=self._dump_data(data, collection_name),
         )
 
         with self._get_session() as session:
@@ -109,8 +134,8 @@ class SQLDatabase:
 
         return doc_id
 
-    def read(self, collection_name: str, doc_id: str) -> Optional[Dict[str, Any]]:
-        """Read a document by ID."""
+    def read(self, collection_name: str, doc_id: str, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+        """Read a document by ID (use_cache: accepted for EnhancedSQLDatabase compatibility, nothing is cached here)."""
         with self._get_session() as session:
             stmt = (
                 select(CollectionDocument)
@@ -145,7 +170,7 @@ class SQLDatabase:
             existing.update(data or {})
             existing["updatedAt"] = datetime.utcnow().isoformat()
 
-            row.data = self._dump_data(existing)
+            row.data = self._dump_data(existing, collection_name)
             row.updated_at = datetime.utcnow()
             session.add(row)
             session.commit()
@@ -175,9 +200,10 @@ class SQLDatabase:
         filters: Optional[List[Tuple[str, str, Any]]] = None,
         order_by: Optional[str] = None,
         limit: Optional[int] = None,
+        use_cache: bool = True,
     ) -> List[Dict[str, Any]]:
         """
-        Query documents with simple filters.
+        Query documents with simple filters (use_cache is ignored, as in read()).
         Supported operators: ==, !=, <, <=, >, >=
         (on top-level fields inside the JSON document).
         """
@@ -218,6 +244,11 @@ class SQLDatabase:
         """Get all documents from a collection."""
         return self.query(collection_name)
 
+    def list_collections(self) -> List[str]:
+        """Names of all collections that have documents."""
+        with self._get_session() as session:
+            return sorted(session.scalars(select(CollectionDocument.collection).distinct()).all())
+
     def health_check(self) -> bool:
         """Simple health check – try to open a session and run a trivial query."""
         try:
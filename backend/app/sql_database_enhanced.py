@@ -6,10 +6,13 @@ Enhanced SQL Database with advanced features for large-scale data management:
 - Caching
 - Batch operations
 - Full-text search
+- Typed tables for hot collections (posts, comments, users)
 """
 import os
 import json
 import hashlib
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List, Tuple
 from uuid import uuid4
@@ -21,6 +24,7 @@ from sqlalchemy import (
     Column,
     String,
     DateTime,
+    Integer,
     Text,
     Index,
     select,
@@ -35,11 +39,23 @@ from sqlalchemy.orm import declarative_base, sessionmaker, Session
 from sqlalchemy.pool import QueuePool, StaticPool
 from sqlalchemy.engine import Engine
 
+from app.utils.doc_compression import DICT_COLLECTION, document_codec
+from app.utils.metrics import CACHE_REQUESTS_TOTAL
+from app.utils.request_context import record_cache
+from app.utils.slow_query_log import install_query_instrumentation, slow_query_log
+
 # Simple in-memory cache (can be replaced with Redis)
 _cache: OrderedDict = OrderedDict()
 _cache_max_size = 1000
 _cache_ttl = 300  # 5 minutes
 
+# Collection có nhãn riêng trên CACHE_REQUESTS_TOTAL. Tên collection còn lại (vd lấy từ
+# path /api/collections/{name}) gộp vào "other" để không sinh vô hạn label series.
+METRIC_COLLECTIONS = frozenset({
+    "posts", "comments", "users", "documents", "exams", "ai_chat_logs", "ai_analysis_cache",
+    "media_objects", "compression_dicts", "typed_table_state",
+})
+
 
 def _get_cache_key(collection: str, doc_id: Optional[str] = None, query_hash: Optional[str] = None) -> str:
     """Generate cache key"""
@@ -50,16 +66,27 @@ def _get_cache_key(collection: str, doc_id: Optional[str] = None, query_hash: Op
     return f"{collection}:all"
 
 
+def _record_cache_lookup(key: str, hit: bool):
+    """Count a cache lookup for the current request and for /metrics"""
+    record_cache(hit=hit)
+    collection = key.split(":", 1)[0]
+    label = collection if collection in METRIC_COLLECTIONS else "other"
+    CACHE_REQUESTS_TOTAL.labels(collection=label, result="hit" if hit else "miss").inc()
+
+
 def _get_from_cache(key: str) -> Optional[Any]:
     """Get from cache with TTL check"""
     if key not in _cache:
+        _record_cache_lookup(key, hit=False)
         return None
     value, timestamp = _cache[key]
     if datetime.now() - timestamp > timedelta(seconds=_cache_ttl):
         _cache.pop(key, None)
+        _record_cache_lookup(key, hit=False)
         return None
     # Move to end (LRU)
     _cache.move_to_end(key)
+    _record_cache_lookup(key, hit=True)
     return value
 
 
@@ -110,6 +137,9 @@ else:
         echo=os.getenv("SQL_ECHO", "false").lower() == "true",
     )
 
+# Time every statement; slow ones land in the slow-query log (/api/admin/slow-queries)
+install_query_instrumentation(engine, slow_query_log)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -136,6 +166,157 @@ class CollectionDocument(Base):
     )
 
 
+# ==================== Typed tables ====================
+# Hot collections get their own table: the full document is still stored in
+# `data` (same encoding as collection_documents), and the fields that are
+# filtered/sorted on are copied into real, indexed columns (PROMOTED maps
+# document field -> column attribute).
+
+
+class TypedPost(Base):
+    __tablename__ = "typed_posts"
+
+    PROMOTED = {
+        "author_id": "author_id",
+        "subject": "subject",
+        "status": "status",
+        "post_type": "post_type",
+        "likes": "likes",
+        "comments": "comment_count",
+        "createdAt": "created_iso",
+        "updatedAt": "updated_iso",
+    }
+
+    id = Column(String, primary_key=True)
+    author_id = Column(String)
+    subject = Column(String)
+    status = Column(String)
+    post_type = Column(String)
+    likes = Column(Integer)
+    comment_count = Column(Integer)
+    created_iso = Column(String)
+    updated_iso = Column(String)
+    data = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        Index("idx_typed_posts_status_created", "status", "created_iso"),
+        Index("idx_typed_posts_subject_created", "subject", "created_iso"),
+        Index("idx_typed_posts_author_created", "author_id", "created_iso"),
+    )
+
+
+class TypedComment(Base):
+    __tablename__ = "typed_comments"
+
+    PROMOTED = {
+        "post_id": "post_id",
+        "author_id": "author_id",
+        "createdAt": "created_iso",
+        "updatedAt": "updated_iso",
+    }
+
+    id = Column(String, primary_key=True)
+    post_id = Column(String)
+    author_id = Column(String)
+    created_iso = Column(String)
+    updated_iso = Column(String)
+    data = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        Index("idx_typed_comments_post_created", "post_id", "created_iso"),
+        Index("idx_typed_comments_author_created", "author_id", "created_iso"),
+    )
+
+
+class TypedUser(Base):
+    __tablename__ = "typed_users"
+
+    PROMOTED = {
+        "uid": "uid",
+        "email": "email",
+        "role": "role",
+        "createdAt": "created_iso",
+        "updatedAt": "updated_iso",
+    }
+
+    id = Column(String, primary_key=True)
+    uid = Column(String, index=True)
+    email = Column(String, index=True)
+    role = Column(String, index=True)
+    created_iso = Column(String)
+    updated_iso = Column(String)
+    data = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+
+TYPED_MODELS = {
+    "posts": TypedPost,
+    "comments": TypedComment,
+    "users": TypedUser,
+}
+
+# Migration mode per typed collection:
+#   generic    - chỉ collection_documents (mặc định)
+#   dual_write - đọc generic, ghi cả hai bảng trong cùng transaction (backfill + verify ở mode này)
+#   typed      - đọc typed, vẫn ghi cả hai (process chưa thấy mode mới vẫn đúng; rollback được)
+#   typed_only - chỉ bảng typed
+TYPED_MODES = ("generic", "dual_write", "typed", "typed_only")
+# Mode lưu trong collection này (scripts/migrate_typed_tables.py đổi mode, các process tự đọc lại)
+TYPED_STATE_COLLECTION = "typed_table_state"
+DB_TYPED_MODE_REFRESH = int(os.getenv("DB_TYPED_MODE_REFRESH", "30"))
+
+
+def _parse_typed_modes(value: str) -> Dict[str, str]:
+    """'typed' (every typed collection) or 'posts=typed,users=dual_write'."""
+    modes: Dict[str, str] = {}
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        collection, sep, mode = part.rpartition("=")
+        mode = mode.strip().lower()
+        if mode not in TYPED_MODES or (sep and collection.strip() not in TYPED_MODELS):
+            raise ValueError(f"Invalid DB_TYPED_MODE entry: {part!r}")
+        for name in [collection.strip()] if sep else TYPED_MODELS:
+            modes[name] = mode
+    return modes
+
+
+# Ghi đè mode lưu trong DB (rỗng = dùng mode trong DB)
+DB_TYPED_MODE = _parse_typed_modes(os.getenv("DB_TYPED_MODE", ""))
+
+
+def _column_value(column, value: Any) -> Any:
+    """Document value -> value stored in (or compared against) a promoted column."""
+    if value is None:
+        return None
+    if isinstance(column.type, Integer):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def _json_value(value: Any) -> Any:
+    """Document value -> what json_extract() returns for it (SQL scalar, or minified JSON text)."""
+    if isinstance(value, bool):
+        return int(value)
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def _promoted_column(model, field: str):
+    attr = getattr(model, "PROMOTED", {}).get(field)
+    return getattr(model, attr) if attr else None
+
+
 # Create indexes on startup
 @event.listens_for(Engine, "connect")
 def set_sqlite_pragma(dbapi_conn, connection_record):
@@ -150,7 +331,22 @@ def set_sqlite_pragma(dbapi_conn, connection_record):
         cursor.close()
 
 
-Base.metadata.create_all(bind=engine)
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def init_schema() -> None:
+    """
+    Create tables/indexes (idempotent). Called from the app lifespan; scripts
+    get it implicitly on their first session.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            Base.metadata.create_all(bind=engine)
+            _schema_ready = True
 
 
 class EnhancedSQLDatabase:
@@ -161,33 +357,171 @@ class EnhancedSQLDatabase:
     - Caching
     - Batch operations
     - Full-text search
+    - Typed tables for hot collections (see TYPED_MODES)
     """
 
     def __init__(self):
         self.engine = engine
         self._session_factory = SessionLocal
+        document_codec.dictionary_loader = self._load_compression_dicts
+        self._typed_modes: Dict[str, str] = {}
+        self._typed_modes_loaded_at = float("-inf")
+        self._typed_lock = threading.Lock()
+
+    def init_schema(self) -> None:
+        """Connect and create tables (idempotent)."""
+        init_schema()
 
     def _get_session(self) -> Session:
         """Get database session from pool"""
+        if not _schema_ready:
+            init_schema()
         return self._session_factory()
 
-    def _load_data(self, row: CollectionDocument) -> Dict[str, Any]:
-        """Load JSON data from row"""
+    def _load_data(self, row) -> Dict[str, Any]:
+        """Load JSON data from row (compressed fields are expanded)"""
         try:
-            payload = json.loads(row.data) if row.data else {}
-        except Exception:
+            payload = document_codec.decode(row.data)
+        except json.JSONDecodeError:
             payload = {}
         return {"id": row.id, **payload}
 
-    def _dump_data(self, data: Dict[str, Any]) -> str:
-        """Dump data to JSON string"""
-        return json.dumps(data or {})
+    def _dump_data(self, data: Dict[str, Any], collection_name: Optional[str] = None) -> str:
+        """Dump data to JSON string (large fields compressed for opted-in collections)"""
+        return document_codec.encode(collection_name, data)
+
+    def _load_compression_dicts(self) -> List[Dict[str, Any]]:
+        with self._get_session() as session:
+            rows = session.scalars(
+                select(CollectionDocument).where(CollectionDocument.collection == DICT_COLLECTION)
+            ).all()
+            return [{"id": row.id, **json.loads(row.data)} for row in rows]
 
     def _hash_query(self, collection: str, filters: Optional[List], order_by: Optional[str], limit: Optional[int]) -> str:
         """Generate hash for query caching"""
         query_str = f"{collection}:{filters}:{order_by}:{limit}"
         return hashlib.md5(query_str.encode()).hexdigest()
 
+    # ==================== Store routing ====================
+
+    def typed_mode(self, collection_name: str) -> str:
+        """Migration mode of a collection ('generic' for collections without a typed table)."""
+        if collection_name not in TYPED_MODELS:
+            return "generic"
+        if collection_name in DB_TYPED_MODE:
+            return DB_TYPED_MODE[collection_name]
+        if time.monotonic() - self._typed_modes_loaded_at >= DB_TYPED_MODE_REFRESH:
+            self._refresh_typed_modes()
+        return self._typed_modes.get(collection_name, "generic")
+
+    def _refresh_typed_modes(self) -> None:
+        with self._typed_lock:
+            if time.monotonic() - self._typed_modes_loaded_at < DB_TYPED_MODE_REFRESH:
+                return
+            with self._get_session() as session:
+                rows = session.scalars(
+                    select(CollectionDocument).where(CollectionDocument.collection == TYPED_STATE_COLLECTION)
+                ).all()
+                states = [json.loads(row.data) for row in rows]
+            self._typed_modes = {state["collection"]: state["mode"] for state in states}
+            self._typed_modes_loaded_at = time.monotonic()
+
+    def set_typed_mode(self, collection_name: str, mode: str) -> None:
+        """Persist the migration mode; other processes pick it up within DB_TYPED_MODE_REFRESH seconds."""
+        if collection_name not in TYPED_MODELS or mode not in TYPED_MODES:
+            raise ValueError(f"Invalid typed mode {collection_name}={mode}")
+        state_id = f"typed-{collection_name}"
+        state = {"collection": collection_name, "mode": mode, "changedAt": datetime.utcnow().isoformat()}
+        if not self.update(TYPED_STATE_COLLECTION, state_id, state):
+            self.create(TYPED_STATE_COLLECTION, state, doc_id=state_id)
+        with self._typed_lock:
+            self._typed_modes[collection_name] = mode
+        _clear_cache(collection_name)
+
+    def _stores(self, collection_name: str) -> list:
+        """Tables a collection is written to; the first one is read from."""
+        typed = TYPED_MODELS.get(collection_name)
+        return {
+            "generic": [CollectionDocument],
+            "dual_write": [CollectionDocument, typed],
+            "typed": [typed, CollectionDocument],
+            "typed_only": [typed],
+        }[self.typed_mode(collection_name)]
+
+    def _select(self, model, collection_name: str, *entities):
+        stmt = select(*entities) if entities else select(model)
+        if model is CollectionDocument:
+            stmt = stmt.where(CollectionDocument.collection == collection_name)
+        return stmt
+
+    def _get_row(self, session: Session, model, collection_name: str, doc_id: str):
+        return session.scalar(self._select(model, collection_name).where(model.id == doc_id).limit(1))
+
+    def _page(self, session: Session, model, collection_name: str, after_id: str, limit: int) -> list:
+        """Rows with id > after_id, by id (keyset pagination for scans)."""
+        return session.scalars(
+            self._select(model, collection_name).where(model.id > after_id).order_by(model.id).limit(limit)
+        ).all()
+
+    def _write_row(
+        self,
+        session: Session,
+        model,
+        collection_name: str,
+        doc_id: str,
+        data: Dict[str, Any],
+        payload: str,
+        row=None,
+        created_at: Optional[datetime] = None,
+        updated_at: Optional[datetime] = None,
+    ):
+        """Insert (row=None) or overwrite a row of `model` with an encoded document."""
+        if row is None:
+            row = model(id=doc_id, created_at=created_at or datetime.utcnow())
+            if model is CollectionDocument:
+                row.collection = collection_name
+        row.data = payload
+        for field, attr in getattr(model, "PROMOTED", {}).items():
+            setattr(row, attr, _column_value(getattr(model, attr), data.get(field)))
+        row.updated_at = updated_at or datetime.utcnow()
+        session.add(row)
+        return row
+
+    def _filter_conditions(self, model, filters: Optional[List[Tuple[str, str, Any]]]) -> list:
+        conditions = []
+        for field, operator, value in filters or []:
+            # Cột thật hoặc json_extract đều so sánh với giá trị SQL gốc, nên đọc từ bảng
+            # typed hay collection_documents cho cùng kết quả (field thiếu = NULL, khác mọi giá trị)
+            col = _promoted_column(model, field)
+            if col is not None:
+                def convert(v, col=col):
+                    return _column_value(col, v)
+            else:
+                json_path = f"$.{field}"
+                col = func.json_extract(model.data, json_path)
+                convert = _json_value
+
+            if operator == "==":
+                conditions.append(col == convert(value))
+            elif operator == "!=":
+                conditions.append(or_(col != convert(value), col.is_(None)))
+            elif operator == "<":
+                conditions.append(col < convert(value))
+            elif operator == "<=":
+                conditions.append(col <= convert(value))
+            elif operator == ">":
+                conditions.append(col > convert(value))
+            elif operator == ">=":
+                conditions.append(col >= convert(value))
+            elif operator == "in":
+                # IN operator for arrays
+                if isinstance(value, list):
+                    conditions.append(col.in_([convert(v) for v in value]))
+            elif operator == "contains":
+                # Contains operator for strings
+                conditions.append(col.contains(str(value)))
+        return conditions
+
     # ==================== CRUD Operations ====================
 
     def create(
@@ -204,15 +538,12 @@ class EnhancedSQLDatabase:
         data = dict(data or {})
         data.setdefault("createdAt", now_iso)
         data.setdefault("updatedAt", now_iso)
-
-        row = CollectionDocument(
-            id=doc_id,
-            collection=collection_name,
-            data=self._dump_data(data),
-        )
+        payload = self._dump_data(data, collection_name)
+        now = datetime.utcnow()
 
         with self._get_session() as session:
-            session.add(row)
+            for model in self._stores(collection_name):
+                self._write_row(session, model, collection_name, doc_id, data, payload, created_at=now, updated_at=now)
             session.commit()
 
         # Invalidate cache
@@ -229,17 +560,7 @@ class EnhancedSQLDatabase:
                 return cached
 
         with self._get_session() as session:
-            stmt = (
-                select(CollectionDocument)
-                .where(
-                    and_(
-                        CollectionDocument.collection == collection_name,
-                        CollectionDocument.id == doc_id,
-                    )
-                )
-                .limit(1)
-            )
-            row = session.scalar(stmt)
+            row = self._get_row(session, self._stores(collection_name)[0], collection_name, doc_id)
             if not row:
                 return None
             
@@ -248,31 +569,38 @@ class EnhancedSQLDatabase:
                 _set_cache(cache_key, result)
             return result
 
+    def _update_in_session(
+        self,
+        session: Session,
+        collection_name: str,
+        doc_id: str,
+        data: Dict[str, Any],
+        now_iso: str,
+    ) -> bool:
+        """Merge `data` into the document read from the primary store, write it to every store."""
+        stores = self._stores(collection_name)
+        row = self._get_row(session, stores[0], collection_name, doc_id)
+        if not row:
+            return False
+
+        existing = self._load_data(row)
+        existing.pop("id", None)
+        existing.update(data or {})
+        existing["updatedAt"] = now_iso
+        payload = self._dump_data(existing, collection_name)
+
+        self._write_row(session, stores[0], collection_name, doc_id, existing, payload, row)
+        for model in stores[1:]:
+            # Bản sao chưa được backfill thì tạo luôn (giữ created_at của bản chính)
+            mirror = self._get_row(session, model, collection_name, doc_id)
+            self._write_row(session, model, collection_name, doc_id, existing, payload, mirror, created_at=row.created_at)
+        return True
+
     def update(self, collection_name: str, doc_id: str, data: Dict[str, Any]) -> bool:
         """Update document with cache invalidation"""
         with self._get_session() as session:
-            stmt = (
-                select(CollectionDocument)
-                .where(
-                    and_(
-                        CollectionDocument.collection == collection_name,
-                        CollectionDocument.id == doc_id,
-                    )
-                )
-                .limit(1)
-            )
-            row = session.scalar(stmt)
-            if not row:
+            if not self._update_in_session(session, collection_name, doc_id, data, datetime.utcnow().isoformat()):
                 return False
-
-            existing = self._load_data(row)
-            existing.pop("id", None)
-            existing.update(data or {})
-            existing["updatedAt"] = datetime.utcnow().isoformat()
-
-            row.data = self._dump_data(existing)
-            row.updated_at = datetime.utcnow()
-            session.add(row)
             session.commit()
 
         # Invalidate cache
@@ -281,21 +609,14 @@ class EnhancedSQLDatabase:
 
     def delete(self, collection_name: str, doc_id: str) -> bool:
         """Delete document with cache invalidation"""
+        stores = self._stores(collection_name)
         with self._get_session() as session:
-            stmt = (
-                select(CollectionDocument)
-                .where(
-                    and_(
-                        CollectionDocument.collection == collection_name,
-                        CollectionDocument.id == doc_id,
-                    )
-                )
-                .limit(1)
-            )
-            row = session.scalar(stmt)
-            if not row:
+            rows = [self._get_row(session, model, collection_name, doc_id) for model in stores]
+            if not rows[0]:
                 return False
-            session.delete(row)
+            for row in rows:
+                if row is not None:
+                    session.delete(row)
             session.commit()
 
         # Invalidate cache
@@ -315,6 +636,7 @@ class EnhancedSQLDatabase:
     ) -> List[Dict[str, Any]]:
         """
         Optimized query with caching and better pagination.
+        On typed tables, promoted fields are filtered/sorted on indexed columns.
         """
         # Check cache for queries
         if use_cache and limit and limit <= 100:  # Only cache small queries
@@ -324,45 +646,21 @@ class EnhancedSQLDatabase:
             if cached is not None:
                 return cached
 
+        model = self._stores(collection_name)[0]
         with self._get_session() as session:
-            stmt = select(CollectionDocument).where(
-                CollectionDocument.collection == collection_name
-            )
+            stmt = self._select(model, collection_name)
 
-            # Apply filters with optimized JSON extraction
-            if filters:
-                conditions = []
-                for field, operator, value in filters:
-                    json_path = f"$.{field}"
-                    col = func.json_extract(CollectionDocument.data, json_path)
-
-                    if operator == "==":
-                        conditions.append(col == json.dumps(value))
-                    elif operator == "!=":
-                        conditions.append(col != json.dumps(value))
-                    elif operator == "<":
-                        conditions.append(col < json.dumps(value))
-                    elif operator == "<=":
-                        conditions.append(col <= json.dumps(value))
-                    elif operator == ">":
-                        conditions.append(col > json.dumps(value))
-                    elif operator == ">=":
-                        conditions.append(col >= json.dumps(value))
-                    elif operator == "in":
-                        # IN operator for arrays
-                        if isinstance(value, list):
-                            conditions.append(col.in_([json.dumps(v) for v in value]))
-                    elif operator == "contains":
-                        # Contains operator for strings
-                        conditions.append(col.contains(str(value)))
-
-                if conditions:
-                    stmt = stmt.where(and_(*conditions))
+            # Apply filters (real columns on typed tables, JSON extraction otherwise)
+            conditions = self._filter_conditions(model, filters)
+            if conditions:
+                stmt = stmt.where(and_(*conditions))
 
             # Optimized ordering
             if order_by:
-                json_path = f"$.{order_by}"
-                order_col = func.json_extract(CollectionDocument.data, json_path)
+                order_col = _promoted_column(model, order_by)
+                if order_col is None:
+                    json_path = f"$.{order_by}"
+                    order_col = func.json_extract(model.data, json_path)
                 # Default to descending for timestamps
                 if order_by in ("createdAt", "created_at", "updatedAt", "updated_at"):
                     stmt = stmt.order_by(desc(order_col))
@@ -370,7 +668,7 @@ class EnhancedSQLDatabase:
                     stmt = stmt.order_by(desc(order_col))
             else:
                 # Default order by created_at desc
-                stmt = stmt.order_by(desc(CollectionDocument.created_at))
+                stmt = stmt.order_by(desc(model.created_at))
 
             # Pagination
             if offset:
@@ -393,25 +691,13 @@ class EnhancedSQLDatabase:
         filters: Optional[List[Tuple[str, str, Any]]] = None,
     ) -> int:
         """Count documents with filters"""
+        model = self._stores(collection_name)[0]
         with self._get_session() as session:
-            stmt = select(func.count(CollectionDocument.id)).where(
-                CollectionDocument.collection == collection_name
-            )
-
-            if filters:
-                conditions = []
-                for field, operator, value in filters:
-                    json_path = f"$.{field}"
-                    col = func.json_extract(CollectionDocument.data, json_path)
+            stmt = self._select(model, collection_name, func.count(model.id))
 
-                    if operator == "==":
-                        conditions.append(col == json.dumps(value))
-                    elif operator == "!=":
-                        conditions.append(col != json.dumps(value))
-                    # Add more operators as needed
-
-                if conditions:
-                    stmt = stmt.where(and_(*conditions))
+            conditions = self._filter_conditions(model, filters)
+            if conditions:
+                stmt = stmt.where(and_(*conditions))
 
             return session.scalar(stmt) or 0
 
@@ -424,26 +710,20 @@ class EnhancedSQLDatabase:
     ) -> List[str]:
         """Batch create multiple documents"""
         now_iso = datetime.utcnow().isoformat()
-        rows = []
+        now = datetime.utcnow()
+        stores = self._stores(collection_name)
         doc_ids = []
 
-        for data in documents:
-            doc_id = str(uuid4())
-            doc_ids.append(doc_id)
-            data = dict(data or {})
-            data.setdefault("createdAt", now_iso)
-            data.setdefault("updatedAt", now_iso)
-
-            rows.append(
-                CollectionDocument(
-                    id=doc_id,
-                    collection=collection_name,
-                    data=self._dump_data(data),
-                )
-            )
-
         with self._get_session() as session:
-            session.add_all(rows)
+            for data in documents:
+                doc_id = str(uuid4())
+                doc_ids.append(doc_id)
+                data = dict(data or {})
+                data.setdefault("createdAt", now_iso)
+                data.setdefault("updatedAt", now_iso)
+                payload = self._dump_data(data, collection_name)
+                for model in stores:
+                    self._write_row(session, model, collection_name, doc_id, data, payload, created_at=now, updated_at=now)
             session.commit()
 
         _clear_cache(collection_name)
@@ -460,26 +740,7 @@ class EnhancedSQLDatabase:
 
         with self._get_session() as session:
             for doc_id, data in updates:
-                stmt = (
-                    select(CollectionDocument)
-                    .where(
-                        and_(
-                            CollectionDocument.collection == collection_name,
-                            CollectionDocument.id == doc_id,
-                        )
-                    )
-                    .limit(1)
-                )
-                row = session.scalar(stmt)
-                if row:
-                    existing = self._load_data(row)
-                    existing.pop("id", None)
-                    existing.update(data or {})
-                    existing["updatedAt"] = now_iso
-
-                    row.data = self._dump_data(existing)
-                    row.updated_at = datetime.utcnow()
-                    session.add(row)
+                if self._update_in_session(session, collection_name, doc_id, data, now_iso):
                     updated_count += 1
 
             session.commit()
@@ -488,6 +749,158 @@ class EnhancedSQLDatabase:
             _clear_cache(collection_name)
         return updated_count
 
+    def rewrite_payloads(self, collection_name: str, batch_size: int = 500) -> Tuple[int, int, int]:
+        """
+        Re-encode every row of a collection (in every store it is written to)
+        with the current compression settings (timestamps untouched).
+        Returns (rows, bytes before, bytes after).
+        """
+        rows_done = before = after = 0
+        for model in self._stores(collection_name):
+            last_id = ""
+            while True:
+                with self._get_session() as session:
+                    rows = self._page(session, model, collection_name, last_id, batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        data = self._load_data(row)
+                        data.pop("id", None)
+                        before += len((row.data or "").encode())
+                        # Không gán lại updated_at: cột onupdate chỉ chạy khi có thay đổi khác → tự đặt lại giá trị cũ
+                        updated_at = row.updated_at
+                        row.data = self._dump_data(data, collection_name)
+                        row.updated_at = updated_at
+                        after += len(row.data.encode())
+                    rows_done += len(rows)
+                    last_id = rows[-1].id
+                    session.commit()
+
+        _clear_cache(collection_name)
+        return rows_done, before, after
+
+    # ==================== Typed table migration ====================
+
+    def backfill_typed(self, collection_name: str, batch_size: int = 500) -> Tuple[int, int]:
+        """
+        Copy generic rows that are missing from the typed table, in batches.
+        Rows already present were dual-written and are at least as new, so they
+        are left alone. Run in dual_write mode. Returns (scanned, inserted).
+        """
+        model = TYPED_MODELS[collection_name]
+        scanned = inserted = 0
+        last_id = ""
+        while True:
+            with self._get_session() as session:
+                rows = self._page(session, CollectionDocument, collection_name, last_id, batch_size)
+                if not rows:
+                    break
+                present = set(session.scalars(select(model.id).where(model.id.in_([row.id for row in rows]))).all())
+                for row in rows:
+                    if row.id in present:
+                        continue
+                    data = self._load_data(row)
+                    self._write_row(
+                        session, model, collection_name, row.id, data, row.data,
+                        created_at=row.created_at, updated_at=row.updated_at,
+                    )
+                    inserted += 1
+                scanned += len(rows)
+                last_id = rows[-1].id
+                session.commit()
+        return scanned, inserted
+
+    def verify_typed(
+        self,
+        collection_name: str,
+        batch_size: int = 500,
+        repair: bool = False,
+        sample_size: int = 20,
+    ) -> Dict[str, Any]:
+        """
+        Compare the generic and typed copies of a collection. The store reads
+        currently come from is the source of truth; with repair=True the other
+        copy is rewritten (missing/mismatched rows) or pruned (extra rows).
+        """
+        typed = TYPED_MODELS[collection_name]
+        if self.typed_mode(collection_name) in ("typed", "typed_only"):
+            source, target = typed, CollectionDocument
+        else:
+            source, target = CollectionDocument, typed
+        report: Dict[str, Any] = {"checked": 0, "missing": 0, "mismatched": 0, "extra": 0, "repaired": 0, "samples": []}
+
+        def note(kind: str, doc_id: str) -> None:
+            report[kind] += 1
+            if len(report["samples"]) < sample_size:
+                report["samples"].append((kind, doc_id))
+
+        def promoted_ok(row, data: Dict[str, Any]) -> bool:
+            return all(
+                getattr(row, attr) == _column_value(getattr(typed, attr), data.get(field))
+                for field, attr in typed.PROMOTED.items()
+            )
+
+        # Lượt 1: mọi document của bản nguồn phải có ở bản đích, cùng nội dung
+        last_id = ""
+        while True:
+            with self._get_session() as session:
+                rows = self._page(session, source, collection_name, last_id, batch_size)
+                if not rows:
+                    break
+                ids = [row.id for row in rows]
+                mirrors = {
+                    row.id: row
+                    for row in session.scalars(self._select(target, collection_name).where(target.id.in_(ids))).all()
+                }
+                for row in rows:
+                    data = self._load_data(row)
+                    mirror = mirrors.get(row.id)
+                    if mirror is None:
+                        note("missing", row.id)
+                    elif self._load_data(mirror) != data or not promoted_ok(row if source is typed else mirror, data):
+                        note("mismatched", row.id)
+                    else:
+                        continue
+                    if repair:
+                        # Đọc lại bản nguồn có khoá để không ghi đè một lần dual-write mới hơn
+                        fresh = session.scalar(
+                            self._select(source, collection_name).where(source.id == row.id).with_for_update()
+                        )
+                        if fresh is not None:
+                            self._write_row(
+                                session, target, collection_name, fresh.id, self._load_data(fresh), fresh.data,
+                                mirror, created_at=fresh.created_at, updated_at=fresh.updated_at,
+                            )
+                            report["repaired"] += 1
+                report["checked"] += len(rows)
+                last_id = rows[-1].id
+                session.commit()
+
+        # Lượt 2: bản đích không được có document mà bản nguồn không có
+        last_id = ""
+        while True:
+            with self._get_session() as session:
+                rows = self._page(session, target, collection_name, last_id, batch_size)
+                if not rows:
+                    break
+                ids = [row.id for row in rows]
+                present = set(
+                    session.scalars(self._select(source, collection_name, source.id).where(source.id.in_(ids))).all()
+                )
+                for row in rows:
+                    if row.id in present:
+                        continue
+                    note("extra", row.id)
+                    if repair:
+                        session.delete(row)
+                        report["repaired"] += 1
+                last_id = rows[-1].id
+                session.commit()
+
+        if repair and report["repaired"]:
+            _clear_cache(collection_name)
+        return report
+
     # ==================== Full-Text Search ====================
 
     def search(
@@ -508,23 +921,22 @@ class EnhancedSQLDatabase:
         search_lower = search_term.lower()
         fields = fields or ["content", "title", "name"]
 
+        model = self._stores(collection_name)[0]
         with self._get_session() as session:
-            stmt = select(CollectionDocument).where(
-                CollectionDocument.collection == collection_name
-            )
+            stmt = self._select(model, collection_name)
 
             # Build search conditions
             conditions = []
             for field in fields:
                 json_path = f"$.{field}"
-                col = func.json_extract(CollectionDocument.data, json_path)
+                col = func.json_extract(model.data, json_path)
                 # Use LIKE for case-insensitive search
                 conditions.append(func.lower(col.cast(String)).contains(search_lower))
 
             if conditions:
                 stmt = stmt.where(or_(*conditions))
 
-            stmt = stmt.order_by(desc(CollectionDocument.updated_at))
+            stmt = stmt.order_by(desc(model.updated_at))
             if limit:
                 stmt = stmt.limit(limit)
 
@@ -537,6 +949,12 @@ class EnhancedSQLDatabase:
         """Get all documents (use with caution for large collections)"""
         return self.query(collection_name, limit=None)
 
+    def list_collections(self) -> List[str]:
+        """Names of all collections (generic store plus the typed ones)"""
+        with self._get_session() as session:
+            names = set(session.scalars(select(CollectionDocument.collection).distinct()).all())
+        return sorted(names | set(TYPED_MODELS))
+
     def health_check(self) -> bool:
         """Health check with connection pool test"""
         try:
@@ -548,19 +966,13 @@ class EnhancedSQLDatabase:
 
     def get_stats(self, collection_name: str) -> Dict[str, Any]:
         """Get collection statistics"""
+        model = self._stores(collection_name)[0]
         with self._get_session() as session:
-            total = session.scalar(
-                select(func.count(CollectionDocument.id)).where(
-                    CollectionDocument.collection == collection_name
-                )
-            ) or 0
+            total = session.scalar(self._select(model, collection_name, func.count(model.id))) or 0
 
             # Get date range
             date_range = session.execute(
-                select(
-                    func.min(CollectionDocument.created_at),
-                    func.max(CollectionDocument.created_at),
-                ).where(CollectionDocument.collection == collection_name)
+                self._select(model, collection_name, func.min(model.created_at), func.max(model.created_at))
             ).first()
 
             return {
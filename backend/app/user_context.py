@@ -0,0 +1,88 @@
+"""
+Request-scoped user context.
+
+`get_current_user_context` resolves the verified token claims plus the user's
+profile from the `users` collection (looked up by primary key, doc_id == uid),
+and exposes the database role as the authoritative `role`. FastAPI caches a
+dependency per request, so the profile is loaded at most once per request;
+across requests a short-TTL LRU avoids hitting the database at all.
+
+Writers of user documents must call `invalidate_user_profile(uid)`. Other
+workers see the change after USER_PROFILE_CACHE_TTL seconds at most.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import Depends
+from starlette.concurrency import run_in_threadpool
+
+from app.auth import get_current_user
+from app.sql_database import db
+
+USER_PROFILE_CACHE_TTL = float(os.getenv("USER_PROFILE_CACHE_TTL", "30"))
+USER_PROFILE_CACHE_MAX_SIZE = int(os.getenv("USER_PROFILE_CACHE_MAX_SIZE", "5000"))
+
+# uid -> (profile or None, expires_at); None caches "no profile yet"
+_profile_cache: "OrderedDict[str, Tuple[Optional[Dict[str, Any]], float]]" = OrderedDict()
+
+
+def _cached_profile(uid: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """(hit, profile) from the profile LRU, without touching the database."""
+    entry = _profile_cache.get(uid)
+    if entry is not None and entry[1] > time.time():
+        _profile_cache.move_to_end(uid)
+        return True, entry[0]
+    return False, None
+
+
+def load_user_profile(uid: str) -> Optional[Dict[str, Any]]:
+    """Profile document of `uid` (or None), through the profile LRU. Blocking on a miss."""
+    hit, profile = _cached_profile(uid)
+    if hit:
+        return profile
+
+    profile = db.read("users", uid)
+    _profile_cache[uid] = (profile, time.time() + USER_PROFILE_CACHE_TTL)
+    _profile_cache.move_to_end(uid)
+    while len(_profile_cache) > USER_PROFILE_CACHE_MAX_SIZE:
+        _profile_cache.popitem(last=False)
+    return profile
+
+
+def invalidate_user_profile(uid: Optional[str] = None) -> None:
+    """Drop one cached profile, or all of them."""
+    if uid is None:
+        _profile_cache.clear()
+    else:
+        _profile_cache.pop(uid, None)
+
+
+async def get_current_user_context(
+    claims: Dict[str, Any] = Depends(get_current_user),
+) -> Dict[str, Any]:
+    """
+    FastAPI dependency: token claims hydrated with the DB profile.
+
+    Keeps the claim keys routers already use (uid, email, name, picture) and adds:
+    - role: role from the users collection (falls back to the claim, then "student")
+    - profile: the users document, or None if the user has no profile yet
+    """
+    user = dict(claims)
+    uid = claims.get("uid")
+    profile = None
+    if uid:
+        hit, profile = _cached_profile(uid)
+        if not hit:
+            # Cache miss = đọc SQLite: chạy trong threadpool, không chặn event loop
+            profile = await run_in_threadpool(load_user_profile, uid)
+
+    user["profile"] = profile
+    user["role"] = (profile or {}).get("role") or claims.get("role") or "student"
+    if profile:
+        if profile.get("name"):
+            user["name"] = profile["name"]
+        if profile.get("photo_url"):
+            user["picture"] = profile["photo_url"]
+    return user
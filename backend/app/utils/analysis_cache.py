@@ -0,0 +1,139 @@
+"""
+Persistent memoization of AI analysis results.
+
+Results are stored in their own collection (doc_id = cache key) with an
+expiry timestamp; expired entries count as misses and are overwritten.
+Concurrent calls for the same key in one worker share a single computation,
+so a burst of identical posts costs one Gemini call. Results flagged with
+"_fallback" (the model output could not be parsed) are returned but never
+stored, so one bad response does not stick to every repost for the TTL.
+Expired rows are deleted by the job worker pools' periodic maintenance.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from app.job_queue import maintenance_task
+from app.sql_database import db
+from app.utils.metrics import CACHE_REQUESTS_TOTAL
+from app.utils.request_context import record_cache
+
+logger = logging.getLogger(__name__)
+
+AI_ANALYSIS_CACHE_TTL = int(os.getenv("AI_ANALYSIS_CACHE_TTL", str(7 * 24 * 3600)))
+# Xoá các kết quả đã hết hạn mỗi N giây (chạy trong job worker)
+AI_ANALYSIS_CACHE_PURGE_INTERVAL = int(os.getenv("AI_ANALYSIS_CACHE_PURGE_INTERVAL", "3600"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """NFC + collapsed whitespace, so copy-pastes with different spacing hash alike."""
+    if not text:
+        return ""
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def content_cache_key(prompt_version: str, text: Optional[str], image_hashes: Iterable[str]) -> str:
+    """sha256 over prompt version, normalized text and the (ordered) image byte hashes."""
+    digest = hashlib.sha256()
+    digest.update(prompt_version.encode())
+    digest.update(b"\0")
+    digest.update(normalize_text(text).encode())
+    for image_hash in image_hashes:
+        digest.update(b"\0")
+        digest.update(image_hash.encode())
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """get_or_compute() over a TTL'd collection, with in-flight coalescing."""
+
+    def __init__(self, collection: str, ttl: int = AI_ANALYSIS_CACHE_TTL):
+        self.collection = collection
+        self.ttl = ttl
+        self._in_flight: Dict[str, "asyncio.Future[Any]"] = {}
+
+    def _record(self, hit: bool) -> None:
+        record_cache(hit=hit)
+        CACHE_REQUESTS_TOTAL.labels(collection=self.collection, result="hit" if hit else "miss").inc()
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            doc = db.read(self.collection, key)
+        except Exception as e:
+            logger.warning(f"Analysis cache read failed: {e}")
+            return None
+        if not doc or float(doc.get("expiresAt") or 0) <= time.time():
+            return None
+        return doc.get("result")
+
+    def set(self, key: str, result: Any, **meta: Any) -> None:
+        data = {"result": result, "expiresAt": time.time() + self.ttl, **meta}
+        try:
+            if not db.update(self.collection, key, data):
+                db.create(self.collection, data, doc_id=key)
+        except Exception as e:
+            # Worker khác vừa ghi cùng key, hoặc DB lỗi: kết quả vẫn trả về bình thường
+            logger.warning(f"Analysis cache write failed: {type(e).__name__}")
+
+    def purge_expired(self, batch_size: int = 500) -> int:
+        """Delete expired entries; returns how many were removed."""
+        removed = 0
+        while True:
+            now = time.time()
+            docs = db.query(self.collection, filters=[("expiresAt", "<", now)], limit=batch_size)
+            # Kiểm tra lại phía Python: không bao giờ xoá entry còn hạn
+            expired = [doc for doc in docs if float(doc.get("expiresAt") or 0) < now]
+            for doc in expired:
+                if db.delete(self.collection, doc["id"]):
+                    removed += 1
+            if len(expired) < batch_size:
+                break
+        if removed:
+            logger.info(f"Purged {removed} expired entries from {self.collection}")
+        return removed
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]], **meta: Any) -> Any:
+        """Cached result for `key`, else await `compute()` once (errors and fallbacks are not cached)."""
+        cached = self.get(key)
+        if cached is not None:
+            self._record(hit=True)
+            return cached
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            # Cùng nội dung đang được phân tích → chờ chung kết quả
+            self._record(hit=True)
+            return await asyncio.shield(pending)
+
+        self._record(hit=False)
+        future: "asyncio.Future[Any]" = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Tránh "exception was never retrieved" khi không có ai chờ
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            if not (isinstance(result, dict) and result.get("_fallback")):
+                self.set(key, result, **meta)
+            return result
+        finally:
+            self._in_flight.pop(key, None)
+
+
+# Post moderation results (run_post_analysis)
+post_analysis_cache = AnalysisCache("ai_analysis_cache")
+maintenance_task("purge_ai_analysis_cache", AI_ANALYSIS_CACHE_PURGE_INTERVAL, post_analysis_cache.purge_expired)
@@ -0,0 +1,215 @@
+"""
+Opt-in compression of large document payloads in collection_documents.data.
+
+Only bulky top-level fields (objects, arrays, long strings) are compressed,
+into a single envelope field; short scalars stay plain JSON so json_extract()
+filters, ordering and counts keep working, and the row stays valid JSON:
+
+    {"status": "clean", "createdAt": "...", ..., "__compressed": "zlib:<dict id>:<base64>"}
+
+Codecs: zlib (stdlib, optionally with a preset dictionary) or zstd (needs the
+optional `zstandard` package). Dictionaries are trained per collection with
+scripts/train_compression_dict.py and stored in the compression_dicts
+collection; rows keep the id of the dictionary they were written with.
+"""
+import base64
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Collection bật nén, vd: "posts,ai_chat_logs,ai_analysis_cache" (rỗng = tắt; phải có trong KEEP_PLAIN)
+DB_COMPRESS_COLLECTIONS = {c.strip() for c in os.getenv("DB_COMPRESS_COLLECTIONS", "").split(",") if c.strip()}
+DB_COMPRESS_CODEC = os.getenv("DB_COMPRESS_CODEC", "zlib").lower()  # zlib | zstd
+DB_COMPRESS_LEVEL = int(os.getenv("DB_COMPRESS_LEVEL", "6"))
+# Chỉ nén khi phần "nặng" của document lớn hơn ngưỡng này (bytes)
+DB_COMPRESS_MIN_BYTES = int(os.getenv("DB_COMPRESS_MIN_BYTES", "1024"))
+DB_COMPRESS_DICT_REFRESH = int(os.getenv("DB_COMPRESS_DICT_REFRESH", "300"))
+
+ENVELOPE_KEY = "__compressed"
+DICT_COLLECTION = "compression_dicts"
+# Chuỗi ngắn hơn mức này luôn để nguyên (id, status, ngày tháng... dùng để lọc/sắp xếp)
+PLAIN_STRING_MAX = 128
+# Field luôn để plain vì được lọc/sắp xếp/tìm bằng json_extract (db.query/count/search),
+# kể cả khi là chuỗi dài hoặc list. Chỉ collection có entry ở đây mới được nén: thêm
+# collection mới = liệt kê đủ các field nó được truy vấn theo.
+KEEP_PLAIN: Dict[str, Set[str]] = {
+    "posts": {"content", "author_name", "author_id", "subject", "status", "createdAt"},
+    "comments": {"post_id", "author_id", "createdAt"},
+    "users": {"uid", "email", "name", "role", "createdAt"},
+    "documents": {"category", "subject", "createdAt"},
+    "exams": {"subject", "difficulty", "createdAt"},
+    "ai_chat_logs": {"post_id", "conversation_id", "createdAt"},
+    "ai_analysis_cache": set(),  # chỉ đọc theo id
+}
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+class DocumentCodec:
+    def __init__(
+        self,
+        collections: Iterable[str] = DB_COMPRESS_COLLECTIONS,
+        codec: str = DB_COMPRESS_CODEC,
+        level: int = DB_COMPRESS_LEVEL,
+        min_bytes: int = DB_COMPRESS_MIN_BYTES,
+        dict_refresh: int = DB_COMPRESS_DICT_REFRESH,
+    ):
+        if codec == "zstd" and zstandard is None:
+            logger.warning("DB_COMPRESS_CODEC=zstd but zstandard is not installed; using zlib")
+            codec = "zlib"
+        self.collections = set(collections) - {DICT_COLLECTION}
+        unlisted = self.collections - set(KEEP_PLAIN)
+        if unlisted:
+            # Không biết field nào được truy vấn → nén có thể làm filter âm thầm trả rỗng
+            logger.warning(
+                f"Not compressing {', '.join(sorted(unlisted))}: no KEEP_PLAIN entry in app/utils/doc_compression.py"
+            )
+            self.collections -= unlisted
+        self.codec = codec
+        self.level = level
+        self.min_bytes = min_bytes
+        self.dict_refresh = dict_refresh
+        # Trả về các document của DICT_COLLECTION; do lớp database gắn vào
+        self.dictionary_loader: Optional[Callable[[], List[Dict[str, Any]]]] = None
+        self._dicts: Dict[str, Tuple[str, bytes]] = {}  # id -> (codec, bytes)
+        self._active: Dict[Tuple[str, str], str] = {}  # (collection, codec) -> id
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    # ---------------- dictionaries ----------------
+
+    def _refresh_dictionaries(self, force: bool = False) -> None:
+        if self.dictionary_loader is None:
+            return
+        if not force and time.monotonic() - self._loaded_at < self.dict_refresh:
+            return
+        with self._lock:
+            if not force and time.monotonic() - self._loaded_at < self.dict_refresh:
+                return
+            self._loaded_at = time.monotonic()
+            try:
+                docs = self.dictionary_loader()
+            except Exception as e:
+                logger.warning(f"Loading compression dictionaries failed: {e}")
+                return
+            newest: Dict[Tuple[str, str], str] = {}
+            for doc in sorted(docs, key=lambda d: d.get("createdAt") or ""):
+                self._dicts[doc["id"]] = (doc["codec"], base64.b64decode(doc["data"]))
+                newest[(doc["collection"], doc["codec"])] = doc["id"]
+            self._active = newest
+
+    def _dictionary(self, dict_id: str) -> bytes:
+        if dict_id not in self._dicts:
+            # Dictionary mới do process khác train → tải lại ngay
+            self._refresh_dictionaries(force=True)
+        return self._dicts[dict_id][1]
+
+    # ---------------- codecs ----------------
+
+    def compress(self, raw: bytes, dictionary: Optional[bytes], codec: Optional[str] = None) -> bytes:
+        codec = codec or self.codec
+        if codec == "zstd":
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            return zstandard.ZstdCompressor(level=self.level, dict_data=dict_data).compress(raw)
+        compressor = (
+            zlib.compressobj(self.level, zlib.DEFLATED, -15, zdict=dictionary)
+            if dictionary
+            else zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        )
+        return compressor.compress(raw) + compressor.flush()
+
+    def decompress(self, codec: str, data: bytes, dictionary: Optional[bytes]) -> bytes:
+        if codec == "zstd":
+            if zstandard is None:
+                raise RuntimeError("Row is zstd-compressed but zstandard is not installed")
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(data)
+        decompressor = zlib.decompressobj(-15, zdict=dictionary) if dictionary else zlib.decompressobj(-15)
+        return decompressor.decompress(data) + decompressor.flush()
+
+    # ---------------- documents ----------------
+
+    def enabled_for(self, collection: Optional[str]) -> bool:
+        return bool(collection) and collection in self.collections
+
+    def heavy_fields(self, collection: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Fields that go into the compressed envelope."""
+        keep = KEEP_PLAIN[collection]
+        return {
+            key: value
+            for key, value in data.items()
+            if key not in keep
+            and key != "id"
+            and (isinstance(value, (dict, list)) or (isinstance(value, str) and len(value) > PLAIN_STRING_MAX))
+        }
+
+    def encode(self, collection: Optional[str], data: Dict[str, Any]) -> str:
+        data = data or {}
+        if not self.enabled_for(collection):
+            return json.dumps(data)
+        heavy = self.heavy_fields(collection, data)
+        raw = json.dumps(heavy, separators=(",", ":"), ensure_ascii=False).encode()
+        # ensure_ascii=False: chữ tiếng Việt lưu UTF-8 thay vì \uXXXX (nhỏ hơn ~2-3 lần, json_extract vẫn đọc được)
+        if len(raw) < self.min_bytes:
+            return json.dumps(data, ensure_ascii=False)
+
+        self._refresh_dictionaries()
+        dict_id = self._active.get((collection, self.codec), "")
+        compressed = self.compress(raw, self._dicts[dict_id][1] if dict_id else None)
+        # base64 nở thêm 1/3: không đáng thì để nguyên
+        if len(compressed) * 4 // 3 >= len(raw) * 9 // 10:
+            return json.dumps(data, ensure_ascii=False)
+
+        plain = {key: value for key, value in data.items() if key not in heavy}
+        plain[ENVELOPE_KEY] = f"{self.codec}:{dict_id}:{_b64(compressed)}"
+        return json.dumps(plain, ensure_ascii=False)
+
+    def decode(self, text: Optional[str]) -> Dict[str, Any]:
+        payload = json.loads(text) if text else {}
+        envelope = payload.pop(ENVELOPE_KEY, None)
+        if envelope:
+            codec, dict_id, blob = envelope.split(":", 2)
+            dictionary = self._dictionary(dict_id) if dict_id else None
+            payload.update(json.loads(self.decompress(codec, base64.b64decode(blob), dictionary)))
+        return payload
+
+
+def train_dictionary(samples: List[bytes], size: int, codec: str) -> bytes:
+    """
+    zstd: zstandard's trainer. zlib: a preset dictionary built from the most
+    frequent tokens (JSON keys, common values and words) of the samples, most
+    frequent last since deflate reaches nearer bytes more cheaply.
+    """
+    if codec == "zstd":
+        return zstandard.train_dictionary(size, samples).as_bytes()
+
+    counts: Counter = Counter()
+    for sample in samples:
+        counts.update(re.findall(rb'"[^"\\]{1,40}":|[^\s",:{}\[\]]{3,40}', sample))
+    tokens = [token for token, count in counts.most_common() if count > 1]
+    out: List[bytes] = []
+    total = 0
+    for token in tokens:
+        if total + len(token) + 1 > size:
+            break
+        out.append(token)
+        total += len(token) + 1
+    return b" ".join(reversed(out))
+
+
+document_codec = DocumentCodec()
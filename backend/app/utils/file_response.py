@@ -0,0 +1,144 @@
+"""
+File response with HTTP Range, conditional GET and zero-copy sending.
+
+Starlette 0.27's FileResponse always streams the whole file through Python.
+This one answers a single `Range: bytes=...` with 206 (or 416), honours
+If-None-Match / If-Range against a caller-provided strong ETag, and hands the
+file to the server via the ASGI `http.response.pathsend` / `zerocopysend`
+extensions when the server advertises them. Otherwise it falls back to
+chunked reads in a thread.
+"""
+import asyncio
+import os
+from typing import Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 256 * 1024
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end) inclusive for a single byte range; None = serve the whole file
+    (no/invalid/multi-range header). Raises ValueError if unsatisfiable.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, sep, end_s = header[6:].strip().partition("-")
+    if not sep or not (start_s or end_s) or not all(p.isdigit() for p in (start_s, end_s) if p):
+        return None
+    if not start_s:
+        # bytes=-N: N byte cuối
+        suffix = int(end_s)
+        if suffix == 0 or size == 0:
+            raise ValueError("range not satisfiable")
+        return max(size - suffix, 0), size - 1
+    start = int(start_s)
+    if end_s and start > int(end_s):
+        return None
+    if start >= size:
+        raise ValueError("range not satisfiable")
+    return start, min(int(end_s), size - 1) if end_s else size - 1
+
+
+class RangeFileResponse(Response):
+    def __init__(
+        self,
+        path: str,
+        size: int,
+        media_type: str,
+        etag: str,
+        cache_control: str,
+        headers: Optional[dict] = None,
+    ):
+        self.path = path
+        self.size = size
+        self.media_type = media_type
+        self.etag = etag
+        self.cache_control = cache_control
+        self.extra_headers = headers or {}
+        self.status_code = 200
+        self.background = None
+
+    def _headers(self, **extra: str) -> list:
+        headers = {
+            "etag": self.etag,
+            "cache-control": self.cache_control,
+            "accept-ranges": "bytes",
+            **self.extra_headers,
+            **extra,
+        }
+        return [(k.encode("latin-1"), str(v).encode("latin-1")) for k, v in headers.items()]
+
+    def _etag_matches(self, header: Optional[str]) -> bool:
+        if not header:
+            return False
+        candidates = {tag.strip() for tag in header.split(",")}
+        return "*" in candidates or self.etag in candidates
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        request_headers = Headers(scope=scope)
+        send_body = scope["method"] != "HEAD"
+
+        if self._etag_matches(request_headers.get("if-none-match")):
+            await send({"type": "http.response.start", "status": 304, "headers": self._headers()})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        byte_range = None
+        if_range = request_headers.get("if-range")
+        # If-Range với ETag khác (file đã đổi) → trả cả file
+        if not if_range or if_range == self.etag:
+            try:
+                byte_range = parse_range(request_headers.get("range"), self.size)
+            except ValueError:
+                await send({
+                    "type": "http.response.start",
+                    "status": 416,
+                    "headers": self._headers(**{"content-range": f"bytes */{self.size}", "content-length": "0"}),
+                })
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        if byte_range is None:
+            status, offset, count = 200, 0, self.size
+            headers = self._headers(**{"content-type": self.media_type, "content-length": str(self.size)})
+        else:
+            start, end = byte_range
+            status, offset, count = 206, start, end - start + 1
+            headers = self._headers(**{
+                "content-type": self.media_type,
+                "content-length": str(count),
+                "content-range": f"bytes {start}-{end}/{self.size}",
+            })
+
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        if not send_body or count == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        extensions = scope.get("extensions") or {}
+        if status == 200 and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": self.path})
+            return
+
+        fd = await asyncio.to_thread(os.open, self.path, os.O_RDONLY)
+        try:
+            if "http.response.zerocopysend" in extensions:
+                await send({"type": "http.response.zerocopysend", "file": fd, "offset": offset, "count": count})
+                return
+            remaining = count
+            while remaining > 0:
+                chunk = await asyncio.to_thread(os.pread, fd, min(CHUNK_SIZE, remaining), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # File bị cắt ngắn giữa chừng: kết thúc body để không treo kết nối
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            os.close(fd)
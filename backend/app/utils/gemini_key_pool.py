@@ -0,0 +1,214 @@
+"""
+Gemini API key pool.
+
+All keys from GEMINI_API_KEYS (comma-separated) plus GEMINI_API_KEY are used.
+Each call leases the least-loaded healthy key (round-robin between equals):
+- healthy = not cooling down and under its per-minute request/token budget
+- a 429 or 5xx puts the key into exponential cooldown (honouring Retry-After)
+- any other response resets the key's failure streak
+
+Keys are identified in stats/metrics by a short fingerprint, never in clear.
+"""
+import hashlib
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.utils.metrics import GEMINI_KEY_COOLDOWNS_TOTAL, GEMINI_KEY_REQUESTS_TOTAL
+
+# Per-key budgets per rolling minute (0 = unlimited)
+GEMINI_KEY_RPM = int(os.getenv("GEMINI_KEY_RPM", "0"))
+GEMINI_KEY_TPM = int(os.getenv("GEMINI_KEY_TPM", "0"))
+GEMINI_KEY_COOLDOWN_BASE = float(os.getenv("GEMINI_KEY_COOLDOWN_BASE", "2"))
+GEMINI_KEY_COOLDOWN_MAX = float(os.getenv("GEMINI_KEY_COOLDOWN_MAX", "300"))
+
+BUDGET_WINDOW = 60.0
+
+
+def key_fingerprint(key: str) -> str:
+    return hashlib.sha256(key.encode()).hexdigest()[:8]
+
+
+@dataclass
+class KeyState:
+    key: str
+    fingerprint: str
+    in_flight: int = 0
+    # (timestamp, tokens) per finished call within BUDGET_WINDOW
+    window: Deque[Tuple[float, int]] = field(default_factory=deque)
+    failures: int = 0
+    cooldown_until: float = 0.0
+    total_requests: int = 0
+    total_tokens: int = 0
+    total_errors: int = 0
+
+    def prune(self, now: float) -> None:
+        while self.window and self.window[0][0] <= now - BUDGET_WINDOW:
+            self.window.popleft()
+
+    def requests_in_window(self) -> int:
+        return len(self.window) + self.in_flight
+
+    def tokens_in_window(self) -> int:
+        return sum(tokens for _, tokens in self.window)
+
+
+class NoGeminiKeyAvailable(Exception):
+    """Every key is cooling down or out of budget (or none is configured)."""
+
+    def __init__(self, retry_after: Optional[float] = None):
+        super().__init__("No Gemini API key available")
+        self.retry_after = retry_after
+
+
+class GeminiKeyPool:
+    """Thread-safe pool; lease with `acquire()`, report with `release()`."""
+
+    def __init__(
+        self,
+        keys: List[str],
+        rpm: int = GEMINI_KEY_RPM,
+        tpm: int = GEMINI_KEY_TPM,
+        cooldown_base: float = GEMINI_KEY_COOLDOWN_BASE,
+        cooldown_max: float = GEMINI_KEY_COOLDOWN_MAX,
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.cooldown_base = cooldown_base
+        self.cooldown_max = cooldown_max
+        self._lock = threading.Lock()
+        self._keys: List[KeyState] = []
+        self._order = itertools.count()
+        self.set_keys(keys)
+
+    def set_keys(self, keys: List[str]) -> None:
+        """Replace the key list (deduplicated, order kept); state of kept keys survives."""
+        with self._lock:
+            existing = {state.key: state for state in self._keys}
+            unique = list(dict.fromkeys(k.strip() for k in keys if k and k.strip()))
+            self._keys = [existing.get(k) or KeyState(key=k, fingerprint=key_fingerprint(k)) for k in unique]
+
+    def has_keys(self) -> bool:
+        return bool(self._keys)
+
+    def _is_healthy(self, state: KeyState, now: float) -> bool:
+        if state.cooldown_until > now:
+            return False
+        if self.rpm and state.requests_in_window() >= self.rpm:
+            return False
+        if self.tpm and state.tokens_in_window() >= self.tpm:
+            return False
+        return True
+
+    def _next_available_at(self, state: KeyState, now: float) -> float:
+        """Earliest time the key could become healthy again."""
+        available_at = max(state.cooldown_until, now)
+        if state.window and (
+            (self.rpm and state.requests_in_window() >= self.rpm)
+            or (self.tpm and state.tokens_in_window() >= self.tpm)
+        ):
+            available_at = max(available_at, state.window[0][0] + BUDGET_WINDOW)
+        return available_at
+
+    def acquire(self, exclude: Tuple[str, ...] = ()) -> str:
+        """Lease the least-loaded healthy key; raises NoGeminiKeyAvailable."""
+        now = time.time()
+        with self._lock:
+            candidates = []
+            for state in self._keys:
+                if state.key in exclude:
+                    continue
+                state.prune(now)
+                if self._is_healthy(state, now):
+                    candidates.append(state)
+
+            if not candidates:
+                waits = [
+                    self._next_available_at(s, now) - now for s in self._keys if s.key not in exclude
+                ]
+                raise NoGeminiKeyAvailable(retry_after=min(waits) if waits else None)
+
+            # Least loaded first; the rotating offset spreads ties round-robin
+            offset = next(self._order) % len(candidates)
+            rotated = candidates[offset:] + candidates[:offset]
+            state = min(rotated, key=lambda s: (s.in_flight, s.requests_in_window()))
+            state.in_flight += 1
+            return state.key
+
+    def release(
+        self,
+        key: str,
+        status_code: Optional[int] = None,
+        tokens: int = 0,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        """
+        Report the outcome of a leased call. status_code None means a network
+        error/timeout (counted, but does not cool the key down).
+        """
+        now = time.time()
+        with self._lock:
+            state = next((s for s in self._keys if s.key == key), None)
+            if state is None:
+                return
+            state.in_flight = max(0, state.in_flight - 1)
+            state.window.append((now, tokens))
+            state.total_requests += 1
+            state.total_tokens += tokens
+
+            if status_code is not None and (status_code == 429 or status_code >= 500):
+                state.failures += 1
+                state.total_errors += 1
+                cooldown = min(self.cooldown_base * 2 ** (state.failures - 1), self.cooldown_max)
+                if retry_after:
+                    cooldown = max(cooldown, min(retry_after, self.cooldown_max))
+                state.cooldown_until = now + cooldown
+                outcome = "rate_limited" if status_code == 429 else "server_error"
+                GEMINI_KEY_COOLDOWNS_TOTAL.labels(key=state.fingerprint).inc()
+            elif status_code is None:
+                state.total_errors += 1
+                outcome = "network_error"
+            else:
+                state.failures = 0
+                outcome = "ok" if status_code < 400 else "client_error"
+        GEMINI_KEY_REQUESTS_TOTAL.labels(key=state.fingerprint, outcome=outcome).inc()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-key usage for monitoring (fingerprints only)."""
+        now = time.time()
+        with self._lock:
+            result = []
+            for state in self._keys:
+                state.prune(now)
+                result.append({
+                    "key": state.fingerprint,
+                    "healthy": self._is_healthy(state, now),
+                    "in_flight": state.in_flight,
+                    "requests_last_minute": len(state.window),
+                    "tokens_last_minute": state.tokens_in_window(),
+                    "rpm_budget": self.rpm or None,
+                    "tpm_budget": self.tpm or None,
+                    "consecutive_failures": state.failures,
+                    "cooldown_remaining": round(max(0.0, state.cooldown_until - now), 1),
+                    "total_requests": state.total_requests,
+                    "total_tokens": state.total_tokens,
+                    "total_errors": state.total_errors,
+                })
+            return result
+
+
+def configured_gemini_keys() -> List[str]:
+    """GEMINI_API_KEYS (comma-separated) followed by GEMINI_API_KEY."""
+    from app.config import settings
+
+    keys = [k.strip() for k in (settings.GEMINI_API_KEYS or os.getenv("GEMINI_API_KEYS", "")).split(",")]
+    keys.append(settings.GEMINI_API_KEY or os.getenv("GEMINI_API_KEY", ""))
+    return [k for k in keys if k]
+
+
+# Global pool (one per worker process)
+gemini_key_pool = GeminiKeyPool(configured_gemini_keys())
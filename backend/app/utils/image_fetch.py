@@ -0,0 +1,149 @@
+"""
+Image loading for AI analysis.
+
+Our own /media URLs are read straight from disk; other URLs are streamed with
+a byte cap and kept in a small on-disk cache keyed by URL, so re-analyzing a
+post (retries, edits, the /analyze endpoint) does not download it again.
+"""
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from app.gemini import get_http_client
+from app.media import local_media_path
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FETCH_MAX_BYTES = int(os.getenv("IMAGE_FETCH_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "10"))
+# Không đặt trong MEDIA_DIR: cache ảnh ngoài không được public qua /media
+IMAGE_FETCH_CACHE_DIR = Path(os.getenv("IMAGE_FETCH_CACHE_DIR", "cache/images"))
+IMAGE_FETCH_CACHE_MAX_BYTES = int(os.getenv("IMAGE_FETCH_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+Image = Tuple[str, bytes]  # (mime_type, bytes)
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+def _read_local(path: Path) -> Optional[Image]:
+    mime_type = mimetypes.guess_type(path.name)[0] or ""
+    if not mime_type.startswith("image/") or not path.is_file():
+        return None
+    if path.stat().st_size > IMAGE_FETCH_MAX_BYTES:
+        raise ImageTooLarge(path.name)
+    return mime_type, path.read_bytes()
+
+
+def _cache_path(url: str, mime_type: str) -> Path:
+    key = hashlib.sha256(url.encode()).hexdigest()
+    return IMAGE_FETCH_CACHE_DIR / f"{key}{mimetypes.guess_extension(mime_type) or '.img'}"
+
+
+def _cache_get(url: str) -> Optional[Image]:
+    key = hashlib.sha256(url.encode()).hexdigest()
+    for path in IMAGE_FETCH_CACHE_DIR.glob(f"{key}.*"):
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # LRU theo mtime
+        except OSError:
+            return None
+        return mimetypes.guess_type(path.name)[0] or "image/jpeg", data
+    return None
+
+
+def _cache_put(url: str, image: Image) -> None:
+    mime_type, data = image
+    path = _cache_path(url, mime_type)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        IMAGE_FETCH_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        _cache_prune()
+    except OSError as e:
+        logger.warning(f"Image cache write failed: {e}")
+        tmp.unlink(missing_ok=True)
+
+
+def _cache_prune() -> None:
+    """Xóa file cũ nhất (theo mtime) khi cache vượt IMAGE_FETCH_CACHE_MAX_BYTES"""
+    entries = []
+    for path in IMAGE_FETCH_CACHE_DIR.iterdir():
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= IMAGE_FETCH_CACHE_MAX_BYTES:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+async def _download(url: str) -> Optional[Image]:
+    async with get_http_client().stream("GET", url, timeout=IMAGE_FETCH_TIMEOUT) as response:
+        response.raise_for_status()
+        content_type = response.headers.get("content-type", "")
+        if not content_type.startswith("image/"):
+            return None
+        if int(response.headers.get("content-length") or 0) > IMAGE_FETCH_MAX_BYTES:
+            raise ImageTooLarge(url)
+
+        chunks: List[bytes] = []
+        size = 0
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if size > IMAGE_FETCH_MAX_BYTES:
+                raise ImageTooLarge(url)
+            chunks.append(chunk)
+    return content_type.split(";")[0].strip() or "image/jpeg", b"".join(chunks)
+
+
+async def fetch_image(url: str) -> Optional[Image]:
+    """(mime_type, bytes) for an image URL, or None if unavailable / not an image / too large"""
+    started = time.perf_counter()
+    source = "local"
+    try:
+        path = local_media_path(url)
+        if path is not None:
+            image = await asyncio.to_thread(_read_local, path)
+        else:
+            source = "cache"
+            image = await asyncio.to_thread(_cache_get, url)
+            if image is None:
+                source = "remote"
+                image = await _download(url)
+                if image is not None:
+                    await asyncio.to_thread(_cache_put, url, image)
+    except Exception as e:
+        logger.warning(
+            f"Error loading image: {type(e).__name__}: {e}",
+            extra={"fields": {"event": "image_download_error", "image_url": url}},
+        )
+        return None
+
+    logger.debug(
+        "Image loaded",
+        extra={"fields": {
+            "event": "image_loaded",
+            "source": source,
+            "bytes": len(image[1]) if image else 0,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        }},
+    )
+    return image
+
+
+async def fetch_images(urls: List[str]) -> List[Image]:
+    """Load images concurrently; keeps input order and drops failures."""
+    results = await asyncio.gather(*(fetch_image(url) for url in urls))
+    return [image for image in results if image is not None]
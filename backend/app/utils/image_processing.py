@@ -0,0 +1,205 @@
+"""
+Image preprocessing: decode, apply + strip EXIF, downscale, re-encode.
+
+CPU-bound Pillow work runs in a small process pool so it never blocks the
+event loop or holds the GIL of the API worker. Results are cached on disk by
+sha256(input bytes + parameters). Pillow is optional: without it images pass
+through unchanged.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import mimetypes
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+    PILLOW_AVAILABLE = True
+except ImportError:
+    Image = None
+    ImageOps = None
+    PILLOW_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Cạnh dài tối đa khi lưu ảnh upload / khi gửi ảnh cho Gemini
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "2048"))
+AI_IMAGE_MAX_EDGE = int(os.getenv("AI_IMAGE_MAX_EDGE", "1024"))
+IMAGE_OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "WEBP").upper()  # WEBP | JPEG
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "82"))
+IMAGE_PROCESS_WORKERS = int(os.getenv("IMAGE_PROCESS_WORKERS", "2"))
+IMAGE_PROCESS_CACHE_DIR = Path(os.getenv("IMAGE_PROCESS_CACHE_DIR", "cache/processed"))
+# Chống "decompression bomb": ảnh lớn hơn số pixel này bị từ chối
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(50_000_000)))
+
+# Chiều rộng các bản thu nhỏ cho feed (srcset); bản nào >= ảnh gốc thì bỏ qua
+IMAGE_VARIANT_WIDTHS = [int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "320,640,1280").split(",") if w.strip()]
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "75"))
+
+PROCESSABLE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
+_OUTPUT_MIME = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+ProcessedImage = Tuple[str, bytes]  # (mime_type, bytes)
+Variant = Tuple[int, int, bytes]  # (width, height, webp bytes)
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def _process_image_sync(data: bytes, max_edge: int, fmt: str, quality: int) -> Optional[ProcessedImage]:
+    """Runs in the process pool. None = keep the original (animated GIF)."""
+    Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+    with Image.open(io.BytesIO(data)) as img:
+        if getattr(img, "n_frames", 1) > 1:
+            return None
+        # Xoay theo EXIF Orientation trước khi bỏ EXIF, nếu không ảnh chụp dọc sẽ bị nằm ngang
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        if fmt == "JPEG" or not has_alpha:
+            img = img.convert("RGB")
+        elif img.mode != "RGBA":
+            img = img.convert("RGBA")
+
+        out = io.BytesIO()
+        # Không truyền exif=... → metadata (GPS, thiết bị) bị loại bỏ
+        if fmt == "WEBP":
+            img.save(out, format=fmt, quality=quality, method=4)
+        else:
+            img.save(out, format=fmt, quality=quality, optimize=True, progressive=True)
+    return _OUTPUT_MIME[fmt], out.getvalue()
+
+
+def _make_variants_sync(data: bytes, widths: List[int], quality: int) -> Tuple[int, int, List[Variant]]:
+    """Runs in the process pool: decode once, return (width, height, [(w, h, webp bytes)])."""
+    Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+    with Image.open(io.BytesIO(data)) as img:
+        img.seek(0)  # GIF động: lấy frame đầu
+        img = ImageOps.exif_transpose(img)
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        img = img.convert("RGBA" if has_alpha else "RGB")
+
+        variants: List[Variant] = []
+        for width in sorted(set(widths)):
+            if width >= img.width:
+                continue
+            height = max(1, round(img.height * width / img.width))
+            out = io.BytesIO()
+            img.resize((width, height), Image.LANCZOS).save(out, format="WEBP", quality=quality, method=4)
+            variants.append((width, height, out.getvalue()))
+        return img.width, img.height, variants
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_image_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: fork một process đang chạy event loop + thread pool không an toàn
+        _pool = ProcessPoolExecutor(
+            max_workers=IMAGE_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_image_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _cache_path(key: str, mime_type: str) -> Path:
+    return IMAGE_PROCESS_CACHE_DIR / key[:2] / f"{key}{mimetypes.guess_extension(mime_type) or '.img'}"
+
+
+def _cache_get(key: str) -> Optional[ProcessedImage]:
+    for path in (IMAGE_PROCESS_CACHE_DIR / key[:2]).glob(f"{key}.*"):
+        try:
+            return mimetypes.guess_type(path.name)[0] or "image/webp", path.read_bytes()
+        except OSError:
+            return None
+    return None
+
+
+def _cache_put(key: str, image: ProcessedImage) -> None:
+    path = _cache_path(key, image[0])
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_bytes(image[1])
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"Processed image cache write failed: {e}")
+        tmp.unlink(missing_ok=True)
+
+
+async def preprocess_image(
+    data: bytes,
+    mime_type: str,
+    max_edge: int = IMAGE_MAX_EDGE,
+    fmt: str = IMAGE_OUTPUT_FORMAT,
+    quality: int = IMAGE_QUALITY,
+) -> ProcessedImage:
+    """
+    Downscaled, EXIF-free re-encode of an image. Returns the input unchanged when
+    Pillow is missing, the type is not processable, or it is an animated GIF.
+    Raises InvalidImage if the bytes cannot be decoded.
+    """
+    if not PILLOW_AVAILABLE or mime_type not in PROCESSABLE_TYPES:
+        return mime_type, data
+
+    digest = hashlib.sha256(data)
+    digest.update(f"\0{max_edge}:{fmt}:{quality}".encode())
+    key = digest.hexdigest()
+    cached = await asyncio.to_thread(_cache_get, key)
+    if cached is not None:
+        return cached
+
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(get_image_pool(), _process_image_sync, data, max_edge, fmt, quality)
+    except BrokenProcessPool:
+        # Worker chết (OOM...) làm hỏng cả pool → tạo pool mới cho lần sau
+        shutdown_image_pool()
+        raise
+    except Exception as e:
+        raise InvalidImage(f"{type(e).__name__}: {e}") from e
+    if result is None:
+        return mime_type, data
+
+    await asyncio.to_thread(_cache_put, key, result)
+    return result
+
+
+async def make_variants(
+    data: bytes,
+    mime_type: str,
+    widths: List[int] = IMAGE_VARIANT_WIDTHS,
+    quality: int = IMAGE_VARIANT_QUALITY,
+) -> Optional[Tuple[int, int, List[Variant]]]:
+    """
+    Fixed-width WebP variants of an image (narrower than the original only),
+    plus the original's dimensions. None when Pillow is missing or the type is
+    not processable; raises InvalidImage if the bytes cannot be decoded.
+    """
+    if not PILLOW_AVAILABLE or mime_type not in PROCESSABLE_TYPES:
+        return None
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_image_pool(), _make_variants_sync, data, widths, quality)
+    except BrokenProcessPool:
+        shutdown_image_pool()
+        raise
+    except Exception as e:
+        raise InvalidImage(f"{type(e).__name__}: {e}") from e
@@ -0,0 +1,133 @@
+"""
+Prometheus metrics registry (exposed at /metrics).
+
+Multi-worker deployments (uvicorn --workers N) must set PROMETHEUS_MULTIPROC_DIR
+to an empty, writable directory before the workers start; each worker then
+writes its samples there and /metrics aggregates all of them. Wipe the
+directory on service restart.
+
+If prometheus_client is not installed every metric is a no-op.
+"""
+import os
+from typing import Tuple
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        generate_latest,
+        multiprocess,
+    )
+    HAS_PROMETHEUS = True
+except ImportError:
+    HAS_PROMETHEUS = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.getenv("prometheus_multiproc_dir")
+
+# Request latency buckets (seconds) – API calls are mostly sub-second, Gemini up to 30 s
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+GEMINI_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+
+class _NoopMetric:
+    """Stand-in used when prometheus_client is unavailable."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def dec(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+
+if HAS_PROMETHEUS:
+    HTTP_REQUESTS_TOTAL = Counter(
+        "http_requests_total", "HTTP requests", ["method", "route", "status"]
+    )
+    HTTP_REQUEST_DURATION = Histogram(
+        "http_request_duration_seconds", "HTTP request latency", ["method", "route"],
+        buckets=HTTP_BUCKETS,
+    )
+    HTTP_REQUESTS_IN_PROGRESS = Gauge(
+        "http_requests_in_progress", "HTTP requests currently being served", ["method"],
+        multiprocess_mode="livesum",
+    )
+    DB_STATEMENT_DURATION = Histogram(
+        "db_statement_duration_seconds", "SQL statement latency", ["operation"],
+        buckets=DB_BUCKETS,
+    )
+    CACHE_REQUESTS_TOTAL = Counter(
+        "cache_requests_total", "Query cache lookups", ["collection", "result"]
+    )
+    GEMINI_REQUEST_DURATION = Histogram(
+        "gemini_request_duration_seconds", "Gemini API call latency", ["endpoint"],
+        buckets=GEMINI_BUCKETS,
+    )
+    GEMINI_REQUESTS_TOTAL = Counter(
+        "gemini_requests_total", "Gemini API calls", ["endpoint", "outcome"]
+    )
+    GEMINI_KEY_REQUESTS_TOTAL = Counter(
+        "gemini_key_requests_total", "Gemini API calls per pooled key", ["key", "outcome"]
+    )
+    GEMINI_KEY_COOLDOWNS_TOTAL = Counter(
+        "gemini_key_cooldowns_total", "Times a pooled Gemini key was put into cooldown", ["key"]
+    )
+    JOB_QUEUE_DEPTH = Gauge(
+        "job_queue_depth", "Durable job queue size by status", ["kind", "status"],
+        multiprocess_mode="mostrecent",
+    )
+    JOBS_PROCESSED_TOTAL = Counter(
+        "jobs_processed_total", "Job attempts by outcome (done | retry | dead)", ["kind", "outcome"]
+    )
+    JOB_QUEUE_WAIT = Histogram(
+        "job_queue_wait_seconds", "Time from enqueue to the start of an attempt", ["kind"],
+        buckets=HTTP_BUCKETS,
+    )
+    JOB_RUN_DURATION = Histogram(
+        "job_run_duration_seconds", "Job handler run time", ["kind"],
+        buckets=GEMINI_BUCKETS,
+    )
+    RATE_LIMIT_REJECTIONS_TOTAL = Counter(
+        "rate_limit_rejections_total", "Requests rejected by the rate limiter", ["group", "window"]
+    )
+else:
+    HTTP_REQUESTS_TOTAL = _NoopMetric()
+    HTTP_REQUEST_DURATION = _NoopMetric()
+    HTTP_REQUESTS_IN_PROGRESS = _NoopMetric()
+    DB_STATEMENT_DURATION = _NoopMetric()
+    CACHE_REQUESTS_TOTAL = _NoopMetric()
+    GEMINI_REQUEST_DURATION = _NoopMetric()
+    GEMINI_REQUESTS_TOTAL = _NoopMetric()
+    GEMINI_KEY_REQUESTS_TOTAL = _NoopMetric()
+    GEMINI_KEY_COOLDOWNS_TOTAL = _NoopMetric()
+    JOB_QUEUE_DEPTH = _NoopMetric()
+    JOBS_PROCESSED_TOTAL = _NoopMetric()
+    JOB_QUEUE_WAIT = _NoopMetric()
+    JOB_RUN_DURATION = _NoopMetric()
+    RATE_LIMIT_REJECTIONS_TOTAL = _NoopMetric()
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Serialize all metrics in Prometheus text format; returns (body, content type)."""
+    if not HAS_PROMETHEUS:
+        return b"# prometheus_client not installed\n", CONTENT_TYPE_LATEST
+    if MULTIPROC_DIR:
+        # Aggregate samples written by every worker process
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,69 @@
+"""
+Micro-batching of concurrent async calls.
+
+Items submitted from concurrent coroutines are collected until `max_batch`
+items are waiting or `max_wait` seconds have passed since the first one, then
+handed to `process_batch` in one call. `process_batch` returns one result per
+item (in order); an Exception instance in that list fails just that item,
+an exception raised by `process_batch` fails the whole batch.
+"""
+import asyncio
+from typing import Awaitable, Callable, Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    def __init__(
+        self,
+        process_batch: Callable[[List[T]], Awaitable[List[R]]],
+        max_batch: int,
+        max_wait: float,
+    ):
+        self.process_batch = process_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self._pending: List[Tuple[T, "asyncio.Future[R]"]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: "set[asyncio.Task]" = set()
+
+    async def submit(self, item: T) -> R:
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[R]" = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            # Keep a reference until done (the loop only holds weak refs to tasks)
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[Tuple[T, "asyncio.Future[R]"]]) -> None:
+        try:
+            results = await self.process_batch([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"process_batch returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,105 @@
+"""
+Request-scoped context shared between middleware, routers and the storage layer
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from app.utils.metrics import GEMINI_REQUEST_DURATION, GEMINI_REQUESTS_TOTAL
+
+
+@dataclass
+class RequestMetrics:
+    """Per-request counters, surfaced in Server-Timing and the request log line."""
+    route: Optional[str] = None
+    db_statements: int = 0
+    db_time: float = 0.0  # seconds
+    cache_hits: int = 0
+    cache_misses: int = 0
+    gemini_calls: int = 0
+    gemini_time: float = 0.0  # seconds
+
+    def server_timing(self, total: float) -> str:
+        """Render as a Server-Timing header value (durations in ms)."""
+        parts = [
+            f'db;desc="{self.db_statements} queries";dur={self.db_time * 1000:.1f}',
+            f'cache;desc="hits={self.cache_hits} misses={self.cache_misses}"',
+        ]
+        if self.gemini_calls:
+            parts.append(f'gemini;desc="{self.gemini_calls} calls";dur={self.gemini_time * 1000:.1f}')
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+    def as_log_fields(self) -> Dict[str, Any]:
+        return {
+            "db_statements": self.db_statements,
+            "db_ms": round(self.db_time * 1000, 1),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "gemini_calls": self.gemini_calls,
+            "gemini_ms": round(self.gemini_time * 1000, 1),
+        }
+
+
+_request_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar("request_metrics", default=None)
+
+
+def start_request(route: Optional[str]):
+    """Bind fresh metrics for a request; returns (metrics, token) – pass token to end_request."""
+    metrics = RequestMetrics(route=route)
+    return metrics, _request_metrics.set(metrics)
+
+
+def end_request(token) -> None:
+    """Restore the previous binding."""
+    _request_metrics.reset(token)
+
+
+def current_metrics() -> Optional[RequestMetrics]:
+    """Metrics of the request being served, or None outside a request."""
+    return _request_metrics.get()
+
+
+def get_current_route() -> Optional[str]:
+    """Route of the request being served (e.g. "GET /api/posts/"), or None."""
+    metrics = _request_metrics.get()
+    return metrics.route if metrics else None
+
+
+def record_db_statement(duration: float) -> None:
+    metrics = _request_metrics.get()
+    if metrics is not None:
+        metrics.db_statements += 1
+        metrics.db_time += duration
+
+
+def record_cache(hit: bool) -> None:
+    metrics = _request_metrics.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+@contextmanager
+def track_gemini(endpoint: str = "unknown"):
+    """
+    Time an outbound Gemini call against the current request and /metrics.
+    Any exception raised inside the block counts as an error for `endpoint`.
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        duration = time.perf_counter() - start
+        GEMINI_REQUEST_DURATION.labels(endpoint=endpoint).observe(duration)
+        GEMINI_REQUESTS_TOTAL.labels(endpoint=endpoint, outcome=outcome).inc()
+        metrics = _request_metrics.get()
+        if metrics is not None:
+            metrics.gemini_calls += 1
+            metrics.gemini_time += duration
@@ -0,0 +1,148 @@
+"""
+Slow-query log for the SQL storage layer.
+
+Every statement is timed through SQLAlchemy cursor events. Statements slower
+than SLOW_QUERY_THRESHOLD_MS are kept in a bounded ring buffer together with
+redacted parameters, the calling route and (on SQLite) EXPLAIN QUERY PLAN.
+"""
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.utils.metrics import DB_STATEMENT_DURATION
+from app.utils.request_context import get_current_route, record_db_statement
+
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+
+
+def _redact_value(value: Any) -> Any:
+    """Hide user data but keep what matters for indexing decisions."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        # JSON paths ("$.author_id") tell us which field was filtered on
+        if value.startswith("$."):
+            return value
+        return f"<str len={len(value)}>"
+    if isinstance(value, (bytes, bytearray)):
+        return f"<bytes len={len(value)}>"
+    return f"<{type(value).__name__}>"
+
+
+def _redact_params(parameters: Any) -> Any:
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {k: _redact_value(v) for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_redact_params(p) if isinstance(p, (list, tuple, dict)) else _redact_value(p)
+                for p in parameters]
+    return _redact_value(parameters)
+
+
+class SlowQueryLog:
+    """Thread-safe ring buffer of slow statements."""
+
+    def __init__(self, maxlen: int = SLOW_QUERY_BUFFER_SIZE, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS):
+        self.threshold_ms = threshold_ms
+        self._entries: deque = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self.total_statements = 0
+        self.total_slow = 0
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries.append(entry)
+            self.total_slow += 1
+
+    def count_statement(self) -> None:
+        with self._lock:
+            self.total_statements += 1
+
+    def snapshot(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Newest first."""
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "threshold_ms": self.threshold_ms,
+                "buffer_size": self._entries.maxlen,
+                "buffered": len(self._entries),
+                "total_statements": self.total_statements,
+                "total_slow": self.total_slow,
+            }
+
+
+def _explain_query_plan(cursor, statement: str, parameters: Any) -> Optional[List[str]]:
+    """Run EXPLAIN QUERY PLAN on the raw DBAPI connection (SQLite only)."""
+    if not statement.lstrip().upper().startswith("SELECT"):
+        return None
+    try:
+        plan_cursor = cursor.connection.cursor()
+        try:
+            plan_cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+            # Rows are (id, parent, notused, detail)
+            return [row[-1] for row in plan_cursor.fetchall()]
+        finally:
+            plan_cursor.close()
+    except Exception as e:
+        return [f"<explain failed: {e}>"]
+
+
+def install_query_instrumentation(engine: Engine, log: "SlowQueryLog") -> None:
+    """Attach timing listeners to an engine."""
+    is_sqlite = engine.dialect.name == "sqlite"
+
+    # Start time lives on the statement's own execution context: a statement that
+    # raises (no after_cursor_execute) leaves nothing behind on the pooled connection
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._slow_query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_slow_query_start", None)
+        if start is None:
+            return
+        duration = time.perf_counter() - start
+        duration_ms = duration * 1000
+        log.count_statement()
+        record_db_statement(duration)
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        DB_STATEMENT_DURATION.labels(operation=operation).observe(duration)
+
+        if duration_ms < log.threshold_ms:
+            return
+
+        entry: Dict[str, Any] = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "duration_ms": round(duration_ms, 2),
+            "statement": statement,
+            "parameters": _redact_params(parameters),
+            "executemany": bool(executemany),
+            "route": get_current_route(),
+        }
+        if is_sqlite and SLOW_QUERY_EXPLAIN and not executemany:
+            entry["query_plan"] = _explain_query_plan(cursor, statement, parameters)
+        log.record(entry)
+
+
+# Global slow-query log
+slow_query_log = SlowQueryLog()
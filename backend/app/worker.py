@@ -0,0 +1,56 @@
+"""
+Standalone job worker process.
+
+Runs the durable job queue workers outside the API process, e.g. as its own
+systemd unit next to uvicorn (then set JOB_WORKERS_IN_PROCESS=false for the API):
+
+    python -m app.worker --concurrency 4
+"""
+import argparse
+import asyncio
+import logging
+import signal
+
+from app.gemini import close_http_client, start_http_client
+from app.job_queue import JOB_WORKER_CONCURRENCY, JobWorkerPool, job_queue
+from app.logging_config import setup_logging
+from app.sql_database import db
+from app.utils.image_processing import shutdown_image_pool
+
+# Importing the routers registers their @job_handler functions
+from app.routers import posts  # noqa: F401
+
+logger = logging.getLogger("worker")
+
+
+async def run(concurrency: int) -> None:
+    db.init_schema()
+    await start_http_client()
+    pool = JobWorkerPool(job_queue, concurrency=concurrency)
+    await pool.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Stopping job workers")
+        await pool.stop()
+        await close_http_client()
+        shutdown_image_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+
+    setup_logging()
+    asyncio.run(run(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
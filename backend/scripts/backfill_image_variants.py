@@ -0,0 +1,35 @@
+"""
+Script để sinh ảnh thu nhỏ (image_variants / srcset) cho các bài có ảnh
+được đăng trước khi có job image_variants.
+
+Usage (from backend/):
+    python -m scripts.backfill_image_variants [--dry-run]
+"""
+import argparse
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.sql_database import db
+from app.routers.posts import _post_image_urls, enqueue_image_variants
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ đếm, không enqueue")
+    args = parser.parse_args()
+
+    posts = [p for p in db.get_all("posts") if _post_image_urls(p) and p.get("image_variants") is None]
+    print(f"📋 {len(posts)} bài có ảnh chưa có variants")
+    if args.dry_run:
+        return
+
+    for post in posts:
+        enqueue_image_variants(post["id"])
+    print(f"✅ Đã enqueue {len(posts)} job image_variants")
+
+
+if __name__ == "__main__":
+    main()
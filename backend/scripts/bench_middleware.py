@@ -0,0 +1,96 @@
+"""
+Benchmark: requests/sec on GET /api/exams/ with the middleware stack on and off.
+
+Requests go through httpx's in-process ASGI transport, so the numbers measure
+framework + middleware + DB cost without network noise.
+
+Usage (from backend/):
+    python -m scripts.bench_middleware --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+
+from app.middleware.logging import LoggingMiddleware
+from app.middleware.rate_limit import MemoryRateLimitStore, RateLimitMiddleware
+from app.routers import exams
+
+PATH = "/api/exams/"
+
+
+def build_app(with_middleware: bool) -> FastAPI:
+    app = FastAPI()
+    app.include_router(exams.router)
+    if with_middleware:
+        # Same order as app.main: CORS, logging, rate limiting
+        app.add_middleware(
+            CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]
+        )
+        app.add_middleware(LoggingMiddleware)
+        # Limits high enough never to reject during the run
+        app.add_middleware(
+            RateLimitMiddleware,
+            requests_per_minute=10**9,
+            requests_per_hour=10**9,
+            store=MemoryRateLimitStore(),
+        )
+    return app
+
+
+async def run(app: FastAPI, total: int, concurrency: int) -> float:
+    """Return requests/sec for `total` GETs issued by `concurrency` workers."""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Warm up (DB connection, caches, route compilation)
+        for _ in range(20):
+            await client.get(PATH)
+
+        remaining = total
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                response = await client.get(PATH)
+                if response.status_code != 200:
+                    raise RuntimeError(f"Unexpected status {response.status_code}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    # Keep the logging cost (formatting + handler) but not the terminal I/O
+    logging.basicConfig(level=logging.INFO, stream=open(os.devnull, "w"))
+
+    results = {}
+    for label, with_middleware in (("middleware off", False), ("middleware on", True)):
+        app = build_app(with_middleware)
+        rates = [asyncio.run(run(app, args.requests, args.concurrency)) for _ in range(args.rounds)]
+        results[label] = max(rates)
+        print(f"{label:<16} best of {args.rounds}: {results[label]:8.1f} req/s")
+
+    off, on = results["middleware off"], results["middleware on"]
+    print(f"{'overhead':<16} {(1 - on / off) * 100:8.1f} %")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark: cold-start cost of the API.
+
+Measures, each in a fresh interpreter:
+- import time of `app.main` (and which heavy modules got imported)
+- time-to-first-200: from spawning uvicorn until GET /health answers 200
+
+Usage (from backend/):
+    python -m scripts.bench_startup --rounds 3
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that should not be needed just to import the app
+HEAVY_MODULES = ("firebase_admin", "requests", "psutil", "uvicorn")
+
+IMPORT_PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "import_ms": elapsed * 1000,
+    "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure_import() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    # The probe's JSON is the last stdout line (app logs may precede it)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_200(timeout: float) -> float:
+    """Seconds from process spawn to the first 200 on /health."""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/health"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                pass
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            time.sleep(0.01)
+        raise RuntimeError(f"No 200 from {url} within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.rounds)]
+    best_import = min(r["import_ms"] for r in imports)
+    print(f"{'import app.main':<20} best of {args.rounds}: {best_import:8.1f} ms")
+    print(f"{'heavy modules':<20} {', '.join(imports[-1]['loaded']) or 'none'}")
+
+    first_200 = [measure_first_200(args.timeout) for _ in range(args.rounds)]
+    print(f"{'time to first 200':<20} best of {args.rounds}: {min(first_200) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
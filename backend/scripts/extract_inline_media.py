@@ -0,0 +1,70 @@
+"""
+Migration một lần: tách ảnh/tài liệu base64 (data: URI) đang nằm trong các bài
+viết cũ (content, image_url, image_urls, attachments) ra media store và thay
+bằng URL. Bài có ảnh được đưa vào job image_variants để sinh srcset.
+
+Usage (from backend/):
+    python -m scripts.extract_inline_media [--dry-run]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.media import InlineMediaError, extract_inline_media, media_store, post_media_urls
+from app.sql_database import db
+from app.routers.posts import _post_image_urls, enqueue_image_variants
+from app.utils.image_processing import shutdown_image_pool
+
+FIELDS = ("content", "image_url", "image_urls", "attachments")
+
+
+async def migrate(dry_run: bool) -> None:
+    # Lọc ở Python: chỉ bài còn chuỗi "data:" trong các field media
+    posts = [
+        p for p in db.get_all("posts")
+        if any("data:" in json.dumps(p.get(field), ensure_ascii=False) for field in FIELDS if p.get(field))
+    ]
+    print(f"📋 {len(posts)} bài có data: URI")
+    if dry_run:
+        return
+
+    migrated = extracted = saved = failed = 0
+    for post in posts:
+        fields = {field: post.get(field) for field in FIELDS if post.get(field) is not None}
+        try:
+            updates, count = await extract_inline_media(fields)
+        except InlineMediaError as e:
+            failed += 1
+            print(f"⚠️  {post['id']}: {e}")
+            continue
+        if not count:
+            continue
+        before = len(json.dumps(fields, ensure_ascii=False))
+        db.update("posts", post["id"], updates)
+        media_store.sync_references(post_media_urls(post), post_media_urls({**post, **updates}))
+        if _post_image_urls({**post, **updates}):
+            enqueue_image_variants(post["id"])
+        migrated += 1
+        extracted += count
+        saved += before - len(json.dumps(updates, ensure_ascii=False))
+
+    print(f"✅ {migrated} bài, {extracted} file, giảm {saved / (1024 * 1024):.1f} MB JSON; lỗi: {failed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ đếm, không sửa")
+    args = parser.parse_args()
+    try:
+        asyncio.run(migrate(args.dry_run))
+    finally:
+        shutdown_image_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Dọn media store (content-addressed, MEDIA_DIR/cas):
+- Xóa object có refCount = 0 lâu hơn --grace giây, sau khi kiểm tra lại không
+  còn document nào (mọi collection) trỏ tới URL đó (refcount chỉ là gợi ý).
+  Object vẫn còn được dùng thì refCount được sửa lại theo số document đang trỏ tới.
+- Xóa file tạm upload dở (MEDIA_DIR/.tmp) cũ hơn --grace giây.
+
+Usage (from backend/):
+    python -m scripts.gc_media [--grace 86400] [--dry-run]
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.media import MEDIA_DIR, MEDIA_OBJECTS_COLLECTION, MEDIA_TMP_DIR, media_store, referenced_media
+from app.sql_database import db
+
+
+def count_references() -> Counter:
+    """sha256 -> số document (mọi collection trừ media_objects) đang chứa URL của object."""
+    references: Counter = Counter()
+    for collection in db.list_collections():
+        if collection == MEDIA_OBJECTS_COLLECTION:
+            continue
+        for doc in db.get_all(collection):
+            references.update(media_store.sha_from_url(url) for url in referenced_media(doc))
+    references.pop(None, None)
+    return references
+
+
+def collect_garbage(grace: int, dry_run: bool = False) -> Dict[str, int]:
+    cutoff = (datetime.now() - timedelta(seconds=grace)).isoformat()
+    # Lọc ở Python (so sánh json_extract với số/chuỗi trong db.query không đáng tin)
+    orphans = [
+        o for o in db.get_all(MEDIA_OBJECTS_COLLECTION)
+        if int(o.get("refCount") or 0) <= 0 and (o.get("orphanedAt") or "") < cutoff
+    ]
+    references = count_references() if orphans else Counter()
+
+    stats = {"removed": 0, "freed": 0, "kept": 0, "stale_tmp": 0}
+    for obj in orphans:
+        if references[obj["id"]]:
+            stats["kept"] += 1
+            print(f"⚠️  {obj['id']} refCount=0 nhưng vẫn được {references[obj['id']]} document dùng, giữ lại")
+            if not dry_run:
+                db.update(MEDIA_OBJECTS_COLLECTION, obj["id"], {"refCount": references[obj["id"]], "orphanedAt": None})
+            continue
+        stats["removed"] += 1
+        stats["freed"] += int(obj.get("size") or 0)
+        if dry_run:
+            continue
+        # Kiểm tra lại ngay trước khi xóa: có thể vừa được bài viết mới dùng
+        current = db.read(MEDIA_OBJECTS_COLLECTION, obj["id"], use_cache=False)
+        if not current or int(current.get("refCount") or 0) > 0:
+            continue
+        (MEDIA_DIR / obj["path"]).unlink(missing_ok=True)
+        db.delete(MEDIA_OBJECTS_COLLECTION, obj["id"])
+
+    if MEDIA_TMP_DIR.is_dir():
+        for path in MEDIA_TMP_DIR.iterdir():
+            if path.stat().st_mtime < time.time() - grace:
+                stats["stale_tmp"] += 1
+                if not dry_run:
+                    path.unlink(missing_ok=True)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--grace", type=int, default=24 * 3600, help="Số giây chờ trước khi xóa")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ liệt kê, không xóa")
+    args = parser.parse_args()
+
+    stats = collect_garbage(args.grace, args.dry_run)
+    action = "Sẽ xóa" if args.dry_run else "Đã xóa"
+    print(
+        f"✅ {action} {stats['removed']} object ({stats['freed'] / (1024 * 1024):.1f} MB), "
+        f"giữ lại {stats['kept']}, {stats['stale_tmp']} file tạm"
+    )
+
+
+if __name__ == "__main__":
+    main()
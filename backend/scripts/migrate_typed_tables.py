@@ -0,0 +1,133 @@
+"""
+Chuyển các collection nóng (posts, comments, users) từ collection_documents
+sang bảng typed riêng, không cần dừng server:
+
+    generic → dual_write → (backfill + verify) → typed → typed_only
+
+Mode được lưu trong DB; các process API/worker tự đọc lại sau tối đa
+DB_TYPED_MODE_REFRESH giây (trừ khi bị ghi đè bằng env DB_TYPED_MODE).
+
+Usage (from backend/):
+    python -m scripts.migrate_typed_tables status
+    python -m scripts.migrate_typed_tables dual-write posts comments users
+    python -m scripts.migrate_typed_tables backfill posts [--batch 500]
+    python -m scripts.migrate_typed_tables verify posts [--repair]
+    python -m scripts.migrate_typed_tables cutover posts     # verify (+repair) rồi đọc từ bảng typed
+    python -m scripts.migrate_typed_tables finalize posts    # ngừng ghi vào collection_documents
+    python -m scripts.migrate_typed_tables rollback posts    # typed → dual_write
+    python -m scripts.migrate_typed_tables migrate posts     # dual-write + backfill + cutover
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.sql_database_enhanced import DB_TYPED_MODE, DB_TYPED_MODE_REFRESH, TYPED_MODELS, db
+
+
+def _set_mode(collection: str, mode: str, wait: bool = True) -> None:
+    db.set_typed_mode(collection, mode)
+    print(f"✅ {collection}: mode = {mode}")
+    if wait:
+        # Chờ mọi process đọc lại mode trước khi sang bước tiếp theo
+        print(f"⏳ Chờ {DB_TYPED_MODE_REFRESH}s để các process khác thấy mode mới...")
+        time.sleep(DB_TYPED_MODE_REFRESH)
+
+
+def _require_mode(collection: str, *modes: str) -> bool:
+    mode = db.typed_mode(collection)
+    if mode not in modes:
+        print(f"❌ {collection} đang ở mode '{mode}', cần {' / '.join(modes)}")
+        return False
+    return True
+
+
+def _verify(collection: str, batch: int, repair: bool) -> bool:
+    report = db.verify_typed(collection, batch_size=batch, repair=repair)
+    ok = not (report["missing"] or report["mismatched"] or report["extra"])
+    print(
+        f"{'✅' if ok else '⚠️ '} {collection}: {report['checked']} document, "
+        f"thiếu {report['missing']}, lệch {report['mismatched']}, thừa {report['extra']}, đã sửa {report['repaired']}"
+    )
+    for kind, doc_id in report["samples"]:
+        print(f"   {kind}: {doc_id}")
+    return ok
+
+
+def _backfill(collection: str, batch: int) -> None:
+    start = time.time()
+    scanned, inserted = db.backfill_typed(collection, batch_size=batch)
+    print(f"✅ {collection}: quét {scanned}, chép {inserted} document sang {TYPED_MODELS[collection].__tablename__} ({time.time() - start:.1f}s)")
+
+
+def _cutover(collection: str, batch: int) -> bool:
+    # Lần 1 sửa các bản ghi lệch (ghi trước khi mọi process bật dual_write), lần 2 phải sạch
+    _verify(collection, batch, repair=True)
+    if not _verify(collection, batch, repair=False):
+        print(f"❌ {collection}: dữ liệu vẫn lệch, chưa cutover")
+        return False
+    _set_mode(collection, "typed", wait=False)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "command",
+        choices=["status", "dual-write", "backfill", "verify", "cutover", "finalize", "rollback", "migrate"],
+    )
+    parser.add_argument("collections", nargs="*", help=f"Mặc định: {', '.join(TYPED_MODELS)}")
+    parser.add_argument("--batch", type=int, default=500, help="Số document mỗi batch")
+    parser.add_argument("--repair", action="store_true", help="verify: sửa bản phụ theo bản đang được đọc")
+    args = parser.parse_args()
+
+    collections = args.collections or list(TYPED_MODELS)
+    unknown = [c for c in collections if c not in TYPED_MODELS]
+    if unknown:
+        print(f"❌ Không có bảng typed cho: {', '.join(unknown)}")
+        sys.exit(1)
+    if DB_TYPED_MODE and args.command != "status":
+        print("⚠️  DB_TYPED_MODE đang được đặt trong env: process dùng env này sẽ bỏ qua mode lưu trong DB")
+
+    if args.command == "status":
+        for collection in collections:
+            print(f"{collection}: {db.typed_mode(collection)}")
+        return
+
+    ok = True
+    for collection in collections:
+        if args.command == "dual-write":
+            if _require_mode(collection, "generic", "dual_write"):
+                _set_mode(collection, "dual_write")
+        elif args.command == "backfill":
+            if _require_mode(collection, "dual_write"):
+                _backfill(collection, args.batch)
+        elif args.command == "verify":
+            ok = _verify(collection, args.batch, args.repair) and ok
+        elif args.command == "cutover":
+            ok = _require_mode(collection, "dual_write") and _cutover(collection, args.batch) and ok
+        elif args.command == "finalize":
+            if _require_mode(collection, "typed"):
+                _set_mode(collection, "typed_only", wait=False)
+        elif args.command == "rollback":
+            # typed_only không rollback được: collection_documents đã ngừng nhận ghi
+            if _require_mode(collection, "typed"):
+                _set_mode(collection, "dual_write", wait=False)
+        elif args.command == "migrate":
+            if not _require_mode(collection, "generic", "dual_write"):
+                ok = False
+                continue
+            if db.typed_mode(collection) == "generic":
+                _set_mode(collection, "dual_write")
+            _backfill(collection, args.batch)
+            ok = _cutover(collection, args.batch) and ok
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Script để đưa các bài còn status "pending" (chưa được AI kiểm duyệt, ví dụ do
+BackgroundTasks cũ bị mất khi restart) vào job queue.
+Job trùng bài đang chờ/chạy sẽ được bỏ qua (dedupe theo post_id).
+
+Usage (from backend/):
+    python -m scripts.requeue_pending_posts [--dry-run]
+"""
+import argparse
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.sql_database import db
+from app.routers.posts import enqueue_post_moderation
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ đếm, không enqueue")
+    args = parser.parse_args()
+
+    # Lọc ở Python: status thiếu cũng coi như pending
+    pending = [p for p in db.get_all("posts") if (p.get("status") or "pending") == "pending"]
+    print(f"📋 {len(pending)} bài đang pending")
+    if args.dry_run:
+        return
+
+    for post in pending:
+        # Bài cũ chạy sau bài mới (priority thấp hơn)
+        enqueue_post_moderation(post["id"], priority=-1)
+    print(f"✅ Đã enqueue {len(pending)} job post_moderation")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Train một compression dictionary cho collection (bật nén bằng DB_COMPRESS_COLLECTIONS),
+lưu vào collection compression_dicts và (tuỳ chọn) ghi lại toàn bộ document
+của collection đó với dictionary mới.
+
+Usage (from backend/):
+    python -m scripts.train_compression_dict --collection posts [--samples 2000] [--size 32768] [--rewrite]
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.sql_database import db
+from app.utils.doc_compression import DICT_COLLECTION, KEEP_PLAIN, document_codec, train_dictionary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", required=True)
+    parser.add_argument("--samples", type=int, default=2000, help="Số document mới nhất dùng để train")
+    parser.add_argument("--size", type=int, default=32 * 1024, help="Kích thước dictionary (zlib tối đa 32KB)")
+    parser.add_argument("--rewrite", action="store_true", help="Ghi lại mọi document với dictionary mới")
+    args = parser.parse_args()
+
+    if args.collection not in KEEP_PLAIN:
+        print(f"❌ '{args.collection}' chưa có entry KEEP_PLAIN (app/utils/doc_compression.py): không nén được")
+        sys.exit(1)
+
+    codec = document_codec.codec
+    size = min(args.size, 32 * 1024) if codec == "zlib" else args.size
+    docs = db.query(args.collection, limit=args.samples, use_cache=False)
+    samples = [
+        json.dumps(document_codec.heavy_fields(args.collection, doc), separators=(",", ":"), ensure_ascii=False).encode()
+        for doc in docs
+    ]
+    samples = [s for s in samples if len(s) > 2]
+    if len(samples) < 10:
+        print(f"❌ Chỉ có {len(samples)} mẫu trong '{args.collection}', cần ít nhất 10")
+        return
+
+    dictionary = train_dictionary(samples, size, codec)
+    raw = sum(len(s) for s in samples)
+    plain = sum(len(document_codec.compress(s, None, codec)) for s in samples)
+    with_dict = sum(len(document_codec.compress(s, dictionary, codec)) for s in samples)
+    print(f"📊 {len(samples)} mẫu, {raw / 1024:.0f} KB: {codec} {raw / plain:.2f}x, {codec}+dict {raw / with_dict:.2f}x")
+
+    dict_id = f"{args.collection}-{codec}-{hashlib.sha256(dictionary).hexdigest()[:12]}"
+    if not db.read(DICT_COLLECTION, dict_id, use_cache=False):
+        db.create(DICT_COLLECTION, {
+            "collection": args.collection,
+            "codec": codec,
+            "size": len(dictionary),
+            "samples": len(samples),
+            "data": base64.b64encode(dictionary).decode("ascii"),
+            "createdAt": datetime.utcnow().isoformat(),
+        }, doc_id=dict_id)
+    print(f"✅ Dictionary {dict_id} ({len(dictionary)} bytes); các process khác dùng sau tối đa DB_COMPRESS_DICT_REFRESH giây")
+
+    if args.rewrite:
+        if not document_codec.enabled_for(args.collection):
+            print(f"⚠️  '{args.collection}' chưa có trong DB_COMPRESS_COLLECTIONS, bỏ qua --rewrite")
+            return
+        document_codec._refresh_dictionaries(force=True)
+        rows, before, after = db.rewrite_payloads(args.collection)
+        print(f"✅ Ghi lại {rows} document: {before / 1024:.0f} KB → {after / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
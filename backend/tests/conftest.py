@@ -0,0 +1,59 @@
+"""
+Shared fixtures. Every path the app writes to (SQLite databases, media,
+caches) is pointed at a temporary directory *before* any app module is
+imported, since those modules read their settings at import time.
+"""
+import os
+import sys
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix="duthi-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_TMP_DIR}/app.db",
+    "JOB_QUEUE_PATH": os.path.join(_TMP_DIR, "job_queue.db"),
+    "RATE_LIMIT_SQLITE_PATH": os.path.join(_TMP_DIR, "rate_limit.db"),
+    "MEDIA_DIR": os.path.join(_TMP_DIR, "media"),
+    "IMAGE_FETCH_CACHE_DIR": os.path.join(_TMP_DIR, "cache", "images"),
+    "IMAGE_PROCESS_CACHE_DIR": os.path.join(_TMP_DIR, "cache", "processed"),
+    "STARTUP_WARMUP": "false",
+    "JOB_WORKERS_IN_PROCESS": "false",
+    "DB_TYPED_MODE_REFRESH": "0",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    """Empty every table and in-process cache between tests."""
+    from app.sql_database_enhanced import Base, _clear_cache, db
+    from app.user_context import invalidate_user_profile
+
+    db.init_schema()
+    with db._get_session() as session:
+        for table in reversed(Base.metadata.sorted_tables):
+            session.execute(table.delete())
+        session.commit()
+    db._typed_modes = {}
+    _clear_cache()
+    invalidate_user_profile()
+    yield
+
+
+@pytest.fixture
+def make_client():
+    """TestClient for a bare app with the given routers, authenticated as `claims`."""
+    from app.auth import get_current_user
+
+    def factory(*routers, claims=None):
+        app = FastAPI()
+        for router in routers:
+            app.include_router(router)
+        if claims is not None:
+            app.dependency_overrides[get_current_user] = lambda: claims
+        return TestClient(app)
+
+    return factory
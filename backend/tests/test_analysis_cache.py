@@ -0,0 +1,54 @@
+"""AI analysis cache: what gets stored, and how expired rows are purged."""
+import asyncio
+import time
+
+from app.routers.ai_analysis import _parse_post_analysis
+from app.sql_database import db
+from app.utils.analysis_cache import AnalysisCache
+
+
+def _compute(result, calls):
+    async def compute():
+        calls.append(1)
+        return result
+    return compute
+
+
+def test_parsed_results_are_cached():
+    cache, calls = AnalysisCache("ai_analysis_cache"), []
+    result = _parse_post_analysis('{"is_educational": true, "moderation_status": "rejected"}')
+
+    for _ in range(2):
+        assert asyncio.run(cache.get_or_compute("k1", _compute(result, calls))) == result
+    assert len(calls) == 1
+
+
+def test_fallback_results_are_not_cached():
+    cache, calls = AnalysisCache("ai_analysis_cache"), []
+    fallback = _parse_post_analysis("Xin lỗi, mình không trả lời được.")
+    assert fallback["_fallback"]
+
+    for _ in range(2):
+        asyncio.run(cache.get_or_compute("k2", _compute(fallback, calls)))
+    assert len(calls) == 2
+    assert db.read("ai_analysis_cache", "k2", use_cache=False) is None
+
+
+def test_purge_removes_only_expired_entries():
+    cache = AnalysisCache("ai_analysis_cache")
+    now = time.time()
+    for i in range(5):
+        db.create("ai_analysis_cache", {"result": {}, "expiresAt": now - 10 - i}, doc_id=f"old{i}")
+    db.create("ai_analysis_cache", {"result": {}, "expiresAt": now + 3600}, doc_id="fresh")
+
+    assert cache.purge_expired(batch_size=2) == 5
+    assert [doc["id"] for doc in db.get_all("ai_analysis_cache")] == ["fresh"]
+    assert cache.purge_expired() == 0
+
+
+def test_purge_is_registered_as_worker_maintenance():
+    from app.job_queue import _maintenance_tasks
+    from app.utils.analysis_cache import post_analysis_cache
+
+    interval, func = _maintenance_tasks["purge_ai_analysis_cache"]
+    assert func == post_analysis_cache.purge_expired and interval > 0
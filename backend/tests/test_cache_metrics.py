@@ -0,0 +1,24 @@
+"""Cache metrics: collection labels stay bounded whatever names callers pass in."""
+import pytest
+
+prometheus_client = pytest.importorskip("prometheus_client")
+
+from app.sql_database_enhanced import db  # noqa: E402
+
+
+def _lookups(collection):
+    return prometheus_client.REGISTRY.get_sample_value(
+        "cache_requests_total", {"collection": collection, "result": "miss"}
+    ) or 0
+
+
+def test_unknown_collections_share_the_other_label():
+    before_other, before_posts = _lookups("other"), _lookups("posts")
+
+    for i in range(3):
+        db.read(f"attacker-{i}", "x")
+    db.read("posts", "missing")
+
+    assert _lookups("other") == before_other + 3
+    assert _lookups("posts") == before_posts + 1
+    assert _lookups("attacker-0") == 0
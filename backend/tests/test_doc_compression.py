@@ -0,0 +1,96 @@
+"""Document compression: envelope round trips and which fields stay queryable."""
+import base64
+import json
+
+import pytest
+
+from app.utils import doc_compression
+from app.utils.doc_compression import ENVELOPE_KEY, KEEP_PLAIN, DocumentCodec, train_dictionary
+
+LONG_CONTENT = "Giải phương trình bậc hai ax^2 + bx + c = 0 bằng công thức nghiệm. " * 30
+
+
+def _post(**extra):
+    return {
+        "id": "p1",
+        "content": LONG_CONTENT,
+        "author_id": "u1",
+        "author_name": "Nguyễn Văn A",
+        "subject": "math",
+        "status": "approved",
+        "createdAt": "2026-01-01T00:00:00",
+        "aiModeration": {"reason": "Nội dung học tập về toán lớp 9. " * 40, "score": 0.93},
+        "image_urls": [f"/media/cas/ab/cd/{i:064x}.webp" for i in range(5)],
+        **extra,
+    }
+
+
+@pytest.mark.parametrize("codec_name", ["zlib", "zstd"])
+def test_round_trip_keeps_queried_fields_plain(codec_name):
+    if codec_name == "zstd" and doc_compression.zstandard is None:
+        pytest.skip("zstandard not installed")
+    codec = DocumentCodec(collections=["posts"], codec=codec_name)
+    post = _post()
+
+    row = json.loads(codec.encode("posts", post))
+
+    assert row[ENVELOPE_KEY].startswith(f"{codec_name}::")
+    assert "aiModeration" not in row and "image_urls" not in row
+    # json_extract vẫn đọc được các field trong KEEP_PLAIN, kể cả chuỗi dài
+    assert {k: row[k] for k in KEEP_PLAIN["posts"]} == {k: post[k] for k in KEEP_PLAIN["posts"]}
+    assert codec.decode(json.dumps(row)) == post
+
+
+def test_small_or_disabled_documents_stay_plain():
+    codec = DocumentCodec(collections=["posts"])
+
+    assert codec.decode(codec.encode("posts", {"id": "p2", "content": "ngắn"})) == {"id": "p2", "content": "ngắn"}
+    assert ENVELOPE_KEY not in codec.encode("posts", {"id": "p3", "content": "ngắn"})
+    assert ENVELOPE_KEY not in codec.encode("exams", _post())
+
+
+def test_collections_without_keep_plain_entry_are_not_compressed():
+    codec = DocumentCodec(collections=["posts", "classrooms"])
+
+    assert codec.enabled_for("posts")
+    assert not codec.enabled_for("classrooms")
+    assert ENVELOPE_KEY not in codec.encode("classrooms", _post())
+
+
+def test_round_trip_with_trained_dictionary():
+    codec = DocumentCodec(collections=["posts"])
+    samples = [
+        json.dumps(codec.heavy_fields("posts", _post(id=f"p{i}")), ensure_ascii=False).encode() for i in range(20)
+    ]
+    dictionary = train_dictionary(samples, 4096, "zlib")
+    codec.dictionary_loader = lambda: [{
+        "id": "d1", "collection": "posts", "codec": "zlib", "createdAt": "2026-01-01",
+        "data": base64.b64encode(dictionary).decode(),
+    }]
+
+    text = codec.encode("posts", _post())
+    assert json.loads(text)[ENVELOPE_KEY].startswith("zlib:d1:")
+
+    # Process khác (chưa tải dictionary) vẫn giải nén được
+    reader = DocumentCodec(collections=["posts"])
+    reader.dictionary_loader = codec.dictionary_loader
+    assert reader.decode(text) == _post()
+
+
+def test_database_search_and_filters_see_compressed_posts(monkeypatch):
+    from sqlalchemy import select
+
+    from app.sql_database_enhanced import CollectionDocument, db
+
+    monkeypatch.setattr(doc_compression.document_codec, "collections", {"posts"})
+    post = _post()
+    post.pop("id")
+    post_id = db.create("posts", post)
+
+    with db._get_session() as session:
+        row = session.scalars(select(CollectionDocument).where(CollectionDocument.id == post_id)).one()
+        assert ENVELOPE_KEY in json.loads(row.data)
+    stored = db.read("posts", post_id, use_cache=False)
+    assert {k: stored[k] for k in post} == post
+    assert [p["id"] for p in db.search("posts", "công thức nghiệm", fields=["content"])] == [post_id]
+    assert db.count("posts", [("status", "!=", "rejected")]) == 1
@@ -0,0 +1,94 @@
+"""Durable job queue: lazy file creation, lease / retry / dead-letter transitions."""
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app import job_queue as jq
+from app.job_queue import JobQueue
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"))
+
+
+def test_import_does_not_create_the_queue_file(tmp_path):
+    path = tmp_path / "jobs.db"
+    env = {**os.environ, "JOB_QUEUE_PATH": str(path)}
+    subprocess.run([sys.executable, "-c", "import app.main"], cwd=BACKEND_DIR, env=env, check=True)
+
+    assert not path.exists()
+    JobQueue(str(path)).depth()
+    assert path.exists()
+
+
+def test_claim_complete_and_dedupe(queue):
+    first = queue.enqueue("k", {"n": 1}, dedupe_key="k:1")
+    assert queue.enqueue("k", {"n": 1}, dedupe_key="k:1") == first
+    queue.enqueue("k", {"n": 2}, priority=5)
+
+    job = queue.claim()
+    assert job.payload == {"n": 2} and job.attempts == 1  # priority cao chạy trước
+    assert queue.complete(job)
+    assert queue.claim().id == first
+    assert queue.claim() is None
+
+
+def test_expired_lease_is_reclaimed_and_old_lease_lost(queue):
+    queue.enqueue("k", {})
+    stale = queue.claim(visibility_timeout=0)
+
+    fresh = queue.claim()
+    assert fresh.id == stale.id and fresh.attempts == 2
+    assert not queue.complete(stale)
+    assert queue.fail(stale, "late") == "lost"
+    assert queue.complete(fresh)
+
+
+def test_failures_back_off_then_dead_letter(queue, monkeypatch):
+    monkeypatch.setattr(jq, "JOB_RETRY_BASE_DELAY", 0)
+    job_id = queue.enqueue("k", {}, max_attempts=2)
+    slow = queue.enqueue("k", {})
+
+    assert queue.fail(queue.claim(), "boom") == "queued"
+    busy = queue.claim()
+    assert busy.id == slow
+    assert queue.fail(busy, "busy", retry_after=60) == "queued"
+
+    job = queue.claim()
+    assert (job.id, job.attempts) == (job_id, 2)
+    assert queue.fail(job, "boom again") == "dead"
+    assert queue.claim() is None  # job còn lại đang chờ backoff 60s
+
+    dead = queue.stats()["dead_letters"]
+    assert [(d["id"], d["last_error"]) for d in dead] == [(job_id, "boom again")]
+    assert queue.retry_dead(job_id)
+    assert queue.claim().attempts == 1
+
+
+def test_expired_lease_on_last_attempt_is_dead_lettered(queue):
+    job_id = queue.enqueue("k", {}, max_attempts=1)
+    queue.claim(visibility_timeout=0)
+
+    assert queue.claim() is None
+    assert queue.depth() == {("k", "dead"): 1}
+    assert queue.stats()["dead_letters"][0]["id"] == job_id
+
+
+def test_worker_pool_runs_maintenance_tasks(queue, monkeypatch):
+    calls = []
+    monkeypatch.setattr(jq, "_maintenance_tasks", {"count": (3600, lambda: calls.append(1))})
+
+    async def run_pool():
+        pool = jq.JobWorkerPool(queue, concurrency=1, poll_interval=0.01)
+        await pool.start()
+        await asyncio.sleep(0.2)
+        await pool.stop()
+
+    asyncio.run(run_pool())
+    assert calls == [1]  # chạy ngay lần đầu, lần sau phải chờ hết interval
@@ -0,0 +1,51 @@
+"""/media must only expose finished files inside MEDIA_DIR."""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.media import MEDIA_DIR, MEDIA_TMP_DIR, local_media_path, media_file_path
+from app.routers import media
+
+
+@pytest.fixture
+def files():
+    MEDIA_TMP_DIR.mkdir(parents=True, exist_ok=True)
+    (MEDIA_TMP_DIR / "secret.part").write_bytes(b"in-progress upload")
+    public = MEDIA_DIR / "posts" / "photo.png"
+    public.parent.mkdir(parents=True, exist_ok=True)
+    public.write_bytes(b"0123456789")
+    yield public
+
+
+# file_path như uvicorn truyền vào sau khi decode URL đúng một lần
+# (TestClient của Starlette decode hai lần nên không tái hiện được "%252e")
+@pytest.mark.parametrize("file_path", [
+    ".tmp/secret.part",
+    "%2etmp/secret.part",
+    "posts/../.tmp/secret.part",
+    "../app.db",
+])
+def test_hidden_and_outside_paths_are_not_served(files, file_path):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(media.serve_media(file_path))
+    assert exc.value.status_code == 404
+
+
+def test_public_file_is_served_with_ranges(make_client, files):
+    client = make_client(media.router)
+
+    full = client.get("/media/posts/photo.png")
+    partial = client.get("/media/posts/photo.png", headers={"Range": "bytes=2-4"})
+
+    assert full.status_code == 200 and full.content == b"0123456789"
+    assert partial.status_code == 206 and partial.content == b"234"
+    assert partial.headers["content-range"] == "bytes 2-4/10"
+
+
+def test_resolvers_reject_hidden_entries(files):
+    # Đã decode một lần: "%2etmp" là tên file thật, không được hiểu thành ".tmp"
+    assert media_file_path("%2etmp/secret.part") != MEDIA_TMP_DIR.resolve() / "secret.part"
+    assert media_file_path(".tmp/secret.part") is None
+    assert local_media_path("/media/%2etmp/secret.part") is None
+    assert local_media_path("/media/posts/photo.png") == files.resolve()
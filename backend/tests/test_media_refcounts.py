@@ -0,0 +1,107 @@
+"""Media store references are held by the posts that use an object, never by uploads."""
+import asyncio
+
+import pytest
+
+from app.media import MEDIA_DIR, MEDIA_OBJECTS_COLLECTION, media_store
+from app.routers import posts
+from app.sql_database import db
+from scripts.gc_media import collect_garbage
+
+OWNER = {"uid": "u-owner", "email": "owner@example.com"}
+OTHER = {"uid": "u-other", "email": "other@example.com"}
+
+
+def _store(content: bytes):
+    return asyncio.run(media_store.put_bytes(content, "application/pdf", fallback_ext=".pdf"))
+
+
+def _ref_count(sha256: str) -> int:
+    return db.read(MEDIA_OBJECTS_COLLECTION, sha256, use_cache=False)["refCount"]
+
+
+def _create_post(client, url: str) -> str:
+    response = client.post("/api/posts/", json={"content": "Tài liệu", "attachments": [{"url": url}]})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def test_upload_holds_no_reference():
+    stored = _store(b"%PDF-upload")
+    again = _store(b"%PDF-upload")
+
+    assert again.deduplicated and again.sha256 == stored.sha256
+    assert _ref_count(stored.sha256) == 0
+
+
+def test_post_lifecycle_is_balanced(make_client):
+    stored = _store(b"%PDF-owner")
+    owner = make_client(posts.router, claims=OWNER)
+    other = make_client(posts.router, claims=OTHER)
+
+    _create_post(owner, stored.url)
+    assert _ref_count(stored.sha256) == 1
+
+    # Bài của người khác trỏ tới cùng URL rồi bị xoá nhiều lần: không kéo refCount của chủ về 0
+    for _ in range(3):
+        post_id = _create_post(other, stored.url)
+        assert _ref_count(stored.sha256) == 2
+        assert other.delete(f"/api/posts/{post_id}").status_code == 200
+        assert _ref_count(stored.sha256) == 1
+
+
+def test_update_moves_reference(make_client):
+    old, new = _store(b"%PDF-old"), _store(b"%PDF-new")
+    client = make_client(posts.router, claims=OWNER)
+    response = client.post("/api/posts/", json={"content": f"xem {old.url}"})
+    post_id = response.json()["id"]
+    assert _ref_count(old.sha256) == 1
+
+    assert client.put(f"/api/posts/{post_id}", json={"content": f"xem {new.url}"}).status_code == 200
+
+    assert (_ref_count(old.sha256), _ref_count(new.sha256)) == (0, 1)
+
+
+def test_gc_checks_every_collection():
+    stored = _store(b"%PDF-shared")
+    path = MEDIA_DIR / db.read(MEDIA_OBJECTS_COLLECTION, stored.sha256, use_cache=False)["path"]
+    doc_id = db.create("documents", {"title": "Đề thi", "file_url": stored.url})
+
+    stats = collect_garbage(grace=-1)
+
+    assert stats["kept"] == 1 and stats["removed"] == 0
+    assert path.is_file() and _ref_count(stored.sha256) == 1
+
+    db.delete("documents", doc_id)
+    db.update(MEDIA_OBJECTS_COLLECTION, stored.sha256, {"refCount": 0, "orphanedAt": "2000-01-01T00:00:00"})
+    assert collect_garbage(grace=-1)["removed"] == 1
+    assert not path.exists()
+
+
+def test_image_variants_job_references_variants(make_client):
+    pytest.importorskip("PIL")
+    from io import BytesIO
+
+    from PIL import Image
+
+    from app.utils.image_processing import shutdown_image_pool
+
+    buffer = BytesIO()
+    Image.new("RGB", (800, 600), "teal").save(buffer, format="PNG")
+    image = asyncio.run(media_store.put_bytes(buffer.getvalue(), "image/png"))
+    client = make_client(posts.router, claims=OWNER)
+    post_id = client.post("/api/posts/", json={"content": "Ảnh", "image_urls": [image.url, image.url]}).json()["id"]
+
+    try:
+        asyncio.run(posts._run_image_variants_job({"post_id": post_id}))
+        asyncio.run(posts._run_image_variants_job({"post_id": post_id}))  # retry: không cộng thêm
+    finally:
+        shutdown_image_pool()
+
+    variants = db.read("posts", post_id, use_cache=False)["image_variants"][0]["variants"]
+    assert [v["width"] for v in variants] == [320, 640]
+    assert all(_ref_count(media_store.sha_from_url(v["url"])) == 1 for v in variants)
+
+    assert client.delete(f"/api/posts/{post_id}").status_code == 200
+    assert _ref_count(image.sha256) == 0
+    assert all(_ref_count(media_store.sha_from_url(v["url"])) == 0 for v in variants)
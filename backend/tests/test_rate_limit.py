@@ -0,0 +1,168 @@
+"""Sliding-window rate limiting: window math, shared SQLite store, middleware behaviour."""
+import asyncio
+import threading
+
+import pytest
+
+from app.middleware.rate_limit import MemoryRateLimitStore, RateLimitMiddleware, RouteGroup, SQLiteRateLimitStore
+
+LIMITS = [(60, 5)]
+T0 = 6000.0  # bắt đầu một cửa sổ 60s
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryRateLimitStore()
+    return SQLiteRateLimitStore(str(tmp_path / "rate_limit.db"))
+
+
+def test_limit_and_retry_after(store):
+    results = [store.hit("ip:1", LIMITS, T0 + i) for i in range(6)]
+
+    assert [r.allowed for r in results] == [True] * 5 + [False]
+    assert [r.remaining[60] for r in results[:5]] == [4, 3, 2, 1, 0]
+    assert results[5].exceeded_window == 60
+    # Chỉ có cửa sổ hiện tại: phải chờ tới khi nó kết thúc
+    assert results[5].retry_after == pytest.approx(60 - 5)
+
+
+def test_previous_window_is_weighted(store):
+    for i in range(5):
+        store.hit("ip:1", LIMITS, T0 + i)
+
+    # 15s vào cửa sổ sau: ước lượng = 5 * 0.75 = 3.75 → còn chỗ cho đúng 1 request
+    assert store.hit("ip:1", LIMITS, T0 + 75).allowed
+    rejected = store.hit("ip:1", LIMITS, T0 + 75)
+    assert not rejected.allowed
+    # Cần ước lượng + 1 <= 5: 5 * (1 - t/60) + 1 + 1 <= 5 → t >= 24s
+    assert rejected.retry_after == pytest.approx(24 - 15)
+
+
+def test_windows_expire_and_costs_count(store):
+    assert not store.hit("ip:1", LIMITS, T0, cost=6).allowed
+    assert store.hit("ip:1", LIMITS, T0, cost=5).allowed
+    assert not store.hit("ip:1", LIMITS, T0 + 1).allowed
+    assert store.hit("ip:2", LIMITS, T0 + 1).allowed  # client khác
+    assert store.hit("ip:1", LIMITS, T0 + 120).allowed  # cả hai cửa sổ đã hết
+
+
+def test_sqlite_store_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "rate_limit.db")
+    worker_a, worker_b = SQLiteRateLimitStore(path), SQLiteRateLimitStore(path)
+
+    for i in range(3):
+        assert worker_a.hit("uid:x", LIMITS, T0 + i).allowed
+    assert [worker_b.hit("uid:x", LIMITS, T0 + 3 + i).allowed for i in range(3)] == [True, True, False]
+
+
+class _RecordingStore(MemoryRateLimitStore):
+    blocking = True
+
+    def __init__(self):
+        super().__init__()
+        self.threads = []
+
+    def hit(self, *args, **kwargs):
+        self.threads.append(threading.get_ident())
+        return super().hit(*args, **kwargs)
+
+
+def _run(middleware, path="/api/posts", headers=()):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "method": "GET", "path": path, "headers": list(headers),
+        "client": ("10.0.0.1", 1234), "query_string": b"",
+    }
+    asyncio.run(middleware(scope, receive, send))
+    return sent[0]["status"]
+
+
+async def _ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def test_blocking_store_runs_off_the_event_loop():
+    store = _RecordingStore()
+    groups = [RouteGroup(name="read", per_minute=2, per_hour=100)]
+    middleware = RateLimitMiddleware(_ok_app, store=store, route_groups=groups)
+
+    assert [_run(middleware) for _ in range(3)] == [200, 200, 429]
+    assert store.threads and threading.get_ident() not in store.threads
+
+
+@pytest.fixture
+def verifications(monkeypatch):
+    """Đếm số lần verify chữ ký thật; token "good-*" hợp lệ, còn lại bị từ chối."""
+    from collections import OrderedDict
+
+    from app import auth
+
+    calls = []
+
+    def fake_verify(token):
+        calls.append(token)
+        if not token.startswith("good-"):
+            raise ValueError("invalid token")
+        return {"uid": token[5:], "exp": 4102444800}
+
+    monkeypatch.setattr(auth, "_token_cache", OrderedDict())
+    monkeypatch.setattr(auth, "verify_token", fake_verify)
+    return calls
+
+
+def _bearer(token):
+    return [(b"authorization", f"Bearer {token}".encode())]
+
+
+def _auth_middleware(app=_ok_app):
+    return RateLimitMiddleware(
+        app,
+        store=MemoryRateLimitStore(),
+        route_groups=[RouteGroup(name="read", per_minute=100, per_hour=1000)],
+        auth_group=RouteGroup(name="auth", per_minute=3, per_hour=100),
+    )
+
+
+def test_random_tokens_are_throttled_before_verification(verifications):
+    middleware = _auth_middleware()
+
+    statuses = [_run(middleware, headers=_bearer(f"junk-{i}")) for i in range(5)]
+
+    assert statuses == [200, 200, 200, 429, 429]
+    assert len(verifications) == 3
+
+
+def test_cached_tokens_skip_the_auth_budget(verifications):
+    middleware = _auth_middleware()
+
+    assert [_run(middleware, headers=_bearer("good-alice")) for _ in range(5)] == [200] * 5
+    assert verifications == ["good-alice"]
+
+
+def test_invalid_token_is_verified_once_per_request(verifications):
+    from fastapi import HTTPException
+    from starlette.requests import Request
+
+    from app.auth import get_current_user
+
+    outcome = {}
+
+    async def app(scope, receive, send):
+        try:
+            await get_current_user(Request(scope), authorization="Bearer junk")
+        except HTTPException as e:
+            outcome["status"] = e.status_code
+        await _ok_app(scope, receive, send)
+
+    assert _run(_auth_middleware(app), headers=_bearer("junk")) == 200
+    assert outcome["status"] == 401
+    assert verifications == ["junk"]
@@ -0,0 +1,30 @@
+"""Slow-query timing: failed statements must not skew later measurements."""
+import time
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import StaticPool
+
+from app.utils.slow_query_log import SlowQueryLog, install_query_instrumentation
+
+
+def test_failed_statement_does_not_leak_its_start_time():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    log = SlowQueryLog(threshold_ms=50)
+    install_query_instrumentation(engine, log)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _slow_failure(conn, cursor, statement, parameters, context, executemany):
+        if "missing_table" in statement:
+            time.sleep(0.1)
+
+    with engine.connect() as conn:
+        with pytest.raises(Exception):
+            conn.execute(text("SELECT * FROM missing_table"))
+        for _ in range(3):
+            conn.execute(text("SELECT 1"))
+        assert not conn.info.get("query_start_time")
+
+    # Lần chạy lỗi không được ghép với các lệnh sau: không lệnh nào bị tính là chậm
+    assert log.total_statements == 3
+    assert log.total_slow == 0
@@ -0,0 +1,13 @@
+"""The basic SQLDatabase fallback accepts the keywords callers pass to the enhanced one."""
+from app.sql_database import SQLDatabase
+from app.utils.doc_compression import document_codec
+
+
+def test_fallback_accepts_use_cache(monkeypatch):
+    # SQLDatabase() gắn dictionary_loader của nó vào codec dùng chung: khôi phục sau test
+    monkeypatch.setattr(document_codec, "dictionary_loader", document_codec.dictionary_loader)
+    fallback = SQLDatabase()
+    doc_id = fallback.create("media_objects", {"refCount": 1})
+
+    assert fallback.read("media_objects", doc_id, use_cache=False)["refCount"] == 1
+    assert [d["id"] for d in fallback.query("media_objects", limit=10, use_cache=False)] == [doc_id]
@@ -0,0 +1,110 @@
+"""Typed tables: dual-write parity, backfill, verify/repair and mode routing."""
+import json
+
+import pytest
+from sqlalchemy import select
+
+from app.sql_database_enhanced import CollectionDocument, TypedPost, db
+
+
+def _post(i, **extra):
+    return {
+        "author_id": f"u{i % 2}",
+        "subject": "math",
+        "status": "approved",
+        "likes": i,
+        "comments": 0,
+        "content": f"Bài số {i}",
+        "createdAt": f"2026-01-0{i + 1}T00:00:00",
+        **extra,
+    }
+
+
+def _rows(model, collection="posts"):
+    with db._get_session() as session:
+        stmt = select(model)
+        if model is CollectionDocument:
+            stmt = stmt.where(CollectionDocument.collection == collection)
+        return {row.id: row for row in session.scalars(stmt).all()}
+
+
+def _clean(report):
+    return (report["missing"], report["mismatched"], report["extra"]) == (0, 0, 0)
+
+
+def test_dual_write_keeps_both_copies_identical():
+    db.set_typed_mode("posts", "dual_write")
+    ids = [db.create("posts", _post(i)) for i in range(3)]
+    db.update("posts", ids[0], {"likes": 10, "status": "rejected"})
+    db.delete("posts", ids[2])
+
+    generic, typed = _rows(CollectionDocument), _rows(TypedPost)
+    assert set(generic) == set(typed) == set(ids[:2])
+    for doc_id, row in typed.items():
+        assert json.loads(row.data) == json.loads(generic[doc_id].data)
+    assert (typed[ids[0]].likes, typed[ids[0]].status, typed[ids[0]].author_id) == (10, "rejected", "u0")
+    assert _clean(db.verify_typed("posts"))
+
+
+def test_typed_reads_match_generic_reads():
+    db.set_typed_mode("posts", "dual_write")
+    for i in range(4):
+        db.create("posts", _post(i, status="rejected" if i == 3 else "approved"))
+    db.create("posts", {k: v for k, v in _post(4).items() if k != "status"})
+
+    def ids(filters):
+        return [p["id"] for p in db.query("posts", filters=filters, order_by="createdAt", use_cache=False)]
+
+    def snapshot():
+        return (
+            ids(None),
+            ids([("likes", ">=", 2)]),
+            ids([("status", "==", "approved"), ("author_id", "==", "u0")]),
+            ids([("status", "!=", "rejected")]),
+            db.count("posts", [("likes", "<", 3)]),
+        )
+
+    generic = snapshot()
+    db.set_typed_mode("posts", "typed")
+    assert snapshot() == generic
+    assert [len(r) for r in generic[:4]] == [5, 3, 2, 4] and generic[4] == 3
+
+
+def test_backfill_copies_generic_rows_once():
+    ids = [db.create("posts", _post(i)) for i in range(4)]
+    assert _rows(TypedPost) == {}
+
+    db.set_typed_mode("posts", "dual_write")
+    assert db.backfill_typed("posts", batch_size=3) == (4, 4)
+    assert db.backfill_typed("posts", batch_size=3) == (4, 0)
+
+    typed = _rows(TypedPost)
+    assert set(typed) == set(ids)
+    assert [typed[i].likes for i in ids] == [0, 1, 2, 3]
+    assert _clean(db.verify_typed("posts"))
+
+
+def test_verify_reports_and_repairs_drift():
+    db.set_typed_mode("posts", "dual_write")
+    ids = [db.create("posts", _post(i)) for i in range(3)]
+    with db._get_session() as session:
+        session.get(TypedPost, ids[0]).status = "pending"  # cột promoted lệch
+        session.delete(session.get(TypedPost, ids[1]))
+        session.add(TypedPost(id="ghost", data="{}"))
+        session.commit()
+
+    report = db.verify_typed("posts")
+    assert (report["missing"], report["mismatched"], report["extra"]) == (1, 1, 1)
+    assert db.verify_typed("posts", repair=True)["repaired"] == 3
+    assert _clean(db.verify_typed("posts"))
+    assert _rows(TypedPost)[ids[0]].status == "approved"
+
+
+def test_typed_only_stops_generic_writes():
+    db.set_typed_mode("posts", "typed_only")
+    doc_id = db.create("posts", _post(0))
+
+    assert _rows(CollectionDocument) == {}
+    assert db.read("posts", doc_id, use_cache=False)["likes"] == 0
+    with pytest.raises(ValueError):
+        db.set_typed_mode("posts", "bogus")
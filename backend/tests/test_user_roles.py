@@ -0,0 +1,90 @@
+"""Roles come from the users table, so users must not be able to grant themselves one."""
+import asyncio
+import threading
+
+from app import user_context
+from app.routers import admin, users
+from app.sql_database import db
+
+STUDENT = {"uid": "u-student", "email": "student@example.com", "name": "Student"}
+ADMIN = {"uid": "u-admin", "email": "admin@example.com", "name": "Admin"}
+
+
+def _seed_admin():
+    db.create("users", {"uid": ADMIN["uid"], "email": ADMIN["email"], "role": "admin"}, doc_id=ADMIN["uid"])
+
+
+def test_create_user_ignores_requested_role(make_client):
+    client = make_client(users.router, admin.router, claims=STUDENT)
+
+    response = client.post("/api/users/", json={"uid": STUDENT["uid"], "email": STUDENT["email"], "role": "admin"})
+
+    assert response.status_code == 200
+    assert response.json()["role"] == "student"
+    assert db.read("users", STUDENT["uid"], use_cache=False)["role"] == "student"
+    assert client.get("/api/admin/stats").status_code == 403
+
+
+def test_update_me_cannot_raise_role(make_client):
+    client = make_client(users.router, claims=STUDENT)
+    client.get("/api/users/me")
+
+    for role in ("teacher", "admin"):
+        response = client.put("/api/users/me", json={"role": role})
+        assert response.status_code == 403
+    assert db.read("users", STUDENT["uid"], use_cache=False)["role"] == "student"
+
+
+def test_update_me_creating_profile_is_student(make_client):
+    client = make_client(users.router, claims=STUDENT)
+
+    assert client.put("/api/users/me", json={"role": "teacher"}).status_code == 403
+    response = client.put("/api/users/me", json={"name": "New name"})
+
+    assert response.status_code == 200
+    assert response.json()["role"] == "student"
+
+
+def test_update_me_keeps_current_role_and_other_fields(make_client):
+    db.create("users", {"uid": STUDENT["uid"], "email": STUDENT["email"], "role": "teacher"}, doc_id=STUDENT["uid"])
+    client = make_client(users.router, claims=STUDENT)
+
+    response = client.put("/api/users/me", json={"role": "teacher", "name": "Cô giáo"})
+
+    assert response.status_code == 200
+    assert response.json()["role"] == "teacher"
+    assert response.json()["name"] == "Cô giáo"
+
+
+def test_only_admin_changes_roles(make_client):
+    _seed_admin()
+    student = make_client(users.router, claims=STUDENT)
+    student.get("/api/users/me")
+
+    assert student.put(f"/api/users/{STUDENT['uid']}/role", json={"role": "teacher"}).status_code == 403
+
+    admin_client = make_client(users.router, claims=ADMIN)
+    response = admin_client.put(f"/api/users/{STUDENT['uid']}/role", json={"role": "teacher"})
+
+    assert response.status_code == 200
+    assert db.read("users", STUDENT["uid"], use_cache=False)["role"] == "teacher"
+
+
+def test_profile_is_loaded_off_the_event_loop(monkeypatch):
+    threads = []
+    real_read = user_context.db.read
+
+    def recording_read(*args, **kwargs):
+        threads.append(threading.get_ident())
+        return real_read(*args, **kwargs)
+
+    monkeypatch.setattr(user_context.db, "read", recording_read)
+
+    async def resolve():
+        return await user_context.get_current_user_context({"uid": "loop-user"}), threading.get_ident()
+
+    for _ in range(2):
+        user, loop_thread = asyncio.run(resolve())
+        assert user["role"] == "student"
+    # Lần 2 trúng cache: chỉ một lần đọc DB, và không ở thread của event loop
+    assert len(threads) == 1 and threads[0] != loop_thread